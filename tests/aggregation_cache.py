@@ -0,0 +1,367 @@
+import argparse
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import REGISTRY, InstrumentedSession
+from load_generator import INGEST_PATH, SIMULATION_FILE, load_targets, random_reading
+from token_manager import BASE_URL_USUARIOS, TokenManager
+
+# Client-side cache for the aggregated readings history.
+# GET /api/v1/leituras-sensores?agruparMinutos=N re-runs the DATEADD/DATEDIFF
+# GROUP BY over the raw rows on every dashboard refresh. A bucket that ended
+# more than `grace` ago can no longer change (short of a late reading), so
+# AggregationCache keeps each closed bucket (AVG humidity/temperature, SUM
+# precipitation for one IdTalhao and N) in an LRU+TTL store. A query is then
+# split per bucket: closed buckets fully inside the range come from the cache,
+# and only the missing ones plus the still-open tail and the partial edge
+# buckets are fetched, merged into as few range requests as possible.
+# Buckets with no readings are cached as empty.
+
+BASE_URL_INGESTAO = "http://localhost:30003"
+# Buckets are aligned like DATEADD(minute, DATEDIFF(minute, 0, ts) / N * N, 0)
+SQL_EPOCH = datetime.datetime(1900, 1, 1)
+DEFAULT_MAX_ENTRIES = 100000
+# Expiry bounds how long a late reading can stay invisible in a cached bucket
+DEFAULT_TTL_SECONDS = 3600
+# A bucket counts as closed once it ended this long ago (capture-to-ingest delay)
+DEFAULT_GRACE_SECONDS = 120
+REQUEST_TIMEOUT_SECONDS = 30
+# Default dashboard panels: (range hours, agruparMinutos)
+DEFAULT_PANELS = "6:5,24:15,168:60"
+
+
+def parse_utc(value):
+    ts = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def format_utc(ts):
+    return ts.isoformat() + "Z"
+
+
+def _micros(ts):
+    return (ts - SQL_EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def bucket_of(ts, minutos):
+    # Start of the N-minute bucket holding `ts`, in minutes since 1900-01-01
+    return _micros(ts) // 60000000 // minutos * minutos
+
+
+def minute_to_utc(minute):
+    return SQL_EPOCH + datetime.timedelta(minutes=minute)
+
+
+class LruTtlCache:
+    """Bounded mapping with least-recently-used eviction and per-entry expiry."""
+
+    _MISSING = object()
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            if entry is self._MISSING:
+                return default
+            value, expires = entry
+            if expires <= self.clock():
+                del self._data[key]
+                self.expirations += 1
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self.clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return self.get(key, self._MISSING) is not self._MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class AggregationCache:
+    """Serves GET leituras-sensores?agruparMinutos=N from cached closed buckets.
+
+    `auth` is the Authorization header value or a callable returning it, as in
+    IngestClient. query() returns the same rows as the API for the same
+    arguments, in the same order.
+    """
+
+    _EMPTY = "empty"
+
+    def __init__(self, base_url, auth, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS,
+                 grace=DEFAULT_GRACE_SECONDS, now=datetime.datetime.utcnow, clock=time.monotonic):
+        self.base_url = base_url.rstrip("/")
+        self._auth = auth
+        self.grace = datetime.timedelta(seconds=grace)
+        self.now = now
+        self.store = LruTtlCache(max_entries, ttl, clock)
+        self._session = InstrumentedSession()
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "hits": 0, "misses": 0, "uncacheable": 0, "apiCalls": 0, "rowsFetched": 0}
+
+    def _headers(self):
+        auth = self._auth() if callable(self._auth) else self._auth
+        return {"Authorization": auth}
+
+    def fetch(self, id_talhao, de, ate, minutos=None):
+        # One uncached API call; raises requests.HTTPError on a non-200 answer
+        params = {"idTalhao": id_talhao, "deUtc": format_utc(de), "ateUtc": format_utc(ate)}
+        if minutos:
+            params["agruparMinutos"] = minutos
+        resp = self._session.get(f"{self.base_url}{INGEST_PATH}", params=params, headers=self._headers(),
+                                 timeout=REQUEST_TIMEOUT_SECONDS)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _count(self, key, n=1):
+        self.stats[key] += n
+        if n:
+            REGISTRY.counter("aggregation_cache_buckets", result=key).inc(n)
+
+    def query(self, id_talhao, de, ate, minutos):
+        if minutos <= 0 or ate <= de:
+            # nothing to split: the API decides (raw rows, or its 400)
+            return self.fetch(id_talhao, de, ate, minutos)
+        id_talhao = id_talhao.lower()
+        # bucket starts and the range ends in minutes since 1900, compared exactly in microseconds
+        de_us, ate_us = _micros(de), _micros(ate)
+        closed_us = _micros(self.now() - self.grace)
+        starts = range(bucket_of(de, minutos), bucket_of(ate - datetime.timedelta(microseconds=1), minutos) + 1, minutos)
+        values = {}
+        fetch = []
+        for start in starts:
+            end_us = (start + minutos) * 60000000
+            cacheable = start * 60000000 >= de_us and end_us <= min(ate_us, closed_us)
+            value = self.store.get((id_talhao, minutos, start)) if cacheable else None
+            with self._lock:
+                if value is not None:
+                    self._count("hits")
+                    values[start] = value
+                    continue
+                self._count("misses" if cacheable else "uncacheable")
+            fetch.append((start, cacheable))
+
+        # Consecutive missing buckets become one request, clipped to [de, ate)
+        runs = []
+        for start, cacheable in fetch:
+            if runs and runs[-1][1] == start:
+                runs[-1][1] = start + minutos
+                runs[-1][2].append((start, cacheable))
+            else:
+                runs.append([start, start + minutos, [(start, cacheable)]])
+        for run_start, run_end, buckets in runs:
+            lo = max(de, minute_to_utc(run_start))
+            hi = min(ate, minute_to_utc(run_end))
+            rows = self.fetch(id_talhao, lo, hi, minutos)
+            with self._lock:
+                self.stats["apiCalls"] += 1
+                self.stats["rowsFetched"] += len(rows)
+            got = {bucket_of(parse_utc(r["dataHoraCapturaUtc"]), minutos): r for r in rows}
+            for start, cacheable in buckets:
+                values[start] = got.get(start, self._EMPTY)
+                if cacheable:
+                    self.store.put((id_talhao, minutos, start), values[start])
+
+        with self._lock:
+            self.stats["queries"] += 1
+        return [values[s] for s in starts if values.get(s, self._EMPTY) is not self._EMPTY]
+
+    def hit_ratio(self):
+        # share of closed buckets served from the cache
+        looked_up = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / looked_up if looked_up else None
+
+    def report(self):
+        return dict(self.stats, hitRatio=self.hit_ratio(), entries=len(self.store),
+                    evictions=self.store.evictions, expirations=self.store.expirations)
+
+    def close(self):
+        self._session.close()
+
+
+def parse_panels(text):
+    # "6:5,24:15" -> [(timedelta(hours=6), 5), (timedelta(hours=24), 15)]
+    panels = []
+    for item in text.split(","):
+        hours, _, minutos = item.strip().partition(":")
+        panels.append((datetime.timedelta(hours=float(hours)), int(minutos)))
+    return panels
+
+
+def seed_history(base_url, auth, prop_id, talhao_id, hours, every_seconds, rnd):
+    # Readings every `every_seconds` over the last `hours`, through the fake stack's bulk route
+    from ingest_client import IngestClient
+    now = datetime.datetime.utcnow()
+    count = int(hours * 3600 // every_seconds)
+    readings = []
+    for i in range(count):
+        reading = random_reading(prop_id, talhao_id, rnd)
+        reading["dataHoraCapturaUtc"] = format_utc(now - datetime.timedelta(seconds=every_seconds * (count - i)))
+        readings.append(reading)
+    client = IngestClient(base_url, auth, mode="batch")
+    try:
+        for i in range(0, len(readings), 500):
+            client.submit(readings[i:i + 500])
+    finally:
+        client.close()
+    return count
+
+
+def run_dashboard(cache, talhao_id, panels, rounds, interval, verify, on_round=None):
+    # Every round refreshes every panel through the cache (and directly, to compare)
+    timings = {"cached": [], "direct": []}
+    mismatches = 0
+    for r in range(rounds):
+        if on_round:
+            on_round(r)
+        now = datetime.datetime.utcnow()
+        for span, minutos in panels:
+            started = time.perf_counter()
+            cached = cache.query(talhao_id, now - span, now, minutos)
+            timings["cached"].append(time.perf_counter() - started)
+            if verify:
+                started = time.perf_counter()
+                direct = cache.fetch(talhao_id, now - span, now, minutos)
+                timings["direct"].append(time.perf_counter() - started)
+                if cached != direct:
+                    mismatches += 1
+                    print(f"❌ Round {r}: {span} / {minutos}min differs from the API ({len(cached)} vs {len(direct)} rows)")
+        if r + 1 < rounds:
+            time.sleep(interval)
+    return timings, mismatches
+
+
+def print_report(report, timings):
+    print(f"\nQueries {report['queries']} | API calls {report['apiCalls']} | Rows fetched {report['rowsFetched']}")
+    ratio = "-" if report["hitRatio"] is None else f"{report['hitRatio']:.1%}"
+    print(f"Closed buckets: {report['hits']} hits / {report['misses']} misses (hit ratio {ratio}); "
+          f"{report['uncacheable']} open/edge buckets always fetched")
+    print(f"Cache entries {report['entries']} | Evictions {report['evictions']} | Expired {report['expirations']}")
+    for name, samples in timings.items():
+        if samples:
+            samples = sorted(samples)
+            print(f"{name:<8} mean {sum(samples) / len(samples) * 1000:8.2f} ms   "
+                  f"p95 {samples[int(0.95 * (len(samples) - 1))] * 1000:8.2f} ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dashboard-style queries through the aggregation cache.")
+    parser.add_argument("--base-url", default=BASE_URL_INGESTAO)
+    parser.add_argument("--usuarios-url", default=BASE_URL_USUARIOS)
+    parser.add_argument("--simulation-file", default=SIMULATION_FILE, help="Output of data_seeder.py (first user is used)")
+    parser.add_argument("--talhao", help="IdTalhao to query (default: the first user's first talhao)")
+    parser.add_argument("--panels", default=DEFAULT_PANELS, help="Comma-separated rangeHours:agruparMinutos")
+    parser.add_argument("--rounds", type=int, default=10, help="Dashboard refreshes")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between refreshes")
+    parser.add_argument("--max-entries", type=int, default=DEFAULT_MAX_ENTRIES)
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL_SECONDS)
+    parser.add_argument("--grace", type=float, default=DEFAULT_GRACE_SECONDS)
+    parser.add_argument("--no-verify", action="store_true", help="Skip the direct API comparison")
+    parser.add_argument("--local", action="store_true", help="Run against the in-process fake stack")
+    parser.add_argument("--history-hours", type=float, default=168, help="Local: hours of readings to seed")
+    parser.add_argument("--every-seconds", type=float, default=60, help="Local: seconds between seeded readings")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="JSON results file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rnd = random.Random(args.seed)
+    stack = None
+    tokens = None
+    live = None
+    on_round = None
+    if args.local:
+        from fake_stack import FakeStack
+        from ingest_client import IngestClient
+        from pipeline_benchmark import setup_tenant
+        stack = FakeStack(batch_endpoint=True).start()
+        base_url = stack.url("ingestao")
+        headers, prop_id, talhao_id = setup_tenant(requests.Session(), stack.urls)
+        auth = headers["Authorization"]
+        n = seed_history(base_url, auth, prop_id, talhao_id, args.history_hours, args.every_seconds, rnd)
+        print(f"Seeded {n} readings over {args.history_hours}h for talhao {talhao_id}")
+        live = IngestClient(base_url, auth, mode="single")
+        # new readings keep arriving between refreshes, so the open tail changes
+        on_round = lambda r: live.submit([random_reading(prop_id, talhao_id, rnd)]) if r else None
+    else:
+        base_url = args.base_url
+        try:
+            targets = load_targets(args.simulation_file)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not read {args.simulation_file}: {e}")
+            sys.exit(1)
+        if not targets:
+            print(f"❌ No talhoes in {args.simulation_file}. Run data_seeder.py first.")
+            sys.exit(1)
+        email = targets[0][0]
+        talhao_id = args.talhao or targets[0][2]
+        tokens = TokenManager(args.usuarios_url)
+        tokens.load_simulation_data(args.simulation_file)
+        tokens.start()
+        auth = lambda: tokens.headers(email)["Authorization"]
+
+    cache = AggregationCache(base_url, auth, args.max_entries, args.ttl, args.grace)
+    try:
+        timings, mismatches = run_dashboard(cache, talhao_id, parse_panels(args.panels), args.rounds, args.interval,
+                                            not args.no_verify, on_round)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Query failed: {e}")
+        sys.exit(1)
+    finally:
+        cache.close()
+        if live:
+            live.close()
+        if tokens:
+            tokens.close()
+        if stack:
+            stack.stop()
+
+    report = cache.report()
+    print_report(report, timings)
+    if mismatches:
+        print(f"❌ {mismatches} cached answers differed from the API")
+    elif not args.no_verify:
+        print("✅ Every cached answer matched the API")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "cache": report, "mismatches": mismatches}, f, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import db_access
+
+# Offline replay of MotorDeAlertas over historical readings.
+# Readings from a SensorLeitura export (CSV or columnar_export.py) or straight
+# from the database are loaded into NumPy columns, and every rule is evaluated for all readings at
+# once. The threshold rules are plain masks. The "Risco de Seca" rule uses a
+# rolling 24h window per IdTalhao: searchsorted finds where each window starts,
+# and cumulative sums count the readings and the readings at or above the limit
+# inside it. The 24h de-duplication is then one searchsorted jump per fired
+# alert. Months of readings replay in seconds, so threshold changes can be
+# compared against the current rules without going through RabbitMQ.
+#
+# The live service evaluates the windows against GETUTCDATE() when it processes
+# each message. The replay assumes every reading is processed at its capture
+# time, in (DataHoraCapturaUtc, Id) order within each talhao.
+#
+# `python alert_replay.py --self-check` compares replay() with a plain
+# per-reading loop (fake_stack.avaliar_leitura plus the drought rule) on
+# randomised readings.
+
+DB_INGESTAO = "Ingestao"
+TABLE = "SensorLeitura"
+MICROS_PER_HOUR = 3600 * 1000000
+
+Rules = namedtuple("Rules", "temp_critical frost humidity_extreme drought_humidity drought_min_readings drought_window_hours")
+DEFAULT_RULES = Rules(temp_critical=35.0, frost=0.0, humidity_extreme=20.0, drought_humidity=30.0,
+                      drought_min_readings=10, drought_window_hours=24.0)
+
+# Rule codes in the order AvaliarLeituraAsync adds them; messages are the ones the service stores
+RULES = (
+    ("temperatura_critica", "Temperatura Crítica (> 35°C)", "Critical"),
+    ("geada", "Risco de Geada (< 0°C)", "Warning"),
+    ("seca_extrema", "Seca Extrema (Umidade < 20%)", "Critical"),
+    ("risco_de_seca", "Risco de Seca: Umidade abaixo de 30% por 24h", "Warning"),
+)
+TEMP_CRITICAL, FROST, HUMIDITY_EXTREME, DROUGHT = range(len(RULES))
+
+COLUMNS = ("Id", "IdTalhao", "DataHoraCapturaUtc", "TemperaturaCelsius", "UmidadeSoloPercentual")
+
+
+def to_micros(values):
+    # ISO-8601 strings (sqlcmd/.NET style, trailing Z allowed) -> int64 microseconds since the epoch
+    text = np.char.rstrip(np.asarray(values, dtype=str), "Z")
+    return text.astype("datetime64[us]").astype(np.int64)
+
+
+def to_float(values):
+    # NULL / empty -> NaN, so comparisons behave like C# lifted operators (always false)
+    return np.array([np.nan if v in (None, "", "NULL") else float(v) for v in values], dtype=np.float64)
+
+
+class Readings:
+    """Columnar readings: one NumPy array per column.
+
+    IdTalhao is dictionary-encoded: `talhao` holds an int32 code per reading
+    and `talhoes` maps each code back to the GUID string.
+    """
+
+    def __init__(self, ids, talhao, talhoes, ts, temperatura, umidade):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.talhao = np.asarray(talhao, dtype=np.int32)
+        self.talhoes = np.asarray(talhoes, dtype=object)
+        self.ts = np.asarray(ts, dtype=np.int64)
+        self.temperatura = np.asarray(temperatura, dtype=np.float64)
+        self.umidade = np.asarray(umidade, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_columns(cls, ids, talhoes, timestamps, temperatura, umidade):
+        # talhoes/timestamps as strings; temperatura/umidade may contain None/"NULL"
+        talhao_names, talhao = np.unique(np.asarray(talhoes, dtype=str), return_inverse=True)
+        return cls(np.asarray(ids, dtype=np.int64), talhao, talhao_names.astype(object), to_micros(timestamps),
+                   to_float(temperatura), to_float(umidade))
+
+    def select(self, mask):
+        return Readings(self.ids[mask], self.talhao[mask], self.talhoes, self.ts[mask],
+                        self.temperatura[mask], self.umidade[mask])
+
+    def for_talhao(self, id_talhao):
+        codes = np.flatnonzero(self.talhoes == id_talhao.lower())
+        return self.select(np.isin(self.talhao, codes))
+
+
+def load_csv(path):
+    # Export with a header row naming the SensorLeitura columns (any case, any extra columns)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader)]
+        try:
+            positions = [header.index(c.lower()) for c in COLUMNS]
+        except ValueError:
+            raise ValueError(f"{path}: header must contain {', '.join(COLUMNS)}")
+        rows = [[row[p] for p in positions] for row in reader if row]
+    if not rows:
+        return Readings.from_columns([], [], [], [], [])
+    ids, talhoes, timestamps, temperatura, umidade = zip(*rows)
+    return Readings.from_columns(ids, [t.lower() for t in talhoes], timestamps, temperatura, umidade)
+
+
+def load_db(database=DB_INGESTAO, table=TABLE, where=None, run_sql_query=db_access.run_sql_query):
+    # One query through db_access; CONVERT 126 keeps each timestamp a single space-free token
+    sql = (f"SET NOCOUNT ON; SELECT Id, LOWER(CONVERT(varchar(36), IdTalhao)), CONVERT(varchar(33), DataHoraCapturaUtc, 126), "
+           f"TemperaturaCelsius, UmidadeSoloPercentual FROM {table}")
+    if where:
+        sql += f" WHERE {where}"
+    output = run_sql_query(sql, database)
+    if output is None:
+        raise RuntimeError(f"Query on {database}.{table} failed")
+    rows = [line.split() for line in output.splitlines()]
+    rows = [r for r in rows if len(r) == len(COLUMNS)]
+    if not rows:
+        return Readings.from_columns([], [], [], [], [])
+    return Readings.from_columns(*zip(*rows))
+
+
+class ReplayResult:
+    """Alerts that would have fired, as parallel arrays.
+
+    `reading` indexes into the replayed Readings and `rule` is a RULES code;
+    alerts are in processing order, then rule order within one reading.
+    """
+
+    def __init__(self, readings, reading, rule, rules):
+        self.readings = readings
+        self.reading = reading
+        self.rule = rule
+        self.rules = rules
+
+    def __len__(self):
+        return len(self.reading)
+
+    def count_by_rule(self):
+        counts = np.bincount(self.rule, minlength=len(RULES))
+        return {name: int(c) for (name, _, _), c in zip(RULES, counts)}
+
+    def count_by_talhao(self):
+        codes = self.readings.talhao[self.reading]
+        counts = np.zeros((len(self.readings.talhoes), len(RULES)), dtype=np.int64)
+        np.add.at(counts, (codes, self.rule), 1)
+        return {self.readings.talhoes[c]: {name: int(n) for (name, _, _), n in zip(RULES, counts[c]) if n}
+                for c in np.flatnonzero(counts.sum(axis=1))}
+
+    def records(self):
+        # Alerta rows; leituraId is the source reading (the live consumer always stores 0)
+        r = self.readings
+        stamps = r.ts[self.reading].astype("datetime64[us]").astype(str)
+        for i, code, stamp in zip(self.reading, self.rule, stamps):
+            _, mensagem, nivel = RULES[code]
+            yield {"idTalhao": r.talhoes[r.talhao[i]], "mensagem": mensagem, "nivel": nivel,
+                   "dataHoraGeracaoUtc": stamp, "leituraId": int(r.ids[i])}
+
+
+def drought_candidates(talhao, ts, umidade, rules=DEFAULT_RULES):
+    """Rolling-window part of the drought rule over readings sorted by (talhao, ts).
+
+    Returns (candidate mask, window keys, window length). Reading i is a
+    candidate when it has a humidity value, its window [ts - 24h, ts] within the
+    talhao holds at least drought_min_readings readings processed so far, and
+    all of them are below drought_humidity.
+    """
+    n = len(ts)
+    window = int(rules.drought_window_hours * MICROS_PER_HOUR)
+    if n == 0:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64), window
+    # One sorted key over all talhoes: each talhao gets its own range, spaced more than a window apart,
+    # so a single searchsorted finds every window start without crossing into the previous talhao
+    rel = ts - ts.min()
+    stride = int(rel.max()) + window + 1
+    if (int(talhao.max()) + 1) * stride >= 2 ** 62:
+        raise ValueError("Time span x talhoes too large for int64 window keys; replay fewer talhoes at a time")
+    key = rel + talhao.astype(np.int64) * stride
+    start = np.searchsorted(key, key - window, side="left")
+    index = np.arange(n)
+    # NaN humidity fails "< limit", like a null in All(l => l.UmidadeSoloPercentual < 30)
+    breaks = np.concatenate(([0], np.cumsum(~(umidade < rules.drought_humidity))))
+    in_window = index - start + 1
+    candidate = ~np.isnan(umidade) & (in_window >= rules.drought_min_readings) & (breaks[index + 1] == breaks[start])
+    return candidate, key, window
+
+
+def dedup(keys, window):
+    # ExisteAlertaRecenteAsync: after an alert at t, the next can only fire once t' - 24h > t.
+    # Greedy over sorted candidate keys; one jump per alert fired.
+    fired = []
+    i, n = 0, len(keys)
+    while i < n:
+        fired.append(i)
+        i = int(np.searchsorted(keys, keys[i] + window, side="right"))
+    return np.asarray(fired, dtype=np.int64)
+
+
+def replay(readings, rules=DEFAULT_RULES):
+    order = np.lexsort((readings.ids, readings.ts, readings.talhao))
+    temp = readings.temperatura[order]
+    umid = readings.umidade[order]
+
+    hot = temp > rules.temp_critical
+    masks = [hot, ~hot & (temp < rules.frost), umid < rules.humidity_extreme]
+    candidate, key, window = drought_candidates(readings.talhao[order], readings.ts[order], umid, rules)
+    drought = np.zeros(len(order), dtype=bool)
+    drought[np.flatnonzero(candidate)[dedup(key[candidate], window)]] = True
+    masks.append(drought)
+
+    positions = [np.flatnonzero(m) for m in masks]
+    reading = order[np.concatenate(positions)]
+    rule = np.concatenate([np.full(len(p), code, dtype=np.int8) for code, p in enumerate(positions)])
+    # Alerta table order: by processing (capture time, Id), then by rule within a reading
+    final = np.lexsort((rule, readings.ids[reading], readings.ts[reading]))
+    return ReplayResult(readings, reading[final], rule[final], rules)
+
+
+# -- self-check ----------------------------------------------------------------
+
+def reference_replay(readings):
+    """(reading index, rule code) pairs from one AvaliarLeituraAsync call per reading, default rules only."""
+    from fake_stack import avaliar_leitura
+    codes = {mensagem: code for code, (_, mensagem, _) in enumerate(RULES)}
+    window = int(DEFAULT_RULES.drought_window_hours * MICROS_PER_HOUR)
+    processed, last_drought, alerts = {}, {}, []
+    for i in sorted(range(len(readings)), key=lambda i: (readings.ts[i], readings.ids[i])):
+        talhao, ts = readings.talhao[i], int(readings.ts[i])
+        temp, umid = (None if np.isnan(v) else float(v) for v in (readings.temperatura[i], readings.umidade[i]))
+        history = processed.setdefault(talhao, [])
+        history.append((ts, umid))
+        fired = [codes[mensagem] for mensagem, _ in
+                 avaliar_leitura({"temperaturaCelsius": temp, "umidadeSoloPercentual": umid})]
+        if umid is not None:
+            # GetLeiturasUltimas24HorasAsync, then ExisteAlertaRecenteAsync
+            recent = [u for t, u in history if t >= ts - window]
+            if (len(recent) >= DEFAULT_RULES.drought_min_readings
+                    and all(u is not None and u < DEFAULT_RULES.drought_humidity for u in recent)
+                    and not (talhao in last_drought and last_drought[talhao] >= ts - window)):
+                fired.append(DROUGHT)
+                last_drought[talhao] = ts
+        alerts.extend((i, code) for code in fired)
+    return alerts
+
+
+def random_readings(seed, talhoes=20, n=5000, hours=96):
+    # Bursty capture times with repeated timestamps, dry and wet talhoes and some NULLs
+    rnd = np.random.default_rng(seed)
+    talhao = rnd.integers(0, talhoes, n)
+    ts = rnd.integers(0, hours * 60, n) * 60 * 1000000 + 1700000000 * 1000000
+    dry = (talhao % 3 == 0)
+    umidade = np.where(dry, rnd.uniform(10, 31, n), rnd.uniform(15, 80, n))
+    umidade[rnd.random(n) < 0.01] = np.nan
+    temperatura = rnd.uniform(-5, 40, n)
+    temperatura[rnd.random(n) < 0.01] = np.nan
+    return Readings(np.arange(1, n + 1), talhao, [f"talhao-{t}" for t in range(talhoes)], ts, temperatura, umidade)
+
+
+def self_check(seeds=(1, 2, 3)):
+    checks = []
+    for seed in seeds:
+        readings = random_readings(seed)
+        result = replay(readings)
+        expected = reference_replay(readings)
+        got = list(zip(result.reading.tolist(), result.rule.tolist()))
+        counts = result.count_by_rule()
+        checks.append((f"seed {seed}: replay {len(got)} alerts, per-reading loop {len(expected)} ({counts})",
+                       got == expected and all(counts.values())))
+    for name, ok in checks:
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(ok for _, ok in checks)
+
+
+def print_report(results, elapsed):
+    names = [name for name, _, _ in RULES]
+    print(f"\n{'rules':<12}{'replay ms':>11}" + "".join(f"{n:>22}" for n in names))
+    for label, result in results.items():
+        counts = result.count_by_rule()
+        print(f"{label:<12}{elapsed[label] * 1000:>11.1f}" + "".join(f"{counts[n]:>22}" for n in names))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replays MotorDeAlertas over historical readings.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--csv", help="SensorLeitura export with a header row (default: query the database)")
+    source.add_argument("--columnar", help="Table directory written by columnar_export.py")
+    source.add_argument("--database", default=DB_INGESTAO, help="Database to read from")
+    parser.add_argument("--table", default=TABLE, help="Table with the readings (e.g. Leitura in Analise)")
+    parser.add_argument("--talhao", help="Only replay this IdTalhao")
+    d = DEFAULT_RULES
+    parser.add_argument("--temp-critical", type=float, default=d.temp_critical)
+    parser.add_argument("--frost", type=float, default=d.frost)
+    parser.add_argument("--humidity-extreme", type=float, default=d.humidity_extreme)
+    parser.add_argument("--drought-humidity", type=float, default=d.drought_humidity)
+    parser.add_argument("--drought-min-readings", type=int, default=d.drought_min_readings)
+    parser.add_argument("--drought-window-hours", type=float, default=d.drought_window_hours)
+    parser.add_argument("--output", help="Write the alerts as JSON to this file")
+    parser.add_argument("--self-check", action="store_true",
+                        help="Compare the replay with a per-reading loop on random readings and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.self_check:
+        if not self_check():
+            sys.exit(1)
+        return
+    rules = Rules(args.temp_critical, args.frost, args.humidity_extreme, args.drought_humidity,
+                  args.drought_min_readings, args.drought_window_hours)
+
+    started = time.perf_counter()
+    try:
+        if args.csv:
+            readings = load_csv(args.csv)
+        elif args.columnar:
+            from columnar_export import load_table
+            readings = load_table(args.columnar).to_readings()
+        else:
+            where = f"IdTalhao = '{args.talhao}'" if args.talhao else None
+            readings = load_db(args.database, args.table, where)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"❌ Could not load readings: {e}")
+        sys.exit(1)
+    if args.talhao and (args.csv or args.columnar):
+        readings = readings.for_talhao(args.talhao)
+    print(f"Loaded {len(readings)} readings for {len(np.unique(readings.talhao))} talhoes "
+          f"in {time.perf_counter() - started:.2f}s")
+
+    # the current rules are always replayed too, so a changed threshold shows its effect
+    runs = {"current": DEFAULT_RULES} if rules == DEFAULT_RULES else {"current": DEFAULT_RULES, "proposed": rules}
+    results, elapsed = {}, {}
+    for label, r in runs.items():
+        started = time.perf_counter()
+        results[label] = replay(readings, r)
+        elapsed[label] = time.perf_counter() - started
+    print_report(results, elapsed)
+
+    if args.output:
+        final = results["proposed" if "proposed" in results else "current"]
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"rules": final.rules._asdict(), "countByRule": final.count_by_rule(),
+                       "countByTalhao": final.count_by_talhao(), "alerts": list(final.records())},
+                      f, indent=2, ensure_ascii=False)
+        print(f"\n✅ {len(final)} alerts saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
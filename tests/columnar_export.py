@@ -0,0 +1,356 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import db_access
+from alert_replay import Readings, to_float, to_micros
+
+# Bulk export of the reading/alert tables into memory-mappable NumPy columns.
+# Each table becomes a directory with one .npy file per column plus meta.json:
+#   int   -> int64 (-1 for NULL)         float -> float64 (NaN for NULL)
+#   time  -> datetime64[us]              guid/text -> int32 codes (-1 for NULL)
+#                                                     + <column>.dict.json
+#   str   -> UTF-8 in <column>.bytes + int64 end offsets (Arrow-style; NULL
+#            rows store ~end), for near-unique values such as CorrelationId
+# Rows are streamed in chunks of --chunk-size (cursor.fetchmany on DB-API
+# backends, keyset pages on Id through sqlcmd), and every chunk is appended to
+# the column files straight away, so memory use does not depend on the table
+# size. load_table() memory-maps the columns back, so a multi-million-row
+# history opens instantly and only the pages actually touched are read.
+
+DEFAULT_CHUNK_SIZE = 50000
+# sqlcmd -W separates columns with a single space: text values travel with spaces
+# swapped for \x01 and an empty string sent as \x02 (neither counts as whitespace
+# for str.strip()/splitlines(), unlike the ASCII separators \x1c-\x1f)
+_SPACE, _EMPTY = "\x01", "\x02"
+
+TABLES = {
+    "SensorLeitura": ("Ingestao", [
+        ("Id", "int"), ("IdPropriedade", "guid"), ("IdTalhao", "guid"), ("Origem", "text"),
+        ("DataHoraCapturaUtc", "time"), ("UmidadeSoloPercentual", "float"), ("TemperaturaCelsius", "float"),
+        ("PrecipitacaoMilimetros", "float"), ("IdDispositivo", "text"), ("CorrelationId", "str"),
+    ]),
+    "Leitura": ("Analise", [
+        ("Id", "int"), ("IdTalhao", "guid"), ("DataHoraCapturaUtc", "time"), ("TemperaturaCelsius", "float"),
+        ("UmidadeSoloPercentual", "float"), ("PrecipitacaoMilimetros", "float"),
+    ]),
+    "Alerta": ("Analise", [
+        ("Id", "int"), ("IdTalhao", "guid"), ("Mensagem", "text"), ("Nivel", "text"),
+        ("DataHoraGeracaoUtc", "time"), ("LeituraId", "int"),
+    ]),
+}
+DTYPES = {"int": np.dtype("<i8"), "float": np.dtype("<f8"), "time": np.dtype("<M8[us]"),
+          "guid": np.dtype("<i4"), "text": np.dtype("<i4"), "str": np.dtype("<i8")}
+
+
+def _header(dtype, rows):
+    buf = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        buf, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows,)})
+    return buf.getvalue()
+
+
+class _ColumnWriter:
+    """Appends chunks to a 1-D .npy file whose length is only known at the end.
+
+    The header is written with a placeholder shape and rewritten on close;
+    both pad to the same 128 bytes, so the data never moves.
+    """
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = dtype
+        self.rows = 0
+        self._f = open(path, "wb")
+        self._header_len = len(_header(dtype, 10 ** 18))
+        self._f.write(_header(dtype, 10 ** 18))
+
+    def append(self, values):
+        np.ascontiguousarray(values, dtype=self.dtype).tofile(self._f)
+        self.rows += len(values)
+
+    def close(self):
+        header = _header(self.dtype, self.rows)
+        if len(header) != self._header_len:
+            raise RuntimeError(f"{self.path}: .npy header size changed")
+        self._f.seek(0)
+        self._f.write(header)
+        self._f.close()
+
+
+class _StringWriter(_ColumnWriter):
+    # end offsets in the .npy, the UTF-8 data appended to a sibling .bytes file
+    def __init__(self, path, dtype):
+        super().__init__(path, dtype)
+        self._data = open(path[:-len(".npy")] + ".bytes", "wb")
+        self._end = 0
+
+    def append(self, values):
+        null = np.array([v is None or v == "NULL" for v in values], dtype=bool)
+        data = [b"" if n else str(v).encode("utf-8") for v, n in zip(values, null)]
+        ends = self._end + np.cumsum([len(d) for d in data], dtype=np.int64)
+        self._data.write(b"".join(data))
+        if len(ends):
+            self._end = int(ends[-1])
+        super().append(np.where(null, ~ends, ends))
+
+    def close(self):
+        self._data.close()
+        super().close()
+
+
+class _Dictionary:
+    # value -> int32 code, in first-seen order
+    def __init__(self, lower=False):
+        self.codes = {}
+        self.values = []
+        self.lower = lower
+
+    def encode(self, values):
+        # unique per chunk first, so the Python-level lookups are per distinct value
+        values = np.asarray(values, dtype=object)
+        null = (values == None) | (values == "NULL")  # noqa: E711 (elementwise)
+        values[null] = ""
+        distinct, inverse = np.unique(values.astype(str), return_inverse=True)
+        table = np.empty(len(distinct), dtype=np.int32)
+        for i, v in enumerate(distinct.tolist()):
+            v = v.lower() if self.lower else v
+            code = self.codes.get(v)
+            if code is None:
+                code = self.codes[v] = len(self.values)
+                self.values.append(v)
+            table[i] = code
+        return np.where(null, -1, table[inverse]).astype(np.int32)
+
+
+def _convert(kind, values, dictionary):
+    # fast paths first: numpy converts None to NaN for floats but rejects it (and "NULL") for ints
+    if kind == "int":
+        try:
+            return np.array(values, dtype=np.int64)
+        except (TypeError, ValueError):
+            return np.array([-1 if v is None or v == "NULL" else int(v) for v in values], dtype=np.int64)
+    if kind == "float":
+        try:
+            return np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return to_float([None if v is None else str(v) for v in values])
+    if kind == "time":
+        return to_micros([str(v) for v in values]).astype("datetime64[us]")
+    return dictionary.encode(values)
+
+
+def _sqlcmd_chunks(executor, database, table, columns, chunk_size, after_id=0, where=None, order=None):
+    # Keyset pages through the text interface: WHERE Id > last ORDER BY Id, or with `order`
+    # WHERE (order, Id) > (last order value, last Id) ORDER BY order, Id
+    select = []
+    for name, kind in columns:
+        if kind == "time":
+            select.append(f"CONVERT(varchar(27), {name}, 126)")
+        elif kind in ("text", "str"):
+            select.append(f"CASE WHEN {name} = '' THEN CHAR(2) ELSE REPLACE({name}, ' ', CHAR(1)) END")
+        else:
+            select.append(name)
+    position = [name for name, _ in columns].index(order) if order else None
+    fixed = ([f"Id > {after_id}"] if order else []) + ([f"({where})"] if where else [])
+    last, last_key = after_id, None
+    while True:
+        if last_key is None:
+            keyset = [] if order else [f"Id > {last}"]
+        else:
+            keyset = [f"({order} > '{last_key}' OR ({order} = '{last_key}' AND Id > {last}))"]
+        output = executor.query(f"SET NOCOUNT ON; SELECT TOP ({chunk_size}) {', '.join(select)} FROM dbo.{table} "
+                                f"WHERE {' AND '.join(fixed + keyset) or '1 = 1'} ORDER BY {order + ', ' if order else ''}Id",
+                                database)
+        if output is None:
+            raise RuntimeError(f"Query on {database}.{table} failed after Id {last}")
+        rows = [line.split(" ") for line in output.split("\n") if line.strip()]
+        rows = [[v.replace(_SPACE, " ").replace(_EMPTY, "") for v in r] for r in rows if len(r) == len(columns)]
+        if not rows:
+            return
+        yield rows
+        last = int(rows[-1][0])
+        if order:
+            last_key = rows[-1][position]
+        if len(rows) < chunk_size:
+            return
+
+
+def _dbapi_chunks(executor, database, table, columns, chunk_size, after_id=0, where=None, order=None):
+    # One ordered SELECT streamed with fetchmany on a pooled connection
+    with executor.connection(database) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT {', '.join(n for n, _ in columns)} FROM {table} WHERE Id > ?"
+                           f"{f' AND ({where})' if where else ''} ORDER BY {order + ', ' if order else ''}Id", (after_id,))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+
+def stream_rows(table, executor=None, chunk_size=DEFAULT_CHUNK_SIZE, after_id=0, where=None, order=None):
+    """Yields lists of row tuples of dbo.<table> in Id order, TABLES column order.
+
+    `where` is an extra SQL predicate (literal values, valid on SQL Server and sqlite);
+    `order` a column to sort by before Id, e.g. a time column.
+    """
+    database, columns = TABLES[table]
+    executor = executor or db_access.get_executor()
+    chunks = _dbapi_chunks if hasattr(executor, "connection") else _sqlcmd_chunks
+    return chunks(executor, database, table, columns, chunk_size, after_id, where, order)
+
+
+def export_table(table, out_dir, executor=None, chunk_size=DEFAULT_CHUNK_SIZE, after_id=0, progress=True):
+    """Streams dbo.<table> into <out_dir>/<table>/ and returns its metadata."""
+    database, columns = TABLES[table]
+    target = os.path.join(out_dir, table)
+    os.makedirs(target, exist_ok=True)
+    # files of a previous export of this table (e.g. a dictionary for a column now stored as str)
+    names = {name for name, _ in columns}
+    for stale in os.listdir(target):
+        if stale == "meta.json" or stale.split(".")[0] in names:
+            os.remove(os.path.join(target, stale))
+
+    writers = [(_StringWriter if kind == "str" else _ColumnWriter)(os.path.join(target, f"{name}.npy"), DTYPES[kind])
+               for name, kind in columns]
+    dictionaries = {name: _Dictionary(lower=kind == "guid") for name, kind in columns if kind in ("guid", "text")}
+    started = time.perf_counter()
+    last_id = after_id
+    try:
+        for rows in stream_rows(table, executor, chunk_size, after_id):
+            values = list(zip(*rows))
+            for writer, (name, kind), column in zip(writers, columns, values):
+                writer.append(column if kind == "str" else _convert(kind, column, dictionaries.get(name)))
+            last_id = int(values[0][-1])
+            if progress:
+                print(f"  {table}: {writers[0].rows} rows ({time.perf_counter() - started:.1f}s)", end="\r")
+    finally:
+        for writer in writers:
+            writer.close()
+
+    for name, dictionary in dictionaries.items():
+        with open(os.path.join(target, f"{name}.dict.json"), "w", encoding="utf-8") as f:
+            json.dump(dictionary.values, f, ensure_ascii=False)
+    meta = {
+        "table": table, "database": database, "rows": writers[0].rows, "lastId": last_id,
+        "exportedAtUtc": datetime.datetime.utcnow().isoformat() + "Z",
+        "seconds": round(time.perf_counter() - started, 3),
+        "columns": [{"name": name, "kind": kind, "dtype": DTYPES[kind].str} for name, kind in columns],
+    }
+    with open(os.path.join(target, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    if progress:
+        print(f"  {table}: {meta['rows']} rows in {meta['seconds']}s -> {target}")
+    return meta
+
+
+class Table:
+    """A table exported by export_table(), with its columns memory-mapped.
+
+    `table["IdTalhao"]` is the raw column (codes for guid/text columns, end
+    offsets for str columns), `table.dictionary("IdTalhao")` the code -> value
+    list, and `table.decode("IdTalhao", rows)` the values as an object array.
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.kinds = {c["name"]: c["kind"] for c in self.meta["columns"]}
+        self._mmap = "r" if mmap else None
+        self._columns = {}
+        self._dictionaries = {}
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            if name not in self.kinds:
+                raise KeyError(name)
+            column = self._columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode=self._mmap)
+        return column
+
+    def dictionary(self, name):
+        values = self._dictionaries.get(name)
+        if values is None:
+            with open(os.path.join(self.path, f"{name}.dict.json"), encoding="utf-8") as f:
+                values = self._dictionaries[name] = np.array(json.load(f) + [None], dtype=object)
+        return values
+
+    def decode(self, name, rows=slice(None)):
+        if self.kinds[name] != "str":
+            # code -1 (NULL) picks the trailing None
+            return self.dictionary(name)[self[name][rows]]
+        ends = np.asarray(self[name])
+        null = ends < 0
+        ends = np.where(null, ~ends, ends)
+        starts = np.concatenate(([0], ends[:-1]))
+        data = np.memmap(os.path.join(self.path, f"{name}.bytes"), mode="r") if ends.size and ends[-1] else b""
+        return np.array([None if n else bytes(data[s:e]).decode("utf-8")
+                         for s, e, n in zip(starts[rows], ends[rows], null[rows])], dtype=object)
+
+    def to_readings(self):
+        # SensorLeitura/Leitura as alert_replay.Readings, without copying the numeric columns
+        return Readings(self["Id"], self["IdTalhao"], self.dictionary("IdTalhao")[:-1],
+                        self["DataHoraCapturaUtc"].view(np.int64), self["TemperaturaCelsius"],
+                        self["UmidadeSoloPercentual"])
+
+
+def load_table(path, mmap=True):
+    return Table(path, mmap)
+
+
+def print_info(path):
+    table = load_table(path)
+    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    print(f"{table.meta['database']}.{table.meta['table']}: {len(table)} rows, {size / 1e6:.1f} MB, "
+          f"exported {table.meta['exportedAtUtc']} (last Id {table.meta['lastId']})")
+    for c in table.meta["columns"]:
+        extra = f" ({len(table.dictionary(c['name'])) - 1} distinct)" if c["kind"] in ("guid", "text") else ""
+        print(f"  {c['name']:<24}{c['kind']:<7}{c['dtype']}{extra}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Exports reading/alert tables to memory-mapped NumPy columns.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Stream tables from the database")
+    export.add_argument("--tables", nargs="+", choices=sorted(TABLES), default=sorted(TABLES))
+    export.add_argument("--out", default="exports", help="Output directory (one subdirectory per table)")
+    export.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    export.add_argument("--after-id", type=int, default=0, help="Only rows with a larger Id")
+    info = sub.add_parser("info", help="Describe an exported table")
+    info.add_argument("paths", nargs="+")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "info":
+        for path in args.paths:
+            print_info(path)
+        return
+
+    print(f"🚀 Exporting {', '.join(args.tables)} to {args.out}/ ...")
+    try:
+        for table in args.tables:
+            export_table(table, args.out, chunk_size=args.chunk_size, after_id=args.after_id)
+    except RuntimeError as e:
+        print(f"\n❌ Export failed: {e}")
+        sys.exit(1)
+    print("✅ Export complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,12 @@ import random
 import time
 import sys
 import os
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from instrumentation import REGISTRY, InstrumentedSession
 
 # Configuration (adjust ports if necessary based on qa_validation_v2.py)
 BASE_URL_USUARIOS = "http://localhost:30001"
@@ -12,6 +18,110 @@ BASE_URL_INGESTAO = "http://localhost:30003"
 
 OUTPUT_FILE = "simulation_data.json"
 
+# Seeding engine defaults (5 users x 4 properties x 3 talhoes, as before)
+DEFAULT_USERS = 5
+DEFAULT_PROPERTIES = 4
+DEFAULT_TALHOES = 3
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 0.5
+# 503 is the only status that means "not processed": 502/504 may come back after the
+# controller already committed, so those get the same treatment as a lost response
+RETRY_STATUS_CODES = {503}
+AMBIGUOUS_STATUS_CODES = {502, 504}
+
+_print_lock = threading.Lock()
+
+def log(msg):
+    # print from worker threads without interleaving lines
+    with _print_lock:
+        print(msg)
+
+def build_session(pool_size):
+    # One keep-alive pool per service, sized to the number of concurrent workers; every call is timed
+    session = InstrumentedSession()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Shared sessions per service; replaced by configure_sessions() when concurrency changes
+SESSION_USUARIOS = build_session(DEFAULT_CONCURRENCY)
+SESSION_PROPRIEDADES = build_session(DEFAULT_CONCURRENCY)
+MAX_RETRIES = DEFAULT_RETRIES
+# Caps HTTP calls in flight across all worker threads
+_inflight = threading.BoundedSemaphore(DEFAULT_CONCURRENCY)
+
+def configure_sessions(concurrency, retries=DEFAULT_RETRIES):
+    global SESSION_USUARIOS, SESSION_PROPRIEDADES, MAX_RETRIES, _inflight
+    SESSION_USUARIOS = build_session(concurrency)
+    SESSION_PROPRIEDADES = build_session(concurrency)
+    MAX_RETRIES = retries
+    _inflight = threading.BoundedSemaphore(concurrency)
+
+class FoundResponse:
+    """Stands in for a POST response that was lost, built from the record a GET found."""
+
+    status_code = 200
+
+    def __init__(self, record):
+        self.record = record
+        self.text = json.dumps(record)
+
+    def json(self):
+        return self.record
+
+def _never_sent(exc):
+    # the TCP connection was never established, so the request cannot have reached the controller
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+def post_with_retry(session, url, payload, headers=None, find=None, idempotent=False):
+    """POST with bounded retries and linear backoff.
+
+    Registrations, properties and talhoes are not idempotent, so a request is only
+    re-sent when it never got through: a failed connect or a 503. When the outcome is
+    unknown (connection lost after sending, read timeout, 502/504), `find` is asked
+    first; a record it returns is answered as a FoundResponse instead of POSTing a
+    duplicate. Without `find` the failure is returned/raised as is. `idempotent` calls
+    (login) retry on any connection error and gateway status.
+    """
+    attempt = 0
+    while True:
+        try:
+            with _inflight:
+                resp = session.post(url, json=payload, headers=headers, timeout=30)
+            if attempt >= MAX_RETRIES or resp.status_code not in RETRY_STATUS_CODES | AMBIGUOUS_STATUS_CODES:
+                return resp
+            if resp.status_code in AMBIGUOUS_STATUS_CODES and not idempotent:
+                if find is None:
+                    return resp
+                record = find()
+                if record is not None:
+                    return FoundResponse(record)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout) as e:
+            if attempt >= MAX_RETRIES:
+                raise
+            if not idempotent and not _never_sent(e):
+                if find is None:
+                    raise
+                record = find()
+                if record is not None:
+                    return FoundResponse(record)
+        attempt += 1
+        REGISTRY.counter("seeder_retries").inc()
+        time.sleep(RETRY_BACKOFF_SECONDS * attempt)
+
+def find_in_list(session, url, headers, nome):
+    # the record named `nome` from a GET listing, None when it is not there
+    with _inflight:
+        resp = session.get(url, headers=headers, timeout=30)
+    if resp.status_code != 200:
+        return None
+    return next((r for r in resp.json() if r.get("nome") == nome), None)
+
 def get_unique_suffix():
     return f"{int(time.time())}_{random.randint(1000, 9999)}"
 
@@ -19,69 +129,73 @@ def create_user(index):
     suffix = get_unique_suffix()
     email = f"user_{index}_{suffix}@example.com"
     password = "Password123!"
-    
-    print(f"Creating user: {email}")
+
+    log(f"Creating user: {email}")
     payload = {
         "email": email,
         "senha": password,
         "tipoId": 1 # Assuming 1 is producer/admin
     }
-    
+
     try:
         # Based on UsuariosController: [Route("api/usuarios")]
-        resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/registrar", json=payload)
+        # Registered already if the credentials log in
+        find = lambda: {} if login_user(email, password) else None
+        resp = post_with_retry(SESSION_USUARIOS, f"{BASE_URL_USUARIOS}/api/usuarios/registrar", payload, find=find)
         if resp.status_code in [200, 201]:
             # This endpoint returns { "mensagem": "..." } not full user data, but that's fine.
             return { "email": email, "password": password }
         else:
-            print(f"Failed to create user {email}: {resp.status_code} - {resp.text}")
+            log(f"Failed to create user {email}: {resp.status_code} - {resp.text}")
             return None
     except Exception as e:
-        print(f"Exception creating user: {e}")
+        log(f"Exception creating user: {e}")
         return None
 
 def login_user(email, password):
-    print(f"Logging in user: {email}")
+    log(f"Logging in user: {email}")
     payload = {
         "email": email,
         "password": password
     }
     try:
         # Based on UsuariosController: [HttpPost("login")]
-        resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/login", json=payload)
+        resp = post_with_retry(SESSION_USUARIOS, f"{BASE_URL_USUARIOS}/api/usuarios/login", payload, idempotent=True)
         if resp.status_code == 200:
             return resp.json().get("token")
         else:
-            print(f"Failed to login {email}: {resp.status_code} - {resp.text}")
+            log(f"Failed to login {email}: {resp.status_code} - {resp.text}")
             return None
     except Exception as e:
-        print(f"Exception logging in: {e}")
+        log(f"Exception logging in: {e}")
         return None
 
 def create_property(token, user_index, prop_index):
     suffix = get_unique_suffix()
     nome = f"Propriedade {user_index}-{prop_index} {suffix}"
     localizacao = f"Localizacao {user_index}-{prop_index}"
-    
-    print(f"Creating property: {nome}")
+
+    log(f"Creating property: {nome}")
     # PropriedadesController: [HttpPost] Route("api/v1/[controller]") -> /api/v1/Propriedades
     # DTO: CreatePropriedadeDto(string Nome, string Localizacao)
     payload = {
         "nome": nome,
         "localizacao": localizacao
     }
-    
+
     headers = {"Authorization": f"Bearer {token}"}
-    
+
     try:
-        resp = requests.post(f"{BASE_URL_PROPRIEDADES}/api/v1/propriedades", json=payload, headers=headers)
+        url = f"{BASE_URL_PROPRIEDADES}/api/v1/propriedades"
+        find = lambda: find_in_list(SESSION_PROPRIEDADES, url, headers, nome)
+        resp = post_with_retry(SESSION_PROPRIEDADES, url, payload, headers, find=find)
         if resp.status_code in [200, 201]:
             return resp.json()
         else:
-            print(f"Failed to create property {nome}: {resp.status_code} - {resp.text}")
+            log(f"Failed to create property {nome}: {resp.status_code} - {resp.text}")
             return None
     except Exception as e:
-        print(f"Exception creating property: {e}")
+        log(f"Exception creating property: {e}")
         return None
 
 def create_field(token, property_id, user_index, prop_index, field_index):
@@ -89,8 +203,8 @@ def create_field(token, property_id, user_index, prop_index, field_index):
     nome = f"Talhão {user_index}-{prop_index}-{field_index} {suffix}"
     area = float(random.randint(10, 50))
     cultura = "Soja" if random.random() > 0.5 else "Milho"
-    
-    print(f"Creating field: {nome} for property {property_id}")
+
+    log(f"Creating field: {nome} for property {property_id}")
     # PropriedadesController: [HttpPost("{id}/talhoes")] -> /api/v1/Propriedades/{id}/talhoes
     # DTO: CreateTalhaoDto(string Nome, string Cultura, decimal Area)
     payload = {
@@ -98,68 +212,234 @@ def create_field(token, property_id, user_index, prop_index, field_index):
         "cultura": cultura,
         "area": area
     }
-    
+
     headers = {"Authorization": f"Bearer {token}"}
-    
+
     try:
-        resp = requests.post(f"{BASE_URL_PROPRIEDADES}/api/v1/propriedades/{property_id}/talhoes", json=payload, headers=headers)
+        url = f"{BASE_URL_PROPRIEDADES}/api/v1/propriedades/{property_id}/talhoes"
+        find = lambda: find_in_list(SESSION_PROPRIEDADES, url, headers, nome)
+        resp = post_with_retry(SESSION_PROPRIEDADES, url, payload, headers, find=find)
         if resp.status_code in [200, 201]:
             return resp.json()
         else:
-            print(f"Failed to create field {nome}: {resp.status_code} - {resp.text}")
+            log(f"Failed to create field {nome}: {resp.status_code} - {resp.text}")
             return None
     except Exception as e:
-        print(f"Exception creating field: {e}")
+        log(f"Exception creating field: {e}")
         return None
 
+def seed_property(pool, journal, token, u, p, n_talhoes, existing=None):
+    # -> (property record, whether all n_talhoes talhoes exist); `existing` is the journaled
+    # state of a property created by an earlier run, whose missing talhoes are created now
+    if existing is None:
+        prop = create_property(token, u, p)
+        if not prop:
+            return None, False
+        existing = {"id": prop['id'], "nome": prop['nome'], "talhoes": {}}
+        journal.property_created(u, p, existing)
+    talhoes = dict(existing["talhoes"])
 
-def main():
-    print("🚀 Starting Data Seeder...")
-    
-    simulation_data = []
+    # Fan out the missing talhoes of this property; each one is journaled as soon as it exists
+    futures = {t: pool.submit(create_field, token, existing['id'], u, p, t)
+               for t in range(1, n_talhoes + 1) if t not in talhoes}
+    for t, future in futures.items():
+        field = future.result()
+        if field:
+            talhoes[t] = field['id']
+            journal.talhao_created(u, p, t, field['id'])
+
+    prop_record = {
+        "id": existing['id'],
+        "nome": existing['nome'],
+        "talhoes": [talhoes[t] for t in sorted(talhoes)]
+    }
+    return prop_record, len(talhoes) == n_talhoes
+
+class SeedJournal:
+    """Append-only JSON Lines sidecar of seeding progress.
 
-    for u in range(1, 6): # 5 Users
+    Events: "user" (registered + logged in), "property" (id and name), "talhao"
+    (one per talhao created) and "done" (full user record, written only once every
+    property and talhao exists). finalize() streams the "done" records into the
+    JSON array read by the Simulador, so nothing is held in memory between users.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done = set()
+        self.partial = {}
+        if resume and os.path.exists(path):
+            self._load()
+        self._lock = threading.Lock()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self):
+        complete = 0   # bytes up to the end of the last newline-terminated line
+        with open(self.path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    # last line of a crashed run may be truncated
+                    break
+                complete += len(raw)
+                line = raw.decode("utf-8").strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                u = entry["index"]
+                if entry["event"] == "user":
+                    self.partial[u] = {"email": entry["email"], "password": entry["password"], "properties": {}}
+                elif entry["event"] == "property" and u in self.partial:
+                    record = entry["record"]
+                    self.partial[u]["properties"][entry["prop"]] = {"id": record["id"], "nome": record["nome"],
+                                                                     "talhoes": {}}
+                elif entry["event"] == "talhao" and entry["prop"] in self.partial.get(u, {}).get("properties", {}):
+                    self.partial[u]["properties"][entry["prop"]]["talhoes"][entry["talhao"]] = entry["id"]
+                elif entry["event"] == "done":
+                    self.done.add(u)
+                    self.partial.pop(u, None)
+        # drop the fragment, so the records appended on resume start on a line of their own
+        with open(self.path, "r+b") as f:
+            f.truncate(complete)
+
+    def _append(self, entry):
+        line = json.dumps(entry, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def user_created(self, u, email, password):
+        self._append({"event": "user", "index": u, "email": email, "password": password})
+
+    def property_created(self, u, p, prop_record):
+        self._append({"event": "property", "index": u, "prop": p, "record": prop_record})
+
+    def talhao_created(self, u, p, t, talhao_id):
+        self._append({"event": "talhao", "index": u, "prop": p, "talhao": t, "id": talhao_id})
+
+    def user_done(self, u, user_record):
+        self._append({"event": "done", "index": u, "record": user_record})
+
+    def close(self):
+        self._file.close()
+
+    def finalize(self, output):
+        # Write to a temp file and swap, so a crash here never leaves a broken output
+        count = 0
+        tmp = output + ".tmp"
+        with open(self.path, encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+            dst.write("[")
+            for line in src:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("event") != "done":
+                    continue
+                dst.write(",\n" if count else "\n")
+                dst.write(json.dumps(entry["record"], ensure_ascii=False, separators=(",", ":")))
+                count += 1
+            dst.write("\n]\n")
+        os.replace(tmp, output)
+        return count
+
+def seed_user(pool, journal, u, n_properties, n_talhoes):
+    resumed = journal.partial.get(u)
+    if resumed:
+        # Registered in a previous run: log in again and keep the properties already created
+        user = {"email": resumed["email"], "password": resumed["password"]}
+        existing = resumed["properties"]
+        created = sum(len(prop["talhoes"]) for prop in existing.values())
+        log(f"Resuming user {user['email']} ({len(existing)}/{n_properties} properties, "
+            f"{created}/{n_properties * n_talhoes} talhoes already created)")
+    else:
         user = create_user(u)
         if not user:
-            continue
-            
-        token = login_user(user['email'], user['password'])
-        if not token:
-            continue
-            
-        user_record = {
-            "email": user['email'],
-            "password": user['password'],
-            "token": token,
-            "properties": []
-        }
-        
-        for p in range(1, 5): # 4 Properties
-            prop = create_property(token, u, p)
-            if not prop:
-                continue
-            
-            prop_record = {
-                "id": prop['id'],
-                "nome": prop['nome'],
-                "talhoes": []
-            }
-            
-            for t in range(1, 4): # 3 Fields (Talhões)
-                field = create_field(token, prop['id'], u, p, t)
-                if field:
-                    prop_record['talhoes'].append(field['id'])
-            
-            user_record['properties'].append(prop_record)
-        
-        simulation_data.append(user_record)
-
-    # Save to file
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(simulation_data, f, indent=2)
-    
-    print(f"\n✅ Data seeding complete. Configuration saved to {OUTPUT_FILE}")
-    print(f"Created {len(simulation_data)} users with properties and fields.")
+            return None
+        journal.user_created(u, user['email'], user['password'])
+        existing = {}
+
+    token = login_user(user['email'], user['password'])
+    if not token:
+        return None
+
+    user_record = {
+        "email": user['email'],
+        "password": user['password'],
+        "token": token,
+        "properties": []
+    }
+
+    # Properties fan out on a per-user pool; talhoes go to the shared request pool
+    complete = True
+    with ThreadPoolExecutor(max_workers=max(1, n_properties)) as prop_pool:
+        futures = [prop_pool.submit(seed_property, pool, journal, token, u, p, n_talhoes, existing.get(p))
+                   for p in range(1, n_properties + 1)]
+        for future in futures:
+            prop_record, prop_complete = future.result()
+            complete = complete and prop_complete
+            if prop_record:
+                user_record['properties'].append(prop_record)
+
+    if not complete:
+        # left out of the output; --resume creates only what is missing
+        log(f"User {user['email']} is incomplete; run again with --resume to finish it")
+        return None
+    journal.user_done(u, user_record)
+    return user_record
+
+def seed(journal, n_users=DEFAULT_USERS, n_properties=DEFAULT_PROPERTIES, n_talhoes=DEFAULT_TALHOES, concurrency=DEFAULT_CONCURRENCY):
+    # Users, properties and talhoes fan out on thread pools; the number of HTTP calls
+    # actually in flight is capped at `concurrency` by post_with_retry.
+    # Each finished user goes straight to the journal instead of an in-memory list.
+    pending = [u for u in range(1, n_users + 1) if u not in journal.done]
+    if journal.done:
+        log(f"Skipping {n_users - len(pending)} users already seeded.")
+
+    seeded = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as request_pool, \
+         ThreadPoolExecutor(max_workers=concurrency) as user_pool:
+        futures = [user_pool.submit(seed_user, request_pool, journal, u, n_properties, n_talhoes) for u in pending]
+        for future in futures:
+            if future.result():
+                seeded += 1
+    return seeded
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seeds users, properties and talhoes for the Simulador.")
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--properties", type=int, default=DEFAULT_PROPERTIES, help="Properties per user")
+    parser.add_argument("--talhoes", type=int, default=DEFAULT_TALHOES, help="Talhoes per property")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Max concurrent users/requests")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Retries per request when it never reached the service (connect errors, 503)")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--journal", help="Progress sidecar (JSON Lines). Defaults to <output>.jsonl")
+    parser.add_argument("--resume", action="store_true", help="Continue from the journal, skipping users/properties already created")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    print("🚀 Starting Data Seeder...")
+    print(f"Users: {args.users} | Properties/user: {args.properties} | Talhoes/property: {args.talhoes} | Concurrency: {args.concurrency}")
+
+    configure_sessions(args.concurrency, args.retries)
+    journal = SeedJournal(args.journal or args.output + ".jsonl", resume=args.resume)
+    started = time.perf_counter()
+    try:
+        seeded = seed(journal, args.users, args.properties, args.talhoes, args.concurrency)
+    finally:
+        journal.close()
+    elapsed = time.perf_counter() - started
+
+    # Save to file (streamed from the journal)
+    total = journal.finalize(args.output)
+
+    print(f"\n✅ Data seeding complete. Configuration saved to {args.output}")
+    print(f"Created {seeded} users with properties and fields in {elapsed:.1f}s ({total} users in file).")
+    if total < args.users:
+        print(f"⚠️ {args.users - total} users are incomplete; run again with --resume to finish them.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,367 @@
+import atexit
+import datetime
+import os
+import queue
+import re
+import sqlite3
+import subprocess
+import threading
+import uuid
+from contextlib import contextmanager
+
+import kube_utils
+
+# Shared SQL access for the QA/reproduction scripts.
+# Every executor exposes query(sql, database) -> text (rows on separate lines,
+# columns separated by a space, like `sqlcmd -h -1 -W`) or None on error, and
+# query_many([(sql, database), ...]) which runs the whole list in one round trip.
+
+NAMESPACE = kube_utils.NAMESPACE
+SQL_POD_SELECTOR = "app=sql-server"
+SQL_PASSWORD = "Fi@p2026"
+SQLCMD_PATH = "/opt/mssql-tools18/bin/sqlcmd"
+QUERY_TIMEOUT_SECONDS = 60
+
+# Backend picked by get_executor(); override with AGRO_SQL_BACKEND=sqlcmd|pyodbc|sqlite
+DEFAULT_BACKEND = os.environ.get("AGRO_SQL_BACKEND", "sqlcmd")
+# SqlcmdSession options get_executor() takes from the environment (over configure_executor() defaults)
+SQLCMD_ENV = {"namespace": "AGRO_SQL_NAMESPACE", "selector": "AGRO_SQL_POD_SELECTOR", "password": "AGRO_SQL_PASSWORD",
+              "sqlcmd_path": "AGRO_SQLCMD_PATH", "trust_cert": "AGRO_SQLCMD_TRUST_CERT"}
+
+_PROMPT_RE = re.compile(r"^(\d+> )+")
+_ERROR_RE = re.compile(r"^Msg \d+, Level (\d+)")
+
+
+def format_rows(rows):
+    return "\n".join(" ".join("NULL" if v is None else str(v) for v in row) for row in rows)
+
+
+class SqlcmdSession:
+    """Long-lived `kubectl exec -i ... sqlcmd` process fed through stdin.
+
+    The pod comes from the shared kube_utils cache and a single sqlcmd login is
+    reused for every query; a failed session invalidates the cached pod.
+    Each query is followed by a PRINT of a unique marker so its output can be
+    split from the next one without closing the session.
+    """
+
+    def __init__(self, namespace=NAMESPACE, selector=SQL_POD_SELECTOR, password=SQL_PASSWORD,
+                 sqlcmd_path=SQLCMD_PATH, timeout=QUERY_TIMEOUT_SECONDS, pod_name=None, trust_cert=True):
+        self.namespace = namespace
+        self.selector = selector
+        self.password = password
+        self.sqlcmd_path = sqlcmd_path
+        self.timeout = timeout
+        self.pod_name = pod_name
+        self._fixed_pod = pod_name is not None
+        # -C (trust server certificate) only exists in mssql-tools18
+        self.trust_cert = trust_cert
+        self._proc = None
+        self._lines = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _start(self):
+        if not self.pod_name:
+            self.pod_name = kube_utils.get_pod_name(self.selector, self.namespace)
+            if not self.pod_name:
+                print("❌ Could not find SQL Pod.")
+                return False
+
+        args = [kube_utils.KUBECTL, "exec", "-i", "-n", self.namespace, self.pod_name, "--", self.sqlcmd_path]
+        if self.trust_cert:
+            args.append("-C")
+        args += ["-S", "localhost", "-U", "sa", "-P", self.password, "-h", "-1", "-W"]
+        self._proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT, text=True, bufsize=1)
+        self._lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self._proc, self._lines), daemon=True).start()
+        self._write("SET NOCOUNT ON;\nGO\n")
+        return True
+
+    @staticmethod
+    def _pump(proc, lines):
+        # Reader thread: lets _read_until() wait with a timeout on every platform
+        for line in proc.stdout:
+            lines.put(line.rstrip("\r\n"))
+        lines.put(None)
+
+    def _write(self, text):
+        self._proc.stdin.write(text)
+        self._proc.stdin.flush()
+
+    def _read_until(self, marker):
+        out = []
+        while True:
+            line = self._lines.get(timeout=self.timeout)
+            if line is None:
+                raise RuntimeError("sqlcmd session ended unexpectedly")
+            line = _PROMPT_RE.sub("", line)
+            if marker in line:
+                return out
+            if line.startswith("Changed database context to"):
+                continue
+            out.append(line)
+
+    def _alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def query_many(self, statements):
+        with self._lock:
+            if not self._alive() and not self._start():
+                return [None] * len(statements)
+
+            markers = []
+            script = []
+            for sql, database in statements:
+                marker = f"__agro_{uuid.uuid4().hex}__"
+                markers.append(marker)
+                script.append(f"USE [{database}];\nGO\n{sql}\nGO\nPRINT '{marker}';\nGO\n")
+
+            try:
+                self._write("".join(script))
+                results = []
+                for marker in markers:
+                    results.append(self._parse(self._read_until(marker)))
+                return results
+            except (queue.Empty, RuntimeError, OSError) as e:
+                print(f"❌ SQL Error: {e}")
+                self.close()
+                # the pod may have been replaced: resolve it again on the next query
+                if not self._fixed_pod:
+                    kube_utils.invalidate(self.selector, self.namespace)
+                    self.pod_name = None
+                return [None] * len(statements)
+
+    @staticmethod
+    def _parse(lines):
+        for i, line in enumerate(lines):
+            m = _ERROR_RE.match(line)
+            if m and int(m.group(1)) > 10:
+                print(f"❌ SQL Error: {' '.join(lines[i:])}")
+                return None
+        return "\n".join(l for l in lines if l.strip()).strip()
+
+    def query(self, sql, database):
+        return self.query_many([(sql, database)])[0]
+
+    def close(self):
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+
+
+class DbApiPool:
+    """Pooled DB-API connections, one small pool per database.
+
+    `connect(database)` opens a new connection; idle connections are kept and
+    reused instead of paying a login per query. With `serialize=True` a single
+    connection per database is kept and every use is serialized (for engines
+    such as in-memory sqlite whose data lives in one connection).
+    """
+
+    def __init__(self, connect, max_idle=4, serialize=False):
+        self._connect = connect
+        self._max_idle = 1 if serialize else max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+        # re-entrant so one thread can hold several databases inside query_many
+        self._serial = threading.RLock() if serialize else None
+
+    def _acquire(self, database):
+        if self._serial is not None:
+            self._serial.acquire()
+        with self._lock:
+            idle = self._idle.get(database)
+            if idle:
+                return idle.pop()
+        return self._connect(database)
+
+    def _release(self, database, conn):
+        try:
+            with self._lock:
+                idle = self._idle.setdefault(database, [])
+                if len(idle) < self._max_idle:
+                    idle.append(conn)
+                    return
+            conn.close()
+        finally:
+            if self._serial is not None:
+                self._serial.release()
+
+    @contextmanager
+    def connection(self, database):
+        conn = self._acquire(database)
+        try:
+            yield conn
+        finally:
+            self._release(database, conn)
+
+    def query_many(self, statements):
+        # one connection per database for the whole batch; a failing statement
+        # yields None and is rolled back without affecting the others
+        results = []
+        conns = {}
+        try:
+            for sql, database in statements:
+                if database not in conns:
+                    conns[database] = self._acquire(database)
+                conn = conns[database]
+                try:
+                    results.append(self._execute(conn, sql))
+                except Exception as e:
+                    print(f"❌ SQL Error: {e}")
+                    conn.rollback()
+                    results.append(None)
+        except Exception as e:
+            # could not connect
+            print(f"❌ SQL Error: {e}")
+            results.extend([None] * (len(statements) - len(results)))
+        finally:
+            for database, conn in conns.items():
+                self._release(database, conn)
+        return results
+
+    @staticmethod
+    def _execute(conn, sql):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            if cursor.description is not None:
+                return format_rows(cursor.fetchall())
+            conn.commit()
+            return "OK"
+        finally:
+            cursor.close()
+
+    def query(self, sql, database):
+        return self.query_many([(sql, database)])[0]
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle = {}
+
+
+def pyodbc_pool(conn_str_template, max_idle=4):
+    import pyodbc
+
+    # Use replace instead of format to avoid issues with curly braces in Driver definition
+    return DbApiPool(lambda database: pyodbc.connect(conn_str_template.replace("{database}", database)), max_idle)
+
+
+# sqlite versions of the services' tables (same names and key columns), for the fake
+# stack and the offline sqlite backend
+SCHEMA = {
+    "Usuarios": [
+        "CREATE TABLE IF NOT EXISTS Usuarios (Id INTEGER PRIMARY KEY AUTOINCREMENT, Email TEXT UNIQUE, Senha TEXT, TipoId INTEGER)",
+    ],
+    "Propriedades": [
+        "CREATE TABLE IF NOT EXISTS Propriedades (Id TEXT PRIMARY KEY, Nome TEXT, Localizacao TEXT, OwnerUserId TEXT)",
+        "CREATE TABLE IF NOT EXISTS Talhoes (Id TEXT PRIMARY KEY, PropriedadeId TEXT, Nome TEXT, Cultura TEXT, Area REAL)",
+    ],
+    "Ingestao": [
+        "CREATE TABLE IF NOT EXISTS SensorLeitura (Id INTEGER PRIMARY KEY AUTOINCREMENT, IdPropriedade TEXT, IdTalhao TEXT, "
+        "Origem TEXT, DataHoraCapturaUtc TEXT, UmidadeSoloPercentual REAL, TemperaturaCelsius REAL, "
+        "PrecipitacaoMilimetros REAL, IdDispositivo TEXT, CorrelationId TEXT)",
+        "CREATE INDEX IF NOT EXISTS IX_SensorLeitura_Talhao_DataHora ON SensorLeitura (IdTalhao, DataHoraCapturaUtc)",
+    ],
+    "Analise": [
+        "CREATE TABLE IF NOT EXISTS Leitura (Id INTEGER PRIMARY KEY AUTOINCREMENT, IdTalhao TEXT, DataHoraCapturaUtc TEXT, "
+        "TemperaturaCelsius REAL, UmidadeSoloPercentual REAL, PrecipitacaoMilimetros REAL)",
+        "CREATE INDEX IF NOT EXISTS IX_Leitura_IdTalhao ON Leitura (IdTalhao)",
+        "CREATE TABLE IF NOT EXISTS Alerta (Id INTEGER PRIMARY KEY AUTOINCREMENT, IdTalhao TEXT, Mensagem TEXT, Nivel TEXT, "
+        "DataHoraGeracaoUtc TEXT, LeituraId INTEGER)",
+        "CREATE INDEX IF NOT EXISTS IX_Alerta_IdTalhao ON Alerta (IdTalhao)",
+    ],
+}
+
+
+def parse_utc(value):
+    # ISO-8601 with or without Z/offset -> naive UTC datetime; None if invalid
+    if isinstance(value, datetime.datetime):
+        ts = value
+    else:
+        try:
+            ts = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def db_timestamp(value):
+    # Fixed-width text so sqlite orders and compares timestamps like datetime2 does
+    ts = parse_utc(value)
+    return ts.isoformat(timespec="microseconds") if ts else None
+
+
+def sqlite_pool(directory=None):
+    # Offline backend: one sqlite file per database under `directory` (or in memory)
+    def connect(database):
+        path = ":memory:" if directory is None else os.path.join(directory, f"{database}.db")
+        return sqlite3.connect(path, check_same_thread=False)
+
+    # sqlite has a single writer anyway; in memory the data lives in that one connection
+    return DbApiPool(connect, serialize=True)
+
+
+_default_executor = None
+_default_lock = threading.Lock()
+_defaults = {"backend": None, "conn_str": None, "sqlcmd": {}}
+
+
+def configure_executor(backend=None, conn_str=None, **sqlcmd_options):
+    # A script's own defaults for get_executor(): backend, pyodbc connection string and
+    # SqlcmdSession keyword arguments. AGRO_SQL_* variables still take precedence.
+    global _default_executor
+    with _default_lock:
+        _defaults.update(backend=backend, conn_str=conn_str, sqlcmd=sqlcmd_options)
+        _default_executor = None
+
+
+def _sqlcmd_options():
+    options = dict(_defaults["sqlcmd"])
+    for key, var in SQLCMD_ENV.items():
+        value = os.environ.get(var)
+        if value is not None:
+            options[key] = value.lower() not in ("0", "false", "no") if key == "trust_cert" else value
+    return options
+
+
+def get_executor():
+    global _default_executor
+    with _default_lock:
+        if _default_executor is None:
+            backend = os.environ.get("AGRO_SQL_BACKEND") or _defaults["backend"] or DEFAULT_BACKEND
+            if backend == "sqlite":
+                _default_executor = sqlite_pool(os.environ.get("AGRO_SQLITE_DIR"))
+            elif backend == "pyodbc":
+                _default_executor = pyodbc_pool(os.environ.get("AGRO_SQL_CONN_STR") or _defaults["conn_str"])
+            else:
+                _default_executor = SqlcmdSession(**_sqlcmd_options())
+        return _default_executor
+
+
+def set_executor(executor):
+    global _default_executor
+    with _default_lock:
+        _default_executor = executor
+
+
+def run_sql_query(query, database):
+    return get_executor().query(query, database)
+
+
+def run_sql_batch(statements):
+    return get_executor().query_many(statements)
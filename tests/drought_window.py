@@ -0,0 +1,230 @@
+import argparse
+import bisect
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from alert_replay import DEFAULT_RULES, MICROS_PER_HOUR, Readings, load_csv
+from db_access import SCHEMA, db_timestamp, sqlite_pool
+
+# Incremental model of the "Risco de Seca" rule.
+# MotorDeAlertas re-reads the talhao's last 24h of dbo.Leitura on every message
+# and checks All(< 30), so each reading costs work proportional to the readings
+# in the window. DroughtWindow keeps, per talhao, a deque of (DataHoraCapturaUtc,
+# below limit?) plus how many entries are at or above the limit. A reading is
+# appended, expired entries are popped from the left, and the rule becomes two
+# integer comparisons: O(1) amortised per reading.
+#
+# SqlDroughtRule runs the repository's two queries against sqlite with the same
+# schema. cross_check() feeds both the same readings and reports every
+# disagreement, so the model is checked against the SQL behaviour before it is
+# ported to the Analise service.
+
+SECA_LIKE = "%Risco de Seca%"
+
+
+def _micros_to_db(ts):
+    return db_timestamp(np.datetime64(int(ts), "us").astype(object))
+
+
+class _TalhaoWindow:
+    __slots__ = ("entries", "above", "last_alert")
+
+    def __init__(self):
+        self.entries = deque()    # (ts, below limit?) sorted by ts
+        self.above = 0            # entries at/above the limit or without humidity
+        self.last_alert = None    # generation time of the last drought alert
+
+
+class DroughtWindow:
+    """Per-talhao sliding 24h window for the drought rule.
+
+    observe() takes readings in processing order. `now` is the time the reading
+    is processed (GETUTCDATE() in the service) and defaults to its capture time.
+    Readings normally arrive in capture order and are appended at the right.
+    A late reading is inserted in place, which costs O(window) for that reading
+    only.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = rules
+        self.window = int(rules.drought_window_hours * MICROS_PER_HOUR)
+        self._talhoes = {}
+
+    def observe(self, talhao, ts, umidade, now=None):
+        # Records the reading; returns True when a "Risco de Seca" alert fires for it
+        now = ts if now is None else now
+        w = self._talhoes.get(talhao)
+        if w is None:
+            w = self._talhoes[talhao] = _TalhaoWindow()
+        # a null humidity fails "< 30", so it counts against the streak
+        below = umidade is not None and umidade < self.rules.drought_humidity
+        entries = w.entries
+        if not entries or entries[-1][0] <= ts:
+            entries.append((ts, below))
+        else:
+            entries.insert(bisect.bisect_right(entries, (ts, True)), (ts, below))
+        if not below:
+            w.above += 1
+
+        # GetLeiturasUltimas24HorasAsync: DataHoraCapturaUtc >= now - 24h
+        cutoff = now - self.window
+        while entries and entries[0][0] < cutoff:
+            if not entries.popleft()[1]:
+                w.above -= 1
+
+        # the rule only runs for readings that carry a humidity value
+        if umidade is None or len(entries) < self.rules.drought_min_readings or w.above:
+            return False
+        # ExisteAlertaRecenteAsync: DataHoraGeracaoUtc >= now - 24h
+        if w.last_alert is not None and w.last_alert >= cutoff:
+            return False
+        w.last_alert = now
+        return True
+
+    def __len__(self):
+        return sum(len(w.entries) for w in self._talhoes.values())
+
+
+class SqlDroughtRule:
+    """The drought rule as the service runs it: insert, query the window, check for a recent alert.
+
+    Uses the Analise schema from fake_stack on an in-memory sqlite database,
+    with `now` passed explicitly instead of GETUTCDATE().
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, pool=None):
+        self.rules = rules
+        self.window = int(rules.drought_window_hours * MICROS_PER_HOUR)
+        self.sql = pool or sqlite_pool()
+        self.sql.query_many([(s, "Analise") for s in SCHEMA["Analise"]])
+
+    def observe(self, talhao, ts, umidade, now=None):
+        now = ts if now is None else now
+        cutoff = _micros_to_db(now - self.window)
+        with self.sql.connection("Analise") as conn:
+            conn.execute("INSERT INTO Leitura (IdTalhao, DataHoraCapturaUtc, UmidadeSoloPercentual) VALUES (?, ?, ?)",
+                         (talhao, _micros_to_db(ts), umidade))
+            fired = False
+            if umidade is not None:
+                umidades = [r[0] for r in conn.execute(
+                    "SELECT UmidadeSoloPercentual FROM Leitura WHERE IdTalhao = ? AND DataHoraCapturaUtc >= ?",
+                    (talhao, cutoff))]
+                if len(umidades) >= self.rules.drought_min_readings and \
+                        all(u is not None and u < self.rules.drought_humidity for u in umidades):
+                    recente = conn.execute(
+                        "SELECT 1 FROM Alerta WHERE IdTalhao = ? AND Mensagem LIKE ? AND DataHoraGeracaoUtc >= ? LIMIT 1",
+                        (talhao, SECA_LIKE, cutoff)).fetchone()
+                    fired = recente is None
+            if fired:
+                conn.execute("INSERT INTO Alerta (IdTalhao, Mensagem, Nivel, DataHoraGeracaoUtc, LeituraId) VALUES (?, ?, ?, ?, ?)",
+                             (talhao, "Risco de Seca: Umidade abaixo de 30% por 24h", "Warning", _micros_to_db(now), 0))
+            conn.commit()
+        return fired
+
+
+def processing_order(readings):
+    # Capture order within each talhao, interleaved across talhoes by time, ties broken by Id
+    return np.lexsort((readings.ids, readings.ts))
+
+
+def run_model(model, readings, order=None, lag=None):
+    # Feeds every reading to `model`; returns (fired mask in `order`, seconds spent)
+    order = processing_order(readings) if order is None else order
+    talhoes, codes = readings.talhoes, readings.talhao[order].tolist()
+    ts, umid = readings.ts[order].tolist(), readings.umidade[order].tolist()
+    lag = [0] * len(order) if lag is None else lag
+    fired = np.zeros(len(order), dtype=bool)
+    now = None
+    started = time.perf_counter()
+    for i, (code, t, u, d) in enumerate(zip(codes, ts, umid, lag)):
+        # one FIFO consumer: processing time never goes backwards
+        now = t + d if now is None else max(now, t + d)
+        fired[i] = model.observe(talhoes[code], t, None if u != u else u, now)
+    return fired, time.perf_counter() - started
+
+
+def cross_check(readings, rules=DEFAULT_RULES, lag=None):
+    """Runs DroughtWindow and SqlDroughtRule over the same readings.
+
+    `lag` optionally gives each reading (in processing order) a processing
+    delay in microseconds, so the window is evaluated at capture time + lag.
+    Returns a report with the timings and the Ids of readings where they differ.
+    """
+    order = processing_order(readings)
+    incremental, t_incremental = run_model(DroughtWindow(rules), readings, order, lag)
+    reference, t_reference = run_model(SqlDroughtRule(rules), readings, order, lag)
+    mismatches = np.flatnonzero(incremental != reference)
+    n = max(len(order), 1)
+    return {
+        "readings": len(order),
+        "alerts": {"incremental": int(incremental.sum()), "sql": int(reference.sum())},
+        "mismatches": [int(readings.ids[order[i]]) for i in mismatches],
+        "usPerReading": {"incremental": round(t_incremental / n * 1e6, 2), "sql": round(t_reference / n * 1e6, 2)},
+        "speedup": round(t_reference / t_incremental, 1) if t_incremental else None,
+    }
+
+
+def synthetic_readings(talhoes=5, days=3, interval_seconds=600, seed=1):
+    # Humidity random walk around the 30% limit so drought streaks start and break; ~1% missing values
+    rng = np.random.default_rng(seed)
+    per_talhao = int(days * 86400 // interval_seconds)
+    n = talhoes * per_talhao
+    start = np.datetime64("2026-01-01T00:00:00", "us").astype(np.int64)
+    ts = start + np.tile(np.arange(per_talhao, dtype=np.int64) * interval_seconds * 1000000, talhoes)
+    ts += rng.integers(0, interval_seconds * 1000000 // 2, n)
+    walk = np.cumsum(rng.normal(0, 0.8, (talhoes, per_talhao)), axis=1)
+    umidade = np.clip(25 + walk - walk.mean(axis=1, keepdims=True), 5, 60).ravel()
+    umidade[rng.random(n) < 0.01] = np.nan
+    return Readings(np.arange(1, n + 1), np.repeat(np.arange(talhoes), per_talhao),
+                    np.array([f"00000000-0000-0000-0000-{i:012d}" for i in range(talhoes)], dtype=object),
+                    ts, rng.uniform(10, 38, n), umidade)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Checks the incremental drought window against the SQL rule.")
+    parser.add_argument("--csv", help="SensorLeitura export to replay (default: synthetic readings)")
+    parser.add_argument("--talhoes", type=int, default=5)
+    parser.add_argument("--days", type=float, default=3)
+    parser.add_argument("--interval-seconds", type=int, nargs="+", default=[600],
+                        help="Reading interval(s) per talhao; one run per value")
+    parser.add_argument("--max-lag-seconds", type=float, default=0.0,
+                        help="Random processing delay per reading, as a queue backlog would add")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.csv:
+        try:
+            datasets = [(args.csv, load_csv(args.csv))]
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not load readings: {e}")
+            sys.exit(1)
+    else:
+        datasets = [(f"every {s}s", synthetic_readings(args.talhoes, args.days, s, args.seed))
+                    for s in args.interval_seconds]
+
+    print(f"{'input':<16}{'readings':>10}{'alerts':>8}{'mismatch':>10}{'sql us':>10}{'incr us':>10}{'speedup':>9}")
+    failed = False
+    for label, readings in datasets:
+        lag = None
+        if args.max_lag_seconds:
+            rng = np.random.default_rng(args.seed)
+            lag = rng.integers(0, int(args.max_lag_seconds * 1000000) + 1, len(readings)).tolist()
+        r = cross_check(readings, lag=lag)
+        failed |= bool(r["mismatches"])
+        print(f"{label:<16}{r['readings']:>10}{r['alerts']['sql']:>8}{len(r['mismatches']):>10}"
+              f"{r['usPerReading']['sql']:>10}{r['usPerReading']['incremental']:>10}{r['speedup']:>8}x")
+        if r["mismatches"]:
+            print(f"  ❌ Readings where the models disagree (Id): {r['mismatches'][:20]}")
+    if failed:
+        sys.exit(1)
+    print("\n✅ Incremental window matches the SQL rule on every reading.")
+
+
+if __name__ == "__main__":
+    main()
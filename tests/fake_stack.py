@@ -0,0 +1,708 @@
+import argparse
+import base64
+import datetime
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from db_access import SCHEMA, db_timestamp, parse_utc, sqlite_pool
+from instrumentation import Registry, route_of
+
+# In-process stand-in for Usuarios / Propriedades / Ingestao / Analise, so the
+# Python tooling can run without the Kubernetes cluster and SQL Server.
+# Each service listens on its own port (0 = ephemeral; the CLI uses the NodePorts
+# 30001-30004); RabbitMQ is replaced by a queue.Queue consumed by an "Analise"
+# worker thread, and SQL Server by a shared in-memory sqlite database per service
+# (same table names). Every service serves /health/* and a Prometheus /metrics
+# with the same metric names as the real ones. Latency and errors can be injected
+# per service (Faults) from a fixed seed, so runs are repeatable. Optionally the
+# services also write their log lines (Serilog compact JSON) and OpenTelemetry
+# spans (OTLP/JSON) to files, like the real pods do to stdout and Jaeger.
+
+SERVICES = ("usuarios", "propriedades", "ingestao", "analise")
+DEFAULT_PORTS = (30001, 30002, 30003, 30004)
+TOKEN_LIFETIME_SECONDS = 8 * 3600
+
+# MotorDeAlertas drought rule: >= 10 readings in the last 24h, all below 30%
+SECA_JANELA = datetime.timedelta(hours=24)
+SECA_MIN_LEITURAS = 10
+SECA_LIMITE_UMIDADE = 30
+SECA_MENSAGEM = "Risco de Seca: Umidade abaixo de 30% por 24h"
+
+def utcnow_iso():
+    return datetime.datetime.utcnow().isoformat(timespec="milliseconds")
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).rstrip(b"=").decode()
+
+
+def make_token(email, user_id, lifetime=TOKEN_LIFETIME_SECONDS):
+    # Same claims layout as TokenService (unsigned: the fake stack only looks tokens up)
+    now = int(time.time())
+    payload = {"email": email, "role": "Produtor", "UsuarioId": str(user_id),
+               "nbf": now, "exp": now + lifetime, "iat": now,
+               "iss": "AgroSolutions", "aud": "AgroSolutions", "jti": uuid.uuid4().hex}
+    return f"{_b64({'alg': 'none', 'typ': 'JWT'})}.{_b64(payload)}.fake"
+
+
+def avaliar_leitura(leitura):
+    # Threshold rules of MotorDeAlertas.AvaliarLeituraAsync
+    alertas = []
+    temp = leitura.get("temperaturaCelsius")
+    umid = leitura.get("umidadeSoloPercentual")
+    if temp is not None:
+        if temp > 35:
+            alertas.append(("Temperatura Crítica (> 35°C)", "Critical"))
+        elif temp < 0:
+            alertas.append(("Risco de Geada (< 0°C)", "Warning"))
+    if umid is not None and umid < 20:
+        alertas.append(("Seca Extrema (Umidade < 20%)", "Critical"))
+    return alertas
+
+
+class Faults:
+    """Injected latency and errors for one service.
+
+    Each request waits `latency` seconds plus a uniform [0, jitter) extra and then
+    fails with `error_status` with probability `error_rate`. Draws come from a
+    Random seeded with `seed`, so the same request order gives the same faults.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.seed = seed
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        # -> (delay in seconds, status to fail with or None)
+        with self._lock:
+            delay = self.latency + (self._rnd.random() * self.jitter if self.jitter else 0.0)
+            fail = self.error_rate > 0 and self._rnd.random() < self.error_rate
+        return delay, (self.error_status if fail else None)
+
+    def __repr__(self):
+        return (f"Faults(latency={self.latency}, jitter={self.jitter}, error_rate={self.error_rate}, "
+                f"error_status={self.error_status}, seed={self.seed})")
+
+
+class Telemetry:
+    """Log lines and spans written by the fake services.
+
+    Logs are RenderedCompactJsonFormatter lines ("@t", "@m", "@tr", "@sp" plus
+    the message properties), as the services print them; spans are written one
+    OTLP/JSON {"resourceSpans": [...]} object per line, the collector's file
+    exporter format. Either path may be None; with both None nothing is recorded.
+    """
+
+    SPAN_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+
+    def __init__(self, log_path=None, spans_path=None):
+        self._logs = open(log_path, "a", encoding="utf-8") if log_path else None
+        self._spans = open(spans_path, "a", encoding="utf-8") if spans_path else None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._logs is not None or self._spans is not None
+
+    @staticmethod
+    def new_trace():
+        return uuid.uuid4().hex
+
+    def _write(self, f, record):
+        with self._lock:
+            f.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+            f.flush()
+
+    def log(self, service, trace_id, span_id, message, level="Information", **properties):
+        if self._logs is None:
+            return
+        # .NET prints 7 fractional digits
+        record = {"@t": datetime.datetime.utcnow().isoformat(timespec="microseconds") + "0Z", "@m": message}
+        if level != "Information":
+            record["@l"] = level
+        if trace_id:
+            record.update({"@tr": trace_id, "@sp": span_id})
+        record.update(properties)
+        record.update({"Application": service, "TraceId": trace_id, "SpanId": span_id})
+        self._write(self._logs, record)
+
+    @contextmanager
+    def span(self, service, name, trace_id, parent_id=None, kind="internal", **attributes):
+        # yields {"id", "attributes"}; attributes added inside the block are exported too
+        span = {"id": uuid.uuid4().hex[:16] if self.enabled else None, "attributes": attributes}
+        start = time.time_ns()
+        try:
+            yield span
+        finally:
+            if self._spans is not None:
+                self._write(self._spans, {"resourceSpans": [{
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                    "scopeSpans": [{"spans": [{
+                        "traceId": trace_id, "spanId": span["id"], "parentSpanId": parent_id or "", "name": name,
+                        "kind": self.SPAN_KINDS[kind], "startTimeUnixNano": str(start),
+                        "endTimeUnixNano": str(time.time_ns()),
+                        "attributes": [{"key": k, "value": {"stringValue": str(v)}}
+                                       for k, v in span["attributes"].items()]}]}]}]})
+
+    def close(self):
+        for f in (self._logs, self._spans):
+            if f is not None:
+                f.close()
+
+
+class FakeStack:
+    def __init__(self, host="127.0.0.1", ports=(0, 0, 0, 0), batch_endpoint=False, faults=None, consumer_delay=0.0,
+                 sql_dir=None, log_path=None, spans_path=None):
+        self.host = host
+        # serve POST /api/v1/leituras-sensores/lote (a bulk route the real Ingestao does not have)
+        self.batch_endpoint = batch_endpoint
+        # service -> Faults; change at runtime with set_faults()
+        self.faults = dict(faults or {})
+        # seconds the Analise consumer spends on each message before processing it
+        self.consumer_delay = consumer_delay
+        # sqlite files under sql_dir let other processes run the SQL checks; default in memory
+        self.sql = sqlite_pool(sql_dir)
+        self.telemetry = Telemetry(log_path, spans_path)
+        for database, statements in SCHEMA.items():
+            self.sql.query_many([(s, database) for s in statements])
+        self.tokens = {}
+        self.events = queue.Queue()
+        # one registry per service, exported on its /metrics
+        self.metrics = {service: Registry() for service in SERVICES}
+        self._lock = threading.Lock()
+        self._servers = {}
+        self._threads = []
+        self._ports = dict(zip(SERVICES, ports))
+
+    # -- lifecycle -------------------------------------------------------
+    def start(self):
+        for service, port in self._ports.items():
+            server = ThreadingHTTPServer((self.host, port), _Handler)
+            server.daemon_threads = True
+            server.stack = self
+            server.service = service
+            self._servers[service] = server
+            t = threading.Thread(target=server.serve_forever, daemon=True)
+            t.start()
+            self._threads.append(t)
+        worker = threading.Thread(target=self._analise_worker, daemon=True)
+        worker.start()
+        self._threads.append(worker)
+        return self
+
+    def stop(self):
+        for server in self._servers.values():
+            server.shutdown()
+            server.server_close()
+        self.events.put(None)
+        # the analise worker is the last thread; let it drain before the telemetry files close
+        for t in self._threads[-1:]:
+            t.join(5)
+        self.telemetry.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def url(self, service):
+        host, port = self._servers[service].server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def urls(self):
+        return {service: self.url(service) for service in self._servers}
+
+    def set_faults(self, service, faults=None, **kwargs):
+        # set_faults("ingestao", latency=0.05, error_rate=0.01, seed=1); no arguments clears them
+        if faults is None and kwargs:
+            faults = Faults(**kwargs)
+        self.faults[service] = faults
+
+    # -- "Analise" consumer ---------------------------------------------------
+    def _analise_worker(self):
+        histogram = self.metrics["analise"].histogram("agrosolutions_alerts_processing_duration_seconds")
+        while True:
+            evento = self.events.get()
+            if evento is None:
+                return
+            if self.consumer_delay:
+                time.sleep(self.consumer_delay)
+            started = time.perf_counter()
+            try:
+                self._processar(evento)
+            except Exception as e:
+                # the real consumer logs and nacks; one bad message must not stop the worker
+                print(f"❌ Fake Analise failed on event {evento.get('eventId')}: {e}")
+                continue
+            histogram.record(time.perf_counter() - started)
+
+    def _processar(self, evento):
+        # RabbitMqLeiturasConsumer: save the Leitura, run MotorDeAlertas, save each Alerta
+        tel = self.telemetry
+        # nothing carries the trace context through the queue, so each message starts its own trace
+        trace = tel.new_trace() if tel.enabled else None
+        with tel.span("analise", "LeituraSensorRecebida process", trace, kind="consumer",
+                      **{"messaging.system": "rabbitmq"}) as consumer:
+            tel.log("analise", trace, consumer["id"], f"MSG RECEBIDA: {json.dumps(evento)}", Json=json.dumps(evento))
+            leitura = evento["leitura"]
+            metricas = leitura.get("metricas") or {}
+            talhao = leitura["idTalhao"]
+            umid = metricas.get("umidadeSoloPercentual")
+            tel.log("analise", trace, consumer["id"],
+                    f"Processando leitura: U={umid}, T={metricas.get('temperaturaCelsius')}",
+                    Umidade=umid, Temperatura=metricas.get("temperaturaCelsius"))
+            with self.sql.connection("Analise") as conn:
+                with tel.span("analise", "INSERT Leitura", trace, consumer["id"], "client", **{"db.system": "mssql"}):
+                    conn.execute(
+                        "INSERT INTO Leitura (IdTalhao, DataHoraCapturaUtc, TemperaturaCelsius, UmidadeSoloPercentual, "
+                        "PrecipitacaoMilimetros) VALUES (?, ?, ?, ?, ?)",
+                        (talhao, db_timestamp(leitura["dataHoraCapturaUtc"]), metricas.get("temperaturaCelsius"),
+                         umid, metricas.get("precipitacaoMilimetros")))
+                alertas = avaliar_leitura(metricas)
+                if umid is not None:
+                    with tel.span("analise", "SELECT Leitura", trace, consumer["id"], "client", **{"db.system": "mssql"}):
+                        seca = self._risco_de_seca(conn, talhao)
+                    if seca:
+                        alertas.append((SECA_MENSAGEM, "Warning"))
+                for mensagem, nivel in alertas:
+                    # the consumer never reads back the Leitura id, so LeituraId is always 0
+                    with tel.span("analise", "INSERT Alerta", trace, consumer["id"], "client", **{"db.system": "mssql"}):
+                        conn.execute("INSERT INTO Alerta (IdTalhao, Mensagem, Nivel, DataHoraGeracaoUtc, LeituraId) "
+                                     "VALUES (?, ?, ?, ?, ?)",
+                                     (talhao, mensagem, nivel, db_timestamp(datetime.datetime.utcnow()), 0))
+                        conn.commit()
+                    tel.log("analise", trace, consumer["id"], f"ALERTA GERADO: {mensagem} (Talhao: {talhao})", "Warning",
+                            Mensagem=mensagem, Talhao=talhao)
+                conn.commit()
+
+    @staticmethod
+    def _risco_de_seca(conn, talhao):
+        # GetLeiturasUltimas24HorasAsync + All(< 30) + ExisteAlertaRecenteAsync, all relative to GETUTCDATE()
+        corte = db_timestamp(datetime.datetime.utcnow() - SECA_JANELA)
+        umidades = [r[0] for r in conn.execute(
+            "SELECT UmidadeSoloPercentual FROM Leitura WHERE IdTalhao = ? AND DataHoraCapturaUtc >= ?", (talhao, corte))]
+        # null < 30 is false in C#, so a reading without humidity breaks the streak
+        if len(umidades) < SECA_MIN_LEITURAS or not all(u is not None and u < SECA_LIMITE_UMIDADE for u in umidades):
+            return False
+        recente = conn.execute(
+            "SELECT 1 FROM Alerta WHERE IdTalhao = ? AND Mensagem LIKE ? AND DataHoraGeracaoUtc >= ? LIMIT 1",
+            (talhao, "%Risco de Seca%", corte)).fetchone()
+        return recente is None
+
+    # -- helpers used by the handler ---------------------------------------
+    def execute(self, database, sql, params=()):
+        with self.sql.connection(database) as conn:
+            cur = conn.execute(sql, params)
+            rows = cur.fetchall()
+            conn.commit()
+            return rows, cur.lastrowid
+
+    def talhao_owned_by(self, talhao_id, user):
+        rows, _ = self.execute(
+            "Propriedades",
+            "SELECT t.Id, t.PropriedadeId, t.Nome, t.Cultura, t.Area, p.OwnerUserId FROM Talhoes t "
+            "JOIN Propriedades p ON p.Id = t.PropriedadeId WHERE t.Id = ?", (talhao_id,))
+        if not rows or rows[0][5] != user:
+            return None
+        return _talhao(rows[0])
+
+    def user_for(self, headers):
+        auth = headers.get("Authorization", "")
+        if not auth.startswith("Bearer "):
+            return None
+        with self._lock:
+            return self.tokens.get(auth[7:])
+
+
+def _talhao(row):
+    return {"id": row[0], "propriedadeId": row[1], "nome": row[2], "cultura": row[3], "area": row[4]}
+
+
+_SQL_EPOCH = datetime.datetime(1900, 1, 1)
+
+
+def agrupar(rows, minutos):
+    # DATEADD(minute, DATEDIFF(minute, 0, DataHoraCapturaUtc) / N * N, 0) with AVG/AVG/SUM,
+    # over SensorLeitura rows in SELECT order (Id, IdPropriedade, IdTalhao, Origem, DataHora, U, T, P, ...)
+    buckets = {}
+    for r in rows:
+        minuto = int((parse_utc(r[4]) - _SQL_EPOCH).total_seconds() // 60)
+        buckets.setdefault(minuto // minutos * minutos, []).append(r)
+    out = []
+    for inicio in sorted(buckets):
+        grupo = buckets[inicio]
+        valores = [[g[i] for g in grupo if g[i] is not None] for i in (5, 6, 7)]
+        umid, temp, chuva = valores
+        out.append((0, grupo[0][1], grupo[0][2], "agregado", db_timestamp(_SQL_EPOCH + datetime.timedelta(minutes=inicio)),
+                    sum(umid) / len(umid) if umid else None, sum(temp) / len(temp) if temp else None,
+                    sum(chuva) if chuva else None, None, None))
+    return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes; without this Nagle + delayed ACK add ~40ms per response
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    # -- plumbing ----------------------------------------------------------
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return None
+
+    def _send(self, status, payload=None, content_type="application/json"):
+        if payload is None:
+            body = b""
+        elif isinstance(payload, (bytes, str)):
+            body = payload.encode() if isinstance(payload, str) else payload
+        else:
+            body = json.dumps(payload).encode()
+        self._status = status
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _text(self, status, message):
+        self._send(status, message, "text/plain; charset=utf-8")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        stack = self.server.stack
+        service = self.server.service
+        split = urlsplit(self.path)
+        path = split.path.rstrip("/")
+        self.query = {k: v[-1] for k, v in parse_qs(split.query).items()}
+        parts = [p for p in path.split("/") if p]
+        lowered = [p.lower() for p in parts]
+
+        # probes and scrapes are never delayed or failed, like the real sidecar-free endpoints
+        if method == "GET" and lowered == ["metrics"]:
+            self._send(200, stack.metrics[service].to_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+            return
+        if method == "GET" and lowered[:1] == ["health"]:
+            self._send(200, "Healthy", "text/plain")
+            return
+
+        started = time.perf_counter()
+        self._status = None
+        tel = stack.telemetry
+        # W3C traceparent from the caller, else a new trace, as the ASP.NET Core instrumentation does
+        parent = (self.headers.get("traceparent") or "").split("-")
+        self.trace_id = (parent[1] if len(parent) == 4 else tel.new_trace()) if tel.enabled else None
+        with tel.span(service, f"{method} {route_of(path).lstrip('/')}", self.trace_id,
+                      parent[2] if len(parent) == 4 else None, "server",
+                      **{"http.request.method": method, "url.path": path}) as server:
+            self.span_id = server["id"]
+            tel.log(service, self.trace_id, self.span_id, f"Request starting HTTP/1.1 {method} {self.path}",
+                    Method=method, Path=path, RequestPath=path)
+            faults = stack.faults.get(service)
+            delay, fail = faults.draw() if faults else (0.0, None)
+            if delay:
+                time.sleep(delay)
+            if fail:
+                # drain the body so the keep-alive connection stays usable
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self._send(fail, {"title": "Injected fault", "status": fail})
+            elif not getattr(self, f"_{service}")(stack, method, lowered, parts):
+                self._send(404, {"title": "Not Found"})
+            server["attributes"]["http.response.status_code"] = self._status
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            tel.log(service, self.trace_id, self.span_id,
+                    f"Request finished HTTP/1.1 {method} {self.path} - {self._status} {elapsed_ms:.4f}ms",
+                    ElapsedMilliseconds=round(elapsed_ms, 4), StatusCode=self._status, Method=method, Path=path,
+                    RequestPath=path)
+        # same name and labels as the ASP.NET Core meter the Grafana dashboard reads
+        stack.metrics[service].histogram(
+            "http_server_request_duration_seconds", http_request_method=method, http_route=route_of(path),
+            http_response_status_code=self._status).record(time.perf_counter() - started)
+
+    # -- Usuarios ------------------------------------------------------------
+    def _usuarios(self, stack, method, lowered, parts):
+        if method != "POST" or lowered[:2] != ["api", "usuarios"] or len(lowered) != 3:
+            return False
+        body = self._body() or {}
+        if lowered[2] == "registrar":
+            rows, _ = stack.execute("Usuarios", "SELECT Id FROM Usuarios WHERE Email = ?", (body.get("email"),))
+            if rows:
+                self._text(400, "E-mail já cadastrado.")
+                return True
+            stack.execute("Usuarios", "INSERT INTO Usuarios (Email, Senha, TipoId) VALUES (?, ?, ?)",
+                          (body.get("email"), body.get("senha"), body.get("tipoId")))
+            self._send(200, {"mensagem": "Usuário criado com sucesso!"})
+            return True
+        if lowered[2] == "login":
+            rows, _ = stack.execute("Usuarios", "SELECT Id, Senha FROM Usuarios WHERE Email = ?", (body.get("email"),))
+            if not rows or rows[0][1] != body.get("password"):
+                self._text(401, "E-mail ou senha incorretos.")
+                return True
+            token = make_token(body["email"], rows[0][0])
+            with stack._lock:
+                stack.tokens[token] = str(rows[0][0])
+            self._send(200, {"token": token})
+            return True
+        return False
+
+    # -- Propriedades ----------------------------------------------------------
+    def _propriedades(self, stack, method, lowered, parts):
+        if lowered[:3] != ["api", "v1", "propriedades"]:
+            return False
+        rest, raw = lowered[3:], parts[3:]
+
+        if method == "GET" and rest == ["admin", "simulacao", "talhoes"]:
+            # [AllowAnonymous]: every talhao, read by the Simulador
+            rows, _ = stack.execute("Propriedades", "SELECT Id, PropriedadeId, Nome, Cultura, Area FROM Talhoes")
+            self._send(200, [_talhao(r) for r in rows])
+            return True
+
+        user = stack.user_for(self.headers)
+        if user is None:
+            self._send(401)
+            return True
+
+        if not rest and method == "GET":
+            rows, _ = stack.execute("Propriedades", "SELECT Id, Nome, Localizacao FROM Propriedades WHERE OwnerUserId = ?",
+                                    (user,))
+            self._send(200, [{"id": r[0], "nome": r[1], "localizacao": r[2]} for r in rows])
+            return True
+
+        if not rest and method == "POST":
+            body = self._body() or {}
+            prop_id = str(uuid.uuid4())
+            stack.execute("Propriedades", "INSERT INTO Propriedades (Id, Nome, Localizacao, OwnerUserId) VALUES (?, ?, ?, ?)",
+                          (prop_id, body.get("nome"), body.get("localizacao"), user))
+            self._send(201, {"id": prop_id, "nome": body.get("nome"), "localizacao": body.get("localizacao")})
+            return True
+
+        if len(rest) == 2 and rest[1] == "talhoes":
+            rows, _ = stack.execute("Propriedades", "SELECT OwnerUserId FROM Propriedades WHERE Id = ?", (raw[0],))
+            if not rows or rows[0][0] != user:
+                self._text(404, "Propriedade não encontrada")
+                return True
+            if method == "GET":
+                rows, _ = stack.execute("Propriedades", "SELECT Id, PropriedadeId, Nome, Cultura, Area FROM Talhoes "
+                                        "WHERE PropriedadeId = ?", (raw[0],))
+                self._send(200, [_talhao(r) for r in rows])
+                return True
+            body = self._body() or {}
+            talhao_id = str(uuid.uuid4())
+            stack.execute("Propriedades", "INSERT INTO Talhoes (Id, PropriedadeId, Nome, Cultura, Area) VALUES (?, ?, ?, ?, ?)",
+                          (talhao_id, raw[0], body.get("nome"), body.get("cultura"), body.get("area")))
+            self._send(201, {"id": talhao_id, "propriedadeId": raw[0], "nome": body.get("nome"),
+                             "cultura": body.get("cultura"), "area": body.get("area")})
+            return True
+
+        if method == "GET" and len(rest) == 2 and rest[0] == "talhoes":
+            talhao = stack.talhao_owned_by(raw[1], user)
+            if talhao is None:
+                self._text(404, "Talhão não encontrado.")
+                return True
+            self._send(200, talhao)
+            return True
+        return False
+
+    # -- Ingestao --------------------------------------------------------------
+    def _ingestao(self, stack, method, lowered, parts):
+        if lowered[:3] != ["api", "v1", "leituras-sensores"]:
+            return False
+        batch = lowered[3:] == ["lote"]
+        if not (lowered[3:] == [] or (batch and stack.batch_endpoint and method == "POST")):
+            return False
+        user = stack.user_for(self.headers)
+        if user is None:
+            self._send(401)
+            return True
+        if method == "GET":
+            self._consultar(stack)
+            return True
+        body = self._body()
+        if not batch:
+            self._send(*self._ingest_one(stack, user, body))
+            return True
+        # optional bulk route (not in the real API): one result per reading, in order
+        if not isinstance(body, list):
+            self._send(400, {"title": "One or more validation errors occurred."})
+            return True
+        results = []
+        for item in body:
+            status, payload = self._ingest_one(stack, user, item)
+            results.append(dict(payload, status=status))
+        self._send(200, results)
+        return True
+
+    def _ingest_one(self, stack, user, body):
+        if not isinstance(body, dict) or "idTalhao" not in body or parse_utc(body.get("dataHoraCapturaUtc")) is None:
+            return 400, {"title": "One or more validation errors occurred."}
+        tel = stack.telemetry
+        # ValidateTalhaoOwnershipAsync (in-process instead of an HTTP hop)
+        with tel.span("ingestao", "GET", self.trace_id, self.span_id, "client",
+                      **{"url.full": f"/api/v1/Propriedades/talhoes/{body['idTalhao']}", "peer.service": "propriedades"}):
+            owned = stack.talhao_owned_by(body["idTalhao"], user)
+        if owned is None:
+            tel.log("ingestao", self.trace_id, self.span_id, f"Access forbidden for Talhão {body['idTalhao']}", "Warning",
+                    TalhaoId=body["idTalhao"])
+            return 403, {"title": "Forbidden", "detail": "Você não tem permissão para enviar leituras para este talhão."}
+        metricas = body.get("metricas") or {}
+        if all(metricas.get(k) is None for k in ("umidadeSoloPercentual", "temperaturaCelsius", "precipitacaoMilimetros")):
+            return 400, {"errors": {"metricas": ["Informe ao menos uma métrica (umidade/temperatura/precipitação)."]}}
+        meta = body.get("meta") or {}
+        stack.metrics["ingestao"].counter("agrosolutions_sensor_readings", propriedade_id=body.get("idPropriedade"),
+                                          talhao_id=body["idTalhao"]).inc()
+        with tel.span("ingestao", "INSERT SensorLeitura", self.trace_id, self.span_id, "client", **{"db.system": "mssql"}):
+            _, leitura_id = stack.execute(
+                "Ingestao",
+                "INSERT INTO SensorLeitura (IdPropriedade, IdTalhao, Origem, DataHoraCapturaUtc, UmidadeSoloPercentual, "
+                "TemperaturaCelsius, PrecipitacaoMilimetros, IdDispositivo, CorrelationId) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (body.get("idPropriedade"), body["idTalhao"], body.get("origem"), db_timestamp(body["dataHoraCapturaUtc"]),
+                 metricas.get("umidadeSoloPercentual"), metricas.get("temperaturaCelsius"),
+                 metricas.get("precipitacaoMilimetros"), meta.get("idDispositivo"), meta.get("correlationId")))
+        tel.log("ingestao", self.trace_id, self.span_id,
+                f"Leitura recebida. Id={leitura_id} Talhao={body['idTalhao']} CapturaUtc={body['dataHoraCapturaUtc']} "
+                f"Origem={body.get('origem')}",
+                Id=leitura_id, IdTalhao=body["idTalhao"], DataHoraCapturaUtc=body["dataHoraCapturaUtc"],
+                Origem=body.get("origem"))
+        with tel.span("ingestao", "agrosolutions.leituras publish", self.trace_id, self.span_id, "producer",
+                      **{"messaging.system": "rabbitmq"}):
+            stack.events.put({"eventType": "LeituraRecebida", "eventId": str(uuid.uuid4()),
+                              "occurredAtUtc": utcnow_iso() + "Z", "leitura": dict(body, id=leitura_id)})
+        return 201, {"id": leitura_id}
+
+    def _consultar(self, stack):
+        # LeiturasSensoresController GET: raw rows in [deUtc, ateUtc), or one row per agruparMinutos bucket
+        talhao = self.query.get("idTalhao")
+        de, ate = parse_utc(self.query.get("deUtc", "")), parse_utc(self.query.get("ateUtc", ""))
+        if not talhao:
+            self._text(400, "idTalhao é obrigatório.")
+            return
+        if de is None or ate is None or ate <= de:
+            self._text(400, "Intervalo inválido. Informe deUtc e ateUtc (ateUtc > deUtc).")
+            return
+        rows, _ = stack.execute(
+            "Ingestao",
+            "SELECT Id, IdPropriedade, IdTalhao, Origem, DataHoraCapturaUtc, UmidadeSoloPercentual, TemperaturaCelsius, "
+            "PrecipitacaoMilimetros, IdDispositivo, CorrelationId FROM SensorLeitura "
+            "WHERE IdTalhao = ? AND DataHoraCapturaUtc >= ? AND DataHoraCapturaUtc < ? ORDER BY DataHoraCapturaUtc ASC",
+            (talhao, db_timestamp(de), db_timestamp(ate)))
+        minutos = self.query.get("agruparMinutos")
+        if minutos and minutos.isdigit() and int(minutos) > 0:
+            rows = agrupar(rows, int(minutos))
+        self._send(200, [{
+            "id": r[0], "idPropriedade": r[1], "idTalhao": r[2], "origem": r[3], "dataHoraCapturaUtc": r[4],
+            "metricas": {"umidadeSoloPercentual": r[5], "temperaturaCelsius": r[6], "precipitacaoMilimetros": r[7]},
+            "meta": {"idDispositivo": r[8], "correlationId": r[9]},
+        } for r in rows])
+
+    # -- Analise ---------------------------------------------------------------
+    _ANALISE_ROUTES = {
+        "leituras": ("Leitura", "DataHoraCapturaUtc", ("id", "idTalhao", "dataHoraCapturaUtc", "temperaturaCelsius",
+                                                       "umidadeSoloPercentual", "precipitacaoMilimetros")),
+        "alertas": ("Alerta", "DataHoraGeracaoUtc", ("id", "idTalhao", "mensagem", "nivel", "dataHoraGeracaoUtc",
+                                                     "leituraId")),
+    }
+
+    def _analise(self, stack, method, lowered, parts):
+        if method != "GET" or lowered[:3] != ["api", "v1", "analise"] or len(lowered) != 4:
+            return False
+        route = self._ANALISE_ROUTES.get(lowered[3])
+        if route is None:
+            return False
+        if stack.user_for(self.headers) is None:
+            self._send(401)
+            return True
+        table, order, fields = route
+        top = self.query.get("top", "100")
+        if not top.isdigit():
+            self._send(400, {"title": "One or more validation errors occurred."})
+            return True
+        columns = ", ".join(f[0].upper() + f[1:] for f in fields)
+        sql, params = f"SELECT {columns} FROM {table}", []
+        if self.query.get("idTalhao"):
+            sql += " WHERE IdTalhao = ?"
+            params.append(self.query["idTalhao"])
+        rows, _ = stack.execute("Analise", f"{sql} ORDER BY {order} DESC LIMIT ?", params + [int(top)])
+        self._send(200, [dict(zip(fields, r)) for r in rows])
+        return True
+
+
+def _per_service(values, cast):
+    # ["ingestao=0.05", "0.01"] -> {"ingestao": 0.05, "*": 0.01}
+    out = {}
+    for item in values or []:
+        service, _, value = item.rpartition("=")
+        out[service.lower() or "*"] = cast(value)
+    return out
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the fake AgroSolutions stack on the cluster NodePorts.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ports", type=int, nargs=4, default=DEFAULT_PORTS,
+                        metavar=("USUARIOS", "PROPRIEDADES", "INGESTAO", "ANALISE"))
+    parser.add_argument("--latency", action="append", metavar="[SERVICE=]SECONDS", help="Added latency per request")
+    parser.add_argument("--jitter", action="append", metavar="[SERVICE=]SECONDS", help="Uniform extra latency")
+    parser.add_argument("--error-rate", action="append", metavar="[SERVICE=]FRACTION", help="Share of requests failed")
+    parser.add_argument("--error-status", type=int, default=503, help="Status returned by injected errors")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the fault draws")
+    parser.add_argument("--consumer-delay", type=float, default=0.0, help="Seconds per message in the Analise consumer")
+    parser.add_argument("--batch-endpoint", action="store_true", help="Also serve POST /api/v1/leituras-sensores/lote")
+    parser.add_argument("--sql-dir", help="Keep the databases as sqlite files here (default: in memory)")
+    parser.add_argument("--log-file", help="Write the services' log lines (Serilog compact JSON) here")
+    parser.add_argument("--spans-file", help="Write OpenTelemetry spans (OTLP/JSON lines) here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = {"latency": _per_service(args.latency, float), "jitter": _per_service(args.jitter, float),
+                "error_rate": _per_service(args.error_rate, float)}
+    faults = {}
+    for i, service in enumerate(SERVICES):
+        values = {name: given.get(service, given.get("*", 0.0)) for name, given in settings.items()}
+        if any(values.values()):
+            # a different seed per service, so their draws are independent but still repeatable
+            faults[service] = Faults(error_status=args.error_status, seed=args.seed + i, **values)
+
+    stack = FakeStack(args.host, args.ports, args.batch_endpoint, faults, args.consumer_delay,
+                      args.sql_dir, args.log_file, args.spans_file).start()
+    print("🚀 Fake AgroSolutions stack running:")
+    for service, url in stack.urls.items():
+        print(f"  {service:<13}{url}  {faults.get(service) or ''}")
+    print("Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stack.stop()
+
+
+if __name__ == "__main__":
+    main()
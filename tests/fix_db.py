@@ -1,28 +1,23 @@
-import subprocess
+import db_access
 
 NAMESPACE = "agrosolutions-local"
 SQL_POD_SELECTOR = "app=sql-server"
 
-def get_sql_pod_name():
-    cmd = f"kubectl get pods -n {NAMESPACE} -l {SQL_POD_SELECTOR} -o jsonpath={{.items[0].metadata.name}}"
-    res = subprocess.run(["powershell", "-c", cmd], capture_output=True, text=True)
-    return res.stdout.strip()
+# Older image: mssql-tools (no -C flag). Statements go through db_access.get_executor(), so
+# AGRO_SQL_BACKEND / AGRO_SQLCMD_PATH / AGRO_SQLCMD_TRUST_CERT can point it elsewhere.
+SQLCMD_PATH = "/opt/mssql-tools/bin/sqlcmd"
 
 def run_sql(query, database):
-    pod_name = get_sql_pod_name()
-    if not pod_name:
-        print("❌ Could not find SQL Pod.")
-        return
-    
     print(f"Executing on {database}: {query}")
-    cmd_str = f'kubectl exec -n {NAMESPACE} {pod_name} -- /opt/mssql-tools/bin/sqlcmd -S localhost -U sa -P "Fi@p2026" -d {database} -Q "{query}" -h -1'
-    res = subprocess.run(["powershell", "-c", cmd_str], capture_output=True, text=True)
-    if res.returncode != 0:
-        print(f"❌ Error: {res.stderr}")
+    res = db_access.run_sql_query(query, database)
+    if res is None:
+        print("❌ Error executing statement.")
     else:
-        print(f"✅ Result: {res.stdout}")
+        print(f"✅ Result: {res}")
 
 def main():
+    db_access.configure_executor(namespace=NAMESPACE, selector=SQL_POD_SELECTOR, sqlcmd_path=SQLCMD_PATH,
+                                 trust_cert=False)
     print("🔧 Fixing Database Seeds...")
     # Fix TiposUsuarios
     # Check if exists first
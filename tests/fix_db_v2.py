@@ -1,45 +1,20 @@
-import subprocess
+import db_access
 
 NAMESPACE = "agrosolutions-local"
 SQL_POD_SELECTOR = "app=sql-server"
 
-def get_sql_pod_name():
-    # Run kubectl directly
-    cmd = ["kubectl", "get", "pods", "-n", NAMESPACE, "-l", SQL_POD_SELECTOR, "-o", "jsonpath={.items[0].metadata.name}"]
-    res = subprocess.run(cmd, capture_output=True, text=True)
-    if res.returncode != 0:
-        print(f"Error finding pod: {res.stderr}")
-        return None
-    return res.stdout.strip()
+# Statements go through db_access.get_executor() (AGRO_SQL_BACKEND, AGRO_SQL_* for sqlcmd)
 
 def run_sql(query, database):
-    pod_name = get_sql_pod_name()
-    if not pod_name:
-        print("❌ Could not find SQL Pod.")
-        return
-    
     print(f"Executing on {database}: {query}")
-    
-    k_args = [
-        "kubectl", "exec", "-n", NAMESPACE, pod_name, "--",
-        "/opt/mssql-tools18/bin/sqlcmd",
-        "-C",
-        "-S", "localhost",
-        "-U", "sa",
-        "-P", "Fi@p2026",
-        "-d", database,
-        "-Q", query,
-        "-h", "-1"
-    ]
-    
-    res = subprocess.run(k_args, capture_output=True, text=True)
-    if res.returncode != 0:
-        print(f"❌ Error: {res.stderr}")
-        print(f"Output: {res.stdout}")
+    res = db_access.run_sql_query(query, database)
+    if res is None:
+        print("❌ Error executing statement.")
     else:
-        print(f"✅ Result: {res.stdout}")
+        print(f"✅ Result: {res}")
 
 def main():
+    db_access.configure_executor(namespace=NAMESPACE, selector=SQL_POD_SELECTOR)
     print("🔧 Fixing Database Seeds...")
     
     # Fix TiposUsuarios
@@ -0,0 +1,393 @@
+import argparse
+import http.client
+import json
+import random
+import select
+import socket
+import sys
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import REGISTRY, InstrumentedSession
+from load_generator import INGEST_PATH, SIMULATION_FILE, load_targets, random_reading
+from token_manager import BASE_URL_USUARIOS, TokenManager
+
+# Batched submission of CriarLeituraSensorRequest payloads.
+# LeiturasSensoresController.CriarAsync takes one reading per POST, so at
+# thousands of talhoes per IntervaloSeconds the per-request overhead (headers,
+# auth, a round trip each) dominates. IngestClient.submit(readings) sends a whole
+# batch at once:
+#   batch     - one POST of a JSON array to BATCH_PATH, when Ingestao exposes it
+#   pipelined - HTTP/1.1 pipelining: a window of POSTs written back to back on
+#               one keep-alive connection, responses read afterwards in order
+#   single    - one POST at a time (the Simulador's current path; baseline)
+# "auto" probes the batch route once and falls back to pipelining on 404/405.
+# Every batch returns a BatchResult with its throughput.
+
+BASE_URL_INGESTAO = "http://localhost:30003"
+# Bulk route probed by mode="auto"; body is a JSON array of readings and the
+# response a JSON array of per-reading results ({"status": ..., "id": ...})
+BATCH_PATH = "/api/v1/leituras-sensores/lote"
+MODES = ("auto", "batch", "pipelined", "single")
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_PIPELINE_DEPTH = 32
+REQUEST_TIMEOUT_SECONDS = 30
+ACCEPTED = (200, 201, 202)
+
+BatchResult = namedtuple("BatchResult", ["mode", "sent", "accepted", "failed", "elapsed", "statuses"])
+
+
+def throughput(result):
+    return result.sent / result.elapsed if result.elapsed > 0 else None
+
+
+class _NoCloseFile:
+    # HTTPResponse closes its file when done; the pipelined reader must keep it
+    def __init__(self, fp):
+        self._fp = fp
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+    def close(self):
+        pass
+
+
+class _SocketShim:
+    # Hands every HTTPResponse the same buffered reader, so bytes read ahead
+    # for one response are still there for the next one
+    def __init__(self, fp):
+        self._fp = fp
+
+    def makefile(self, *args, **kwargs):
+        return _NoCloseFile(self._fp)
+
+
+class PipelinedConnection:
+    """One keep-alive HTTP/1.1 connection with request pipelining.
+
+    Up to `depth` requests are written before their responses are read; the
+    window keeps both sides' socket buffers from filling up. Readings are not
+    idempotent, so a request is re-sent only when it was never written: after a
+    failed write, or when the server announced the close (Connection: close)
+    before answering it. Written requests left unanswered by a dropped
+    connection are reported as failed instead, since the server may have
+    stored them.
+    """
+
+    def __init__(self, base_url, depth=DEFAULT_PIPELINE_DEPTH, timeout=REQUEST_TIMEOUT_SECONDS):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.depth = depth
+        self.timeout = timeout
+        self._sock = None
+        self._fp = None
+
+    def _connect(self):
+        self.close()
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._fp = self._sock.makefile("rb")
+
+    def _dropped(self):
+        # an idle keep-alive socket the server has closed reads as ready (EOF)
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _request(self, path, body, headers):
+        lines = [f"POST {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 "Content-Type: application/json", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+    def post_many(self, path, bodies, headers):
+        # Returns one status code per body (or an exception name), in order
+        statuses = [None] * len(bodies)
+        pending = list(range(len(bodies)))
+        retried = False
+        while pending:
+            if self._sock is None or self._dropped():
+                self._connect()
+            window = pending[:self.depth]
+            answered = 0
+            written = 0
+            try:
+                for i in window:
+                    # one request at a time, so a failed write leaves the earlier ones counted
+                    self._sock.sendall(self._request(path, bodies[i], headers))
+                    written += 1
+                for i in window:
+                    resp = http.client.HTTPResponse(_SocketShim(self._fp), method="POST")
+                    resp.begin()
+                    resp.read()
+                    statuses[i] = resp.status
+                    answered += 1
+                    if resp.will_close:
+                        self.close()
+                        break
+            except (OSError, http.client.HTTPException) as e:
+                self.close()
+                if written:
+                    # possibly stored by the server: failed, never re-sent. A request cut off
+                    # mid-write falls short of its Content-Length, so it goes back in pending.
+                    for i in window[answered:written]:
+                        statuses[i] = type(e).__name__
+                    pending = pending[written:]
+                    retried = False
+                    continue
+                if retried:
+                    # the connection fails right away: give up on the rest of the batch
+                    for i in pending:
+                        statuses[i] = type(e).__name__
+                    return statuses
+                retried = True
+                continue
+            retried = False
+            pending = pending[answered:]
+        return statuses
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._fp.close()
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+            self._fp = None
+
+
+class IngestClient:
+    """Submits batches of readings for one user.
+
+    `auth` is the Authorization header value or a callable returning it (e.g.
+    bound to a TokenManager). `connections` pipelined connections share each
+    batch between them.
+    """
+
+    def __init__(self, base_url, auth, mode="auto", connections=1, depth=DEFAULT_PIPELINE_DEPTH,
+                 batch_path=BATCH_PATH):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.base_url = base_url.rstrip("/")
+        self._auth = auth
+        self.mode = mode
+        self.batch_path = batch_path
+        # None until the first "auto" batch has probed the bulk route
+        self.batch_supported = True if mode == "batch" else None
+        self._pipelines = [PipelinedConnection(self.base_url, depth) for _ in range(max(1, connections))]
+        self._session = InstrumentedSession()
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=max(1, connections)))
+
+    def _headers(self):
+        auth = self._auth() if callable(self._auth) else self._auth
+        return {"Authorization": auth}
+
+    def submit(self, readings):
+        readings = list(readings)
+        started = time.perf_counter()
+        mode = self.mode
+        statuses = None
+        if (mode == "auto" and self.batch_supported is not False) or mode == "batch":
+            statuses = self._submit_batch(readings)
+            mode = "batch"
+            if statuses is None:
+                # no bulk route: remember and pipeline this batch instead
+                self.batch_supported = False
+                mode = "pipelined"
+            else:
+                self.batch_supported = True
+        if statuses is None:
+            if mode in ("auto", "pipelined"):
+                mode = "pipelined"
+                statuses = self._submit_pipelined(readings)
+            else:
+                statuses = [self._post_one(r) for r in readings]
+        elapsed = time.perf_counter() - started
+
+        counts = {}
+        for s in statuses:
+            counts[s] = counts.get(s, 0) + 1
+        accepted = sum(c for s, c in counts.items() if s in ACCEPTED)
+        result = BatchResult(mode, len(readings), accepted, len(readings) - accepted, elapsed,
+                             {str(k): v for k, v in counts.items()})
+        REGISTRY.histogram("ingest_client_batch_duration_seconds", mode=mode).record(elapsed)
+        REGISTRY.rate("ingest_client_readings", mode=mode).mark(accepted)
+        return result
+
+    def _submit_batch(self, readings):
+        # None when the route does not exist (404/405), else one status per reading
+        try:
+            resp = self._session.post(f"{self.base_url}{self.batch_path}", json=readings,
+                                      headers=self._headers(), timeout=REQUEST_TIMEOUT_SECONDS)
+        except requests.exceptions.RequestException as e:
+            return [type(e).__name__] * len(readings)
+        if resp.status_code in (404, 405) and self.mode == "auto":
+            return None
+        if resp.status_code not in ACCEPTED:
+            return [resp.status_code] * len(readings)
+        try:
+            results = resp.json()
+        except ValueError:
+            results = None
+        if isinstance(results, list) and len(results) == len(readings):
+            return [r.get("status", resp.status_code) if isinstance(r, dict) else resp.status_code for r in results]
+        return [resp.status_code] * len(readings)
+
+    def _submit_pipelined(self, readings):
+        headers = self._headers()
+        bodies = [json.dumps(r).encode() for r in readings]
+        if len(self._pipelines) == 1:
+            return self._pipelines[0].post_many(INGEST_PATH, bodies, headers)
+
+        # contiguous slices, one per connection, sent in parallel
+        n = len(self._pipelines)
+        size = -(-len(bodies) // n)
+        slices = [(p, bodies[k * size:(k + 1) * size]) for k, p in enumerate(self._pipelines)]
+        out = [None] * len(slices)
+
+        def run(k, pipeline, chunk):
+            out[k] = pipeline.post_many(INGEST_PATH, chunk, headers) if chunk else []
+
+        threads = [threading.Thread(target=run, args=(k, p, c)) for k, (p, c) in enumerate(slices)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return [s for chunk in out for s in chunk]
+
+    def _post_one(self, reading):
+        try:
+            resp = self._session.post(f"{self.base_url}{INGEST_PATH}", json=reading,
+                                      headers=self._headers(), timeout=REQUEST_TIMEOUT_SECONDS)
+            return resp.status_code
+        except requests.exceptions.RequestException as e:
+            return type(e).__name__
+
+    def close(self):
+        for p in self._pipelines:
+            p.close()
+        self._session.close()
+
+
+def run_mode(client, readings, batch_size):
+    results = []
+    for start in range(0, len(readings), batch_size):
+        results.append(client.submit(readings[start:start + batch_size]))
+    return results
+
+
+def summarize_mode(results):
+    sent = sum(r.sent for r in results)
+    elapsed = sum(r.elapsed for r in results)
+    rates = sorted(throughput(r) for r in results if r.elapsed > 0)
+    return {
+        "mode": results[0].mode if results else None,
+        "batches": len(results),
+        "sent": sent,
+        "accepted": sum(r.accepted for r in results),
+        "failed": sum(r.failed for r in results),
+        "elapsedSeconds": round(elapsed, 4),
+        "readingsPerSecond": round(sent / elapsed, 1) if elapsed > 0 else None,
+        "batchReadingsPerSecond": {"min": round(rates[0], 1), "max": round(rates[-1], 1)} if rates else None,
+        "perBatch": [dict(r._asdict(), readingsPerSecond=round(throughput(r) or 0, 1)) for r in results],
+    }
+
+
+def print_report(summaries):
+    baseline = next((s for s in summaries if s["mode"] == "single"), None)
+    print(f"\n{'mode':<12}{'batches':>8}{'sent':>7}{'ok':>7}{'fail':>6}{'seconds':>10}{'readings/s':>12}{'vs single':>11}")
+    for s in summaries:
+        speedup = "-"
+        if baseline and baseline["readingsPerSecond"] and s["readingsPerSecond"]:
+            speedup = f"{s['readingsPerSecond'] / baseline['readingsPerSecond']:.1f}x"
+        print(f"{s['mode']:<12}{s['batches']:>8}{s['sent']:>7}{s['accepted']:>7}{s['failed']:>6}"
+              f"{s['elapsedSeconds']:>10}{s['readingsPerSecond']:>12}{speedup:>11}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compares batched, pipelined and single reading submission.")
+    parser.add_argument("--base-url", default=BASE_URL_INGESTAO)
+    parser.add_argument("--usuarios-url", default=BASE_URL_USUARIOS)
+    parser.add_argument("--simulation-file", default=SIMULATION_FILE, help="Output of data_seeder.py (first user is used)")
+    parser.add_argument("--modes", default="single,auto", help=f"Comma-separated, from {', '.join(MODES)}")
+    parser.add_argument("--readings", type=int, default=500, help="Readings per mode")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--connections", type=int, default=1, help="Pipelined connections per batch")
+    parser.add_argument("--depth", type=int, default=DEFAULT_PIPELINE_DEPTH, help="Pipelined requests in flight per connection")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--local", action="store_true", help="Run against the in-process fake stack")
+    parser.add_argument("--local-batch", action="store_true", help="Enable the fake stack's bulk route")
+    parser.add_argument("--output", help="JSON results file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    rnd = random.Random(args.seed)
+
+    stack = None
+    tokens = None
+    if args.local:
+        from fake_stack import FakeStack
+        from pipeline_benchmark import setup_tenant
+        stack = FakeStack(batch_endpoint=args.local_batch).start()
+        base_url = stack.url("ingestao")
+        headers, prop_id, talhao_id = setup_tenant(requests.Session(), stack.urls)
+        auth = headers["Authorization"]
+        targets = [(None, prop_id, talhao_id, 0)]
+    else:
+        base_url = args.base_url
+        try:
+            targets = load_targets(args.simulation_file)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not read {args.simulation_file}: {e}")
+            sys.exit(1)
+        if not targets:
+            print(f"❌ No talhoes in {args.simulation_file}. Run data_seeder.py first.")
+            sys.exit(1)
+        # one Authorization header per request: use the first user's talhoes
+        email = targets[0][0]
+        targets = [t for t in targets if t[0] == email]
+        tokens = TokenManager(args.usuarios_url)
+        tokens.load_simulation_data(args.simulation_file)
+        tokens.start()
+        auth = lambda: tokens.headers(email)["Authorization"]
+
+    summaries = []
+    try:
+        for mode in modes:
+            readings = [random_reading(targets[i % len(targets)][1], targets[i % len(targets)][2], rnd)
+                        for i in range(args.readings)]
+            client = IngestClient(base_url, auth, mode, args.connections, args.depth)
+            try:
+                print(f"Submitting {len(readings)} readings in batches of {args.batch_size} ({mode})...")
+                summaries.append(summarize_mode(run_mode(client, readings, args.batch_size)))
+            finally:
+                client.close()
+    finally:
+        if tokens:
+            tokens.close()
+        if stack:
+            stack.stop()
+
+    print_report(summaries)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "modes": summaries}, f, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+import atexit
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+# In-process timing for the tests/*.py scripts: log-bucketed latency histograms,
+# counters and per-second rate meters kept in a Registry. Everything is plain
+# counts keyed by bucket/second, so registries from several workers or processes
+# merge by addition. Exports to JSON (lossless, mergeable) and to the Prometheus
+# text format, using the same metric/label names as the services' own
+# http_server_request_duration_seconds so the Grafana dashboard queries carry over.
+#
+# AGRO_METRICS_FILE=<path> writes <path> (JSON) and <path>.prom at exit;
+# AGRO_METRICS_SUMMARY=0 disables the timing table printed at exit.
+
+METRICS_FILE = os.environ.get("AGRO_METRICS_FILE")
+PRINT_SUMMARY = os.environ.get("AGRO_METRICS_SUMMARY", "1") != "0"
+
+# 2^(1/16) growth per bucket: ~4.4% worst-case relative error, ~40 buckets per decade
+SUB_BUCKETS = 16
+# Values are bucketed in microseconds; anything below 1us lands in bucket 0
+UNIT = 1e-6
+# le boundaries (seconds) for the Prometheus export, the ASP.NET Core defaults
+EXPORT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10)
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+_ID_SEGMENT_RE = re.compile(r"^([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+)$")
+
+
+def bucket_index(seconds):
+    units = seconds / UNIT
+    if units <= 1:
+        return 0
+    return int(math.log2(units) * SUB_BUCKETS)
+
+
+def bucket_upper(index):
+    # upper bound (seconds) of a bucket
+    return 2 ** ((index + 1) / SUB_BUCKETS) * UNIT
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        index = bucket_index(seconds)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += seconds
+            self.min = seconds if self.min is None else min(self.min, seconds)
+            self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the nearest-rank sample, capped at the exact max
+        with self._lock:
+            if not self.count:
+                return None
+            rank = max(1, math.ceil(q * self.count))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= rank:
+                    return min(bucket_upper(index), self.max)
+            return self.max
+
+    def cumulative(self, bounds):
+        # count of samples per `le` bound. The bucket straddling a bound is split by the share
+        # of its log-width below it (samples taken as log-uniform within a bucket); bounds
+        # outside [min, max] are exact
+        with self._lock:
+            items = sorted(self.counts.items())
+            count, lo, hi = self.count, self.min, self.max
+        out = []
+        for le in bounds:
+            if hi is not None and le >= hi:
+                out.append(count)
+                continue
+            if lo is None or le < lo:
+                out.append(0)
+                continue
+            below = 0.0
+            for i, c in items:
+                upper = bucket_upper(i)
+                if upper <= le:
+                    below += c
+                    continue
+                lower = bucket_upper(i - 1) if i else 0.0
+                if lower < le:
+                    below += c * (math.log(le / lower) / math.log(upper / lower) if lower else le / upper)
+                break
+            out.append(round(below))
+        return out
+
+    def merge(self, other):
+        with self._lock:
+            for index, c in other.counts.items():
+                self.counts[index] = self.counts.get(index, 0) + c
+            self.count += other.count
+            self.sum += other.sum
+            if other.min is not None:
+                self.min = other.min if self.min is None else min(self.min, other.min)
+            if other.max is not None:
+                self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def to_dict(self):
+        with self._lock:
+            return {"counts": {str(i): c for i, c in sorted(self.counts.items())},
+                    "count": self.count, "sum": self.sum, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        h = cls()
+        h.counts = {int(i): c for i, c in data["counts"].items()}
+        h.count, h.sum, h.min, h.max = data["count"], data["sum"], data["min"], data["max"]
+        return h
+
+    def summary(self, quantiles=DEFAULT_QUANTILES):
+        out = {"count": self.count, "mean": self.sum / self.count if self.count else None}
+        for q in quantiles:
+            out[f"p{int(q * 100)}"] = self.quantile(q)
+        out["max"] = self.max
+        return out
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def merge(self, other):
+        self.inc(other.value)
+
+    def to_dict(self):
+        return {"value": self.value}
+
+    @classmethod
+    def from_dict(cls, data):
+        c = cls()
+        c.value = data["value"]
+        return c
+
+
+class RateMeter:
+    # Events per wall-clock second (epoch seconds), so meters from different
+    # processes line up when merged
+    def __init__(self):
+        self.seconds = {}
+        self._lock = threading.Lock()
+
+    def mark(self, n=1, now=None):
+        second = int(time.time() if now is None else now)
+        with self._lock:
+            self.seconds[second] = self.seconds.get(second, 0) + n
+
+    @property
+    def total(self):
+        return sum(self.seconds.values())
+
+    def rate(self, window=None, now=None):
+        # mean events/s over the last `window` seconds, or over the whole active span
+        with self._lock:
+            if not self.seconds:
+                return 0.0
+            if window is None:
+                first, last = min(self.seconds), max(self.seconds)
+                return sum(self.seconds.values()) / (last - first + 1)
+            end = int(time.time() if now is None else now)
+            return sum(c for s, c in self.seconds.items() if end - window < s <= end) / window
+
+    def peak(self):
+        with self._lock:
+            return max(self.seconds.values(), default=0)
+
+    def merge(self, other):
+        with self._lock:
+            for s, c in other.seconds.items():
+                self.seconds[s] = self.seconds.get(s, 0) + c
+
+    def to_dict(self):
+        with self._lock:
+            return {"seconds": {str(s): c for s, c in sorted(self.seconds.items())}}
+
+    @classmethod
+    def from_dict(cls, data):
+        r = cls()
+        r.seconds = {int(s): c for s, c in data["seconds"].items()}
+        return r
+
+
+_KINDS = {"histogram": Histogram, "counter": Counter, "rate": RateMeter}
+
+
+class Registry:
+    """Named, labelled metrics. get-or-create is thread-safe; so is recording."""
+
+    def __init__(self):
+        self._metrics = {}   # (kind, name, sorted label items) -> metric
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, labels):
+        key = (kind, name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(key, _KINDS[kind]())
+        return metric
+
+    def histogram(self, name, **labels):
+        return self._get("histogram", name, labels)
+
+    def counter(self, name, **labels):
+        return self._get("counter", name, labels)
+
+    def rate(self, name, **labels):
+        return self._get("rate", name, labels)
+
+    def items(self, kind=None):
+        with self._lock:
+            entries = list(self._metrics.items())
+        for (k, name, labels), metric in sorted(entries, key=lambda e: e[0]):
+            if kind is None or k == kind:
+                yield k, name, dict(labels), metric
+
+    def __len__(self):
+        return len(self._metrics)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, **labels).record(time.perf_counter() - started)
+
+    def merge(self, other):
+        # `other` is a Registry or its to_dict() form
+        if isinstance(other, dict):
+            other = Registry.from_dict(other)
+        for kind, name, labels, metric in other.items():
+            self._get(kind, name, labels).merge(metric)
+        return self
+
+    def to_dict(self):
+        return {"metrics": [{"kind": kind, "name": name, "labels": labels, **metric.to_dict()}
+                            for kind, name, labels, metric in self.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        registry = cls()
+        for entry in data["metrics"]:
+            key = (entry["kind"], entry["name"], tuple(sorted(entry["labels"].items())))
+            registry._metrics[key] = _KINDS[entry["kind"]].from_dict(entry)
+        return registry
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, buckets=EXPORT_BUCKETS):
+        # samples are grouped per metric family, as the text format requires
+        families = {}
+
+        def add(family, kind, line):
+            families.setdefault(family, (kind, []))[1].append(line)
+
+        for kind, name, labels, metric in self.items():
+            if kind == "histogram":
+                for le, c in zip(buckets, metric.cumulative(buckets)):
+                    add(name, "histogram", f"{name}_bucket{_labels(labels, le=_num(le))} {c}")
+                add(name, "histogram", f"{name}_bucket{_labels(labels, le='+Inf')} {metric.count}")
+                add(name, "histogram", f"{name}_sum{_labels(labels)} {_num(metric.sum)}")
+                add(name, "histogram", f"{name}_count{_labels(labels)} {metric.count}")
+            elif kind == "counter":
+                add(f"{name}_total", "counter", f"{name}_total{_labels(labels)} {metric.value}")
+            else:
+                add(f"{name}_total", "counter", f"{name}_total{_labels(labels)} {metric.total}")
+                add(f"{name}_per_second", "gauge", f"{name}_per_second{_labels(labels, stat='mean')} {_num(metric.rate())}")
+                add(f"{name}_per_second", "gauge", f"{name}_per_second{_labels(labels, stat='peak')} {metric.peak()}")
+
+        lines = []
+        for family, (kind, samples) in families.items():
+            lines.append(f"# TYPE {family} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def _num(value):
+    return repr(float(value))
+
+
+def _labels(labels, **extra):
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in items.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(items, escaped)) + "}"
+
+
+# Process-wide registry used by the helpers below and exported at exit
+REGISTRY = Registry()
+JOB = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+
+HTTP_METRIC = "http_client_request_duration_seconds"
+SQL_METRIC = "sql_client_query_duration_seconds"
+
+
+def route_of(url):
+    # /api/v1/Propriedades/<guid>/talhoes -> /api/v1/Propriedades/{id}/talhoes
+    path = requests.utils.urlparse(url).path
+    return "/".join("{id}" if _ID_SEGMENT_RE.match(s) else s for s in path.split("/"))
+
+
+class InstrumentedSession(requests.Session):
+    """requests.Session that times every request into a Registry.
+
+    Labels follow the server-side metric: job, method, route (ids collapsed),
+    status_code ("error" when no response came back).
+    """
+
+    def __init__(self, registry=None, job=None):
+        super().__init__()
+        self.registry = REGISTRY if registry is None else registry
+        self.job = job or JOB
+
+    def request(self, method, url, *args, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+            status = resp.status_code
+            return resp
+        finally:
+            labels = {"job": self.job, "method": method.upper(), "route": route_of(url), "status_code": status}
+            self.registry.histogram(HTTP_METRIC, **labels).record(time.perf_counter() - started)
+            self.registry.rate("http_client_requests", job=self.job).mark()
+
+
+def timed_sql(query_fn, registry=None, job=None):
+    # Wraps a db_access-style query(sql, database); a None result counts as an error
+    registry = REGISTRY if registry is None else registry
+    job = job or JOB
+
+    def query(sql, database):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = query_fn(sql, database)
+            return result
+        finally:
+            outcome = "error" if result is None else "ok"
+            registry.histogram(SQL_METRIC, job=job, database=database, outcome=outcome).record(
+                time.perf_counter() - started)
+
+    return query
+
+
+def print_summary(registry=None):
+    registry = REGISTRY if registry is None else registry
+    rows = [(name, labels, metric) for kind, name, labels, metric in registry.items("histogram")]
+    if not rows:
+        return
+    print(f"\n{'metric':<56}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, labels, metric in rows:
+        key = " ".join(str(v) for k, v in labels.items() if k != "job")
+        s = metric.summary()
+        cells = "".join(f"{'-' if s[k] is None else round(s[k] * 1000, 1):>10}" for k in ("p50", "p95", "p99", "max"))
+        print(f"{(name.split('_')[0] + ' ' + key)[:55]:<56}{s['count']:>7}{cells}")
+
+
+def export(path, registry=None):
+    # <path> gets the mergeable JSON, <path>.prom the Prometheus text
+    registry = REGISTRY if registry is None else registry
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(registry.to_json(indent=1))
+    with open(f"{path}.prom", "w", encoding="utf-8") as f:
+        f.write(registry.to_prometheus())
+
+
+def _at_exit():
+    if not len(REGISTRY):
+        return
+    if PRINT_SUMMARY:
+        print_summary()
+    if METRICS_FILE:
+        export(METRICS_FILE)
+        print(f"📈 Metrics written to {METRICS_FILE} and {METRICS_FILE}.prom")
+
+
+atexit.register(_at_exit)
+
+
+def main(argv=None):
+    # Merge metric files from several runs/processes:
+    #   python instrumentation.py merged.json worker1.json worker2.json ...
+    import argparse
+    parser = argparse.ArgumentParser(description="Merges instrumentation JSON files.")
+    parser.add_argument("output", help="Merged JSON file (a .prom file is written next to it)")
+    parser.add_argument("inputs", nargs="+")
+    args = parser.parse_args(argv)
+
+    merged = Registry()
+    for path in args.inputs:
+        with open(path, encoding="utf-8") as f:
+            merged.merge(json.load(f))
+    export(args.output, merged)
+    print_summary(merged)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# kubectl helpers shared by the tests/*.py scripts.
+# Pod names are cached per (namespace, selector) for POD_CACHE_TTL seconds, in
+# memory and in a small JSON file so scripts run back to back reuse the lookup.
+# Entries are dropped on exec/log failures and after a rollout restart.
+# `python kube_utils.py --self-check` exercises the cache against a fake kubectl.
+
+NAMESPACE = "agrosolutions-local"
+KUBECTL = os.environ.get("KUBECTL", "kubectl")
+POD_CACHE_TTL = float(os.environ.get("AGRO_POD_CACHE_TTL", "300"))
+POD_CACHE_FILE = os.environ.get("AGRO_POD_CACHE_FILE",
+                                os.path.join(tempfile.gettempdir(), "agrosolutions_pod_cache.json"))
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def kubectl(*args, **kwargs):
+    kwargs.setdefault("capture_output", True)
+    kwargs.setdefault("text", True)
+    return subprocess.run([KUBECTL, *args], **kwargs)
+
+
+def _key(namespace, selector):
+    return f"{namespace}|{selector}"
+
+
+def _load_file():
+    try:
+        with open(POD_CACHE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_file(entries):
+    if not POD_CACHE_FILE:
+        return
+    # write-then-rename so concurrent scripts never read a half-written file
+    tmp = f"{POD_CACHE_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, POD_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def _lookup(key, now):
+    entry = _cache.get(key)
+    if entry is None and POD_CACHE_FILE:
+        entry = _load_file().get(key)
+        if entry:
+            _cache[key] = entry
+    if entry and entry["expires"] > now:
+        return entry["pod"]
+    return None
+
+
+def resolve_pod_name(selector, namespace=NAMESPACE):
+    # Uncached lookup: first pod matching the selector
+    try:
+        res = kubectl("get", "pods", "-n", namespace, "-l", selector, "-o", "name")
+    except FileNotFoundError:
+        print(f"❌ {KUBECTL} not found on PATH.")
+        return None
+    if res.returncode != 0:
+        print(f"Error getting pod name: {res.stderr}")
+        return None
+    lines = res.stdout.strip().splitlines()
+    if not lines:
+        return None
+    return lines[0].strip().replace("pod/", "")
+
+
+def pod_names(selector, namespace=NAMESPACE):
+    # Uncached: every running pod matching the selector
+    res = kubectl("get", "pods", "-n", namespace, "-l", selector, "--field-selector=status.phase=Running", "-o", "name")
+    if res.returncode != 0:
+        raise RuntimeError(f"Error getting pods for {selector}: {res.stderr.strip()}")
+    return [line.strip().replace("pod/", "") for line in res.stdout.splitlines() if line.strip()]
+
+
+def _discard(stream):
+    for _ in stream:
+        pass
+
+
+class PortForward:
+    """`kubectl port-forward` of one pod's `port` to a free local port.
+
+    `url` is set once kubectl reports the forward; close() stops it.
+    """
+
+    def __init__(self, pod, port, namespace=NAMESPACE):
+        self.pod = pod
+        self.port = port
+        self.namespace = namespace
+        self.url = None
+        self._proc = None
+
+    def start(self):
+        self._proc = subprocess.Popen([KUBECTL, "port-forward", "-n", self.namespace, f"pod/{self.pod}", f":{self.port}"],
+                                      stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        # "Forwarding from 127.0.0.1:40123 -> 8080", or kubectl's error
+        line = self._proc.stdout.readline()
+        if not line.startswith("Forwarding from"):
+            self.close()
+            raise RuntimeError(f"port-forward to {self.pod}:{self.port} failed: {line.strip() or 'kubectl exited'}")
+        self.url = f"http://{line.split()[2]}"
+        # kubectl logs a line per connection: keep reading so the pipe never fills
+        threading.Thread(target=_discard, args=(self._proc.stdout,), daemon=True).start()
+        return self
+
+    def close(self):
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+                self._proc.wait()
+            self._proc = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def get_pod_name(selector, namespace=NAMESPACE, ttl=None):
+    ttl = POD_CACHE_TTL if ttl is None else ttl
+    key = _key(namespace, selector)
+    now = time.time()
+    with _lock:
+        pod = _lookup(key, now)
+        if pod:
+            return pod
+
+    pod = resolve_pod_name(selector, namespace)
+    if pod:
+        with _lock:
+            _cache[key] = {"pod": pod, "expires": now + ttl}
+            if POD_CACHE_FILE:
+                entries = _load_file()
+                entries[key] = _cache[key]
+                _save_file(entries)
+    return pod
+
+
+def invalidate(selector=None, namespace=NAMESPACE, pod=None):
+    # Drops matching entries: one selector, a whole namespace (selector=None)
+    # or whichever entries currently point at `pod`
+    def matches(key, entry):
+        ns, sel = key.split("|", 1)
+        if pod is not None:
+            return ns == namespace and entry["pod"] == pod
+        return ns == namespace and (selector is None or sel == selector)
+
+    with _lock:
+        for key in [k for k, e in _cache.items() if matches(k, e)]:
+            del _cache[key]
+        if POD_CACHE_FILE:
+            entries = _load_file()
+            stale = [k for k, e in entries.items() if matches(k, e)]
+            if stale:
+                for key in stale:
+                    del entries[key]
+                _save_file(entries)
+
+
+def rollout_restart(deployment, namespace=NAMESPACE, wait=True):
+    print(f"Executing: kubectl rollout restart deployment/{deployment} -n {namespace}")
+    res = kubectl("rollout", "restart", f"deployment/{deployment}", "-n", namespace)
+    if wait and res.returncode == 0:
+        print("Waiting for rollout to complete (this may take a minute)...")
+        res = kubectl("rollout", "status", f"deployment/{deployment}", "-n", namespace)
+    # every pod of the deployment was replaced; we do not track selector->deployment
+    invalidate(namespace=namespace)
+    return res.returncode == 0
+
+
+# -- self-check ----------------------------------------------------------------
+
+# Stand-in kubectl: "get pods" prints the current pod, "rollout restart" renames it,
+# and every call is logged to calls.log next to it
+FAKE_KUBECTL = """#!{python}
+import os, sys
+here = os.path.dirname(os.path.abspath(__file__))
+state = os.path.join(here, "pod")
+with open(os.path.join(here, "calls.log"), "a") as f:
+    f.write(" ".join(sys.argv[1:3]) + "\\n")
+pod = open(state).read() if os.path.exists(state) else "sql-0"
+if sys.argv[1:3] == ["rollout", "restart"]:
+    pod = "sql-" + str(int(pod.split("-")[1]) + 1)
+    open(state, "w").write(pod)
+elif sys.argv[1:3] == ["get", "pods"]:
+    print("pod/" + pod)
+"""
+
+
+def self_check():
+    global KUBECTL, POD_CACHE_FILE
+    directory = tempfile.mkdtemp(prefix="kube_utils_check_")
+    fake = os.path.join(directory, "kubectl")
+    with open(fake, "w", encoding="utf-8") as f:
+        f.write(FAKE_KUBECTL.format(python=sys.executable))
+    os.chmod(fake, 0o755)
+    saved = KUBECTL, POD_CACHE_FILE, dict(_cache)
+    KUBECTL, POD_CACHE_FILE = fake, os.path.join(directory, "cache.json")
+    _cache.clear()
+
+    def lookups():
+        with open(os.path.join(directory, "calls.log"), encoding="utf-8") as f:
+            return sum(1 for line in f if line.startswith("get pods"))
+
+    checks = []
+    try:
+        first = get_pod_name("app=sql", "ns", ttl=0.5)
+        checks.append(("first lookup asks kubectl", first == "sql-0" and lookups() == 1))
+        checks.append(("within the TTL the memory cache answers", get_pod_name("app=sql", "ns", ttl=0.5) == first
+                       and lookups() == 1))
+        _cache.clear()
+        checks.append(("a new process reuses the cache file", get_pod_name("app=sql", "ns", ttl=0.5) == first
+                       and lookups() == 1))
+        time.sleep(0.6)
+        # cached for a minute from here on, so only invalidation can explain a new lookup
+        checks.append(("after the TTL it looks up again", get_pod_name("app=sql", "ns", ttl=60) == first
+                       and lookups() == 2))
+        get_pod_name("app=sql", "other", ttl=60)
+        rollout_restart("sql", "ns")
+        checks.append(("a rollout restart drops the stale pod", get_pod_name("app=sql", "ns", ttl=60) == "sql-1"
+                       and lookups() == 4))
+        checks.append(("other namespaces keep their entries", get_pod_name("app=sql", "other", ttl=60) == first
+                       and lookups() == 4))
+    finally:
+        KUBECTL, POD_CACHE_FILE = saved[0], saved[1]
+        _cache.clear()
+        _cache.update(saved[2])
+    for name, ok in checks:
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(ok for _, ok in checks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="kubectl helpers shared by the tests/*.py scripts.")
+    parser.add_argument("--self-check", action="store_true", help="Check the pod cache against a fake kubectl")
+    args = parser.parse_args(argv)
+    if not args.self_check:
+        parser.print_help()
+        return
+    if not self_check():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import traceback
+from multiprocessing.connection import wait
+
+import load_generator
+from instrumentation import Histogram, Registry, export
+from load_generator import (LATENCY_METRIC, REQUESTS_METRIC, LoadGenerator, build_profile, build_readings,
+                            load_targets)
+from token_manager import TokenManager
+
+# Multi-process driver for load_generator.py.
+# One asyncio process tops out at one core (JSON encoding, TLS, the event loop
+# itself), well before a few Ingestao replicas do. The coordinator splits the
+# simulation_data.json targets across N spawned workers, whole users at a time
+# so each user's token and connection pool live in a single process. Each
+# worker runs its own LoadGenerator at its share of the rate profile, recording
+# into its own instrumentation.Registry, and sends the registry's to_dict() up
+# its pipe every --report-interval seconds. Histograms are bucket counts and
+# rate meters count per wall-clock second, so the coordinator adds the latest
+# snapshot of every worker into one aggregate. It prints live throughput and
+# last-interval percentiles, then the totals at the end.
+#
+# Any load_generator.py option (profile, rates, duration, --signals, ...) is
+# accepted and applies to the whole run, except --capture and --save-tokens.
+
+DEFAULT_REPORT_INTERVAL = 2.0
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def shard(targets, workers):
+    """Targets -> `workers` lists. Whole users go to the least-loaded worker, biggest first;
+    with fewer users than workers the talhoes are dealt round-robin so no worker idles."""
+    by_user = {}
+    for target in targets:
+        by_user.setdefault(target[3], []).append(target)
+    shards = [[] for _ in range(workers)]
+    if len(by_user) < workers:
+        for i, target in enumerate(targets):
+            shards[i % workers].append(target)
+    else:
+        for user_targets in sorted(by_user.values(), key=len, reverse=True):
+            min(shards, key=len).extend(user_targets)
+    return [s for s in shards if s]
+
+
+def scaled(profile, share):
+    return lambda t: profile(t) * share
+
+
+def credentials(path):
+    # email -> (password, saved token) from data_seeder.py's output
+    with open(path, encoding="utf-8") as f:
+        return {u["email"]: (u["password"], u.get("token")) for u in json.load(f)}
+
+
+# -- worker --------------------------------------------------------------------
+
+def worker(conn, index, targets, share, creds, args):
+    """One shard in its own process and event loop; reports ("snapshot" | "done" | "error", index, ...)."""
+    try:
+        tokens = TokenManager(args.usuarios_url)
+        for email in {t[0] for t in targets}:
+            tokens.add_user(email, *creds[email])
+        tokens.start(load_generator.TOKEN_CHECK_INTERVAL)
+        registry = Registry()
+        seed = None if args.seed is None else args.seed + index
+        generator = LoadGenerator(args.base_url, targets, tokens, scaled(build_profile(args), share), args.duration,
+                                  args.connections_per_user, max(1, int(args.max_inflight * share)), seed, args.origem,
+                                  build_readings(args, targets, seed), registry=registry)
+
+        async def run():
+            task = asyncio.ensure_future(generator.run())
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=args.report_interval)
+                if done:
+                    return task.result()
+                conn.send(("snapshot", index, registry.to_dict()))
+
+        try:
+            report = asyncio.run(run())
+        finally:
+            tokens.close()
+        conn.send(("done", index, registry.to_dict(), report["totals"]))
+    except Exception:
+        conn.send(("error", index, traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+# -- coordinator ---------------------------------------------------------------
+
+def aggregate(snapshots):
+    merged = Registry()
+    for snapshot in snapshots:
+        merged.merge(snapshot)
+    return merged
+
+
+def window(current, previous):
+    # the samples recorded between two cumulative snapshots of one histogram
+    h = Histogram()
+    before = previous.counts if previous is not None else {}
+    h.counts = {i: c - before.get(i, 0) for i, c in current.counts.items() if c > before.get(i, 0)}
+    h.count = sum(h.counts.values())
+    h.sum = current.sum - (previous.sum if previous is not None else 0.0)
+    h.min, h.max = current.min, current.max
+    return h
+
+
+def rates(registry, seconds=None, now=None):
+    # outcome -> requests/s over the last `seconds` whole seconds (None: the whole run)
+    out = {}
+    for _, name, labels, meter in registry.items("rate"):
+        if name == REQUESTS_METRIC:
+            out[labels["outcome"]] = meter.rate(seconds, now) if seconds else meter.rate()
+    return out
+
+
+def latency(registry):
+    merged = Histogram()
+    for _, name, labels, h in registry.items("histogram"):
+        if name == LATENCY_METRIC and labels.get("outcome") == "ok":
+            merged.merge(h)
+    return merged
+
+
+def ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def print_live(elapsed, registry, previous, interval, alive, workers):
+    # last whole seconds only: the current second is still being counted
+    r = rates(registry, max(1, int(interval)), time.time() - 1)
+    h = window(latency(registry), previous)
+    q = "  ".join(f"p{int(x * 100)} {ms(h.quantile(x))}" for x in QUANTILES)
+    print(f"[{elapsed:>6.1f}s] {r.get('ok', 0):>9.1f} ok/s  err {r.get('error', 0):>6.1f}/s  "
+          f"drop {r.get('dropped', 0):>6.1f}/s  {q} ms  workers {alive}/{workers}", flush=True)
+
+
+def print_final(registry, totals, wall):
+    h = latency(registry)
+    s = h.summary(QUANTILES)
+    ok = registry.rate(REQUESTS_METRIC, outcome="ok")
+    sum_totals = {k: sum(t.get(k, 0) for t in totals.values()) for k in ("offered", "ok", "errors", "dropped")}
+    print(f"\n{'worker':>7}{'offered':>10}{'ok':>10}{'errors':>8}{'dropped':>9}{'offered/s':>11}")
+    for index in sorted(totals):
+        t = totals[index]
+        print(f"{index:>7}{t['offered']:>10}{t['ok']:>10}{t['errors']:>8}{t['dropped']:>9}{t['offeredRate'] or 0:>11.1f}")
+    print(f"\nOffered {sum_totals['offered']} | OK {sum_totals['ok']} | Errors {sum_totals['errors']} | "
+          f"Dropped {sum_totals['dropped']} in {wall:.1f}s")
+    print(f"Throughput: mean {ok.rate():.1f} ok/s, peak {ok.peak()} ok/s")
+    print(f"Latency: p50={ms(s['p50'])}ms p95={ms(s['p95'])}ms p99={ms(s['p99'])}ms max={ms(s['max'])}ms")
+    return {"totals": sum_totals, "perWorker": totals, "wallSeconds": round(wall, 2),
+            "throughput": {"meanOk": round(ok.rate(), 2), "peakOk": ok.peak()},
+            "latency": {k: (None if v is None else round(v * 1000, 3)) if k != "count" else v for k, v in s.items()}}
+
+
+def drive(args, targets, creds):
+    shards = shard(targets, args.workers)
+    ctx = multiprocessing.get_context("spawn")
+    conns, procs = {}, []
+    for index, targets_i in enumerate(shards):
+        parent, child = ctx.Pipe(duplex=False)
+        share = len(targets_i) / len(targets)
+        shard_creds = {t[0]: creds[t[0]] for t in targets_i}
+        proc = ctx.Process(target=worker, args=(child, index, targets_i, share, shard_creds, args), daemon=True)
+        proc.start()
+        child.close()
+        conns[parent] = index
+        procs.append(proc)
+    print(f"🚀 {args.profile} load for {args.duration}s against {args.base_url}: {len(targets)} talhoes "
+          f"over {len(shards)} worker processes ({', '.join(str(len(s)) for s in shards)} talhoes each)")
+
+    latest, totals, failed = {}, {}, []
+    started = time.monotonic()
+    next_report = started + args.report_interval
+    previous = None
+    while conns:
+        for conn in wait(list(conns), timeout=max(0.0, next_report - time.monotonic())):
+            index = conns[conn]
+            try:
+                message = conn.recv()
+            except EOFError:
+                message = ("error", index, "worker exited without a report")
+            kind = message[0]
+            if kind == "snapshot":
+                latest[index] = message[2]
+                continue
+            if kind == "done":
+                latest[index], totals[index] = message[2], message[3]
+            else:
+                failed.append(index)
+                print(f"❌ Worker {index} failed:\n{message[2]}")
+            del conns[conn]
+        if time.monotonic() >= next_report:
+            registry = aggregate(latest.values())
+            print_live(time.monotonic() - started, registry, previous, args.report_interval, len(conns), len(shards))
+            previous = latency(registry)
+            next_report += args.report_interval
+    for proc in procs:
+        proc.join(5)
+    return aggregate(latest.values()), totals, failed, time.monotonic() - started
+
+
+def seed_local(urls, users, talhoes, path):
+    # A simulation_data.json for the fake stack: `users` users with one property of `talhoes` talhoes each
+    from traffic_capture import PROVISION_PASSWORD, provision
+    owners = {f"user{u}": {f"prop{u}": {f"talhao{u}-{t}" for t in range(talhoes)}} for u in range(users)}
+    identities, ids, tokens = provision({"owners": owners}, urls["usuarios"], urls["propriedades"])
+    data = [{"email": identities[o], "password": PROVISION_PASSWORD, "token": tokens[identities[o]],
+             "properties": [{"id": ids[p], "talhoes": [ids[t] for t in sorted(ts)]} for p, ts in props.items()]}
+            for o, props in owners.items()]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Runs load_generator.py in several processes and merges the results. "
+                                                 "Also takes every load_generator.py option.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--report-interval", type=float, default=DEFAULT_REPORT_INTERVAL,
+                        help="Seconds between live reports (and worker snapshots)")
+    parser.add_argument("--local", nargs=2, type=int, metavar=("USERS", "TALHOES"),
+                        help="Seed and target a local fake_stack with USERS users of TALHOES talhoes")
+    parser.add_argument("--metrics", help="Write the merged registry here (JSON, plus .prom)")
+    args, rest = parser.parse_known_args(argv)
+    for key, value in vars(load_generator.parse_args(rest)).items():
+        setattr(args, key, value)
+    # single-process features: each worker would record its own capture and tokens
+    for flag, value in (("--capture", args.capture), ("--save-tokens", args.save_tokens)):
+        if value:
+            parser.error(f"{flag} is not supported with several workers; run load_generator.py for it")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stack = None
+    if args.local:
+        from fake_stack import FakeStack
+        stack = FakeStack().start()
+        args.base_url, args.usuarios_url = stack.urls["ingestao"], stack.urls["usuarios"]
+        args.simulation_file = os.path.join(tempfile.mkdtemp(prefix="load_driver_"), "simulation_data.json")
+        seed_local(stack.urls, *args.local, args.simulation_file)
+        print(f"Using local fake stack: {stack.urls}")
+    try:
+        try:
+            targets = load_targets(args.simulation_file)
+            creds = credentials(args.simulation_file)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Could not read {args.simulation_file}: {e}")
+            sys.exit(1)
+        if not targets:
+            print(f"❌ No talhoes in {args.simulation_file}. Run data_seeder.py first.")
+            sys.exit(1)
+        registry, totals, failed, wall = drive(args, targets, creds)
+    finally:
+        if stack:
+            stack.stop()
+
+    report = print_final(registry, totals, wall)
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("output", "metrics")}
+    if args.metrics:
+        export(args.metrics, registry)
+        print(f"📈 Merged metrics written to {args.metrics} and {args.metrics}.prom")
+    output = args.output or f"load_driver_{int(time.time())}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
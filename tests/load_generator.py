@@ -0,0 +1,399 @@
+import asyncio
+import aiohttp
+import argparse
+import datetime
+import itertools
+import json
+import random
+import sys
+import time
+import uuid
+
+from pipeline_benchmark import summarize
+from token_manager import BASE_URL_USUARIOS, TokenManager
+
+# Open-loop load generator for POST /api/v1/leituras-sensores.
+# The Simulador awaits every POST before sending the next one (closed loop), so
+# a slow Ingestao silently lowers the offered load. Here arrivals follow a rate
+# profile regardless of how fast responses come back: each request is scheduled
+# at its due time and latency is measured from that due time, so queueing in
+# front of a saturated service shows up in the numbers instead of being hidden.
+# Targets (users, properties, talhoes) come from data_seeder.py's simulation_data.json;
+# tokens are kept fresh by a TokenManager refreshing in the background.
+
+BASE_URL_INGESTAO = "http://localhost:30003"
+SIMULATION_FILE = "simulation_data.json"
+INGEST_PATH = "/api/v1/leituras-sensores"
+
+DEFAULT_CONNECTIONS_PER_USER = 8
+DEFAULT_MAX_INFLIGHT = 2000
+# How often the token refresher looks for tokens close to expiry or rejected with 401
+TOKEN_CHECK_INTERVAL = 5
+REQUEST_TIMEOUT_SECONDS = 30
+# Registry names used when a registry is passed in
+LATENCY_METRIC = "ingest_request_duration_seconds"
+REQUESTS_METRIC = "ingest_requests"
+
+
+def load_targets(path):
+    # One target per talhao: (email, idPropriedade, idTalhao, user index)
+    with open(path, encoding="utf-8") as f:
+        users = json.load(f)
+    targets = []
+    for u, user in enumerate(users):
+        for prop in user.get("properties", []):
+            for talhao_id in prop.get("talhoes", []):
+                targets.append((user["email"], prop["id"], talhao_id, u))
+    return targets
+
+
+# Rate profiles: callables mapping seconds since start -> requests per second
+
+def constant_profile(rate):
+    return lambda t: rate
+
+
+def ramp_profile(start_rate, end_rate, duration):
+    # linear from start_rate to end_rate over the whole run
+    return lambda t: start_rate + (end_rate - start_rate) * min(1.0, t / duration)
+
+
+def step_profile(start_rate, step_rate, step_seconds):
+    # start_rate for the first step, then +step_rate every step_seconds
+    return lambda t: start_rate + step_rate * int(t // step_seconds)
+
+
+def spike_profile(base_rate, spike_rate, spike_at, spike_seconds):
+    return lambda t: spike_rate if spike_at <= t < spike_at + spike_seconds else base_rate
+
+
+def build_profile(args):
+    if args.profile == "ramp":
+        return ramp_profile(args.rate, args.end_rate, args.duration)
+    if args.profile == "step":
+        return step_profile(args.rate, args.step_rate, args.step_seconds)
+    if args.profile == "spike":
+        return spike_profile(args.rate, args.spike_rate, args.spike_at, args.spike_seconds)
+    return constant_profile(args.rate)
+
+
+def arrival_times(profile, duration):
+    # Offsets (s) of each arrival: the next one is due 1/rate after the previous,
+    # with the rate taken at the current offset. A zero rate idles for 100ms.
+    t = 0.0
+    while t < duration:
+        rate = profile(t)
+        if rate <= 0:
+            t += 0.1
+            continue
+        yield t
+        t += 1.0 / rate
+
+
+def random_reading(prop_id, talhao_id, rnd, origem="simulador", id_dispositivo="SIM-001"):
+    # Same shape and ranges as LeituraSensorDto.CriarAleatoria in the Simulador
+    chuva = 0 if rnd.random() < 0.70 else round(rnd.uniform(0, 12), 2)
+    return {
+        "idPropriedade": prop_id,
+        "idTalhao": talhao_id,
+        "origem": origem,
+        "dataHoraCapturaUtc": datetime.datetime.utcnow().isoformat() + "Z",
+        "metricas": {
+            "umidadeSoloPercentual": round(rnd.uniform(15, 40), 2),
+            "temperaturaCelsius": round(rnd.uniform(18, 35), 2),
+            "precipitacaoMilimetros": chuva,
+            "nivelNitrogenio": round(rnd.uniform(20, 50), 2),
+            "statusSensor": "Ativo" if rnd.random() < 0.95 else "Falha de Leitura",
+        },
+        "meta": {"idDispositivo": id_dispositivo, "correlationId": uuid.uuid4().hex},
+    }
+
+
+def signal_readings(targets, seed=None, interval_seconds=300, origem="simulador"):
+    # Endless (target, payload) pairs from signal_generator: each round sends every talhao's
+    # next interval, with capture times starting now and advancing one interval per round.
+    # Rounds usually go out much faster than one interval of real time, so capture times are
+    # capped at the wall clock when the reading is taken: Analise's 24h windows have no upper
+    # bound, and a future-dated reading would count towards Risco de Seca until it is 24h old.
+    from signal_generator import STEPS_PER_BLOCK, SignalGenerator
+    start = datetime.datetime.utcnow().replace(microsecond=0).isoformat()
+    gen = SignalGenerator([t[2] for t in targets], interval_seconds, start, seed=1 if seed is None else seed,
+                          drought_rate=0.02)
+    prop_ids = [t[1] for t in targets]
+    while True:
+        batch = gen.batch(STEPS_PER_BLOCK)
+        for code, payload in zip(batch.talhao.tolist(), gen.payloads(batch, prop_ids, origem)):
+            # same fixed-width ISO format as the payloads, so the strings compare like the times
+            now = datetime.datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+            payload["dataHoraCapturaUtc"] = min(payload["dataHoraCapturaUtc"], now)
+            yield targets[code], payload
+
+
+def alert_readings(targets, seed=None, origem="simulador"):
+    # Endless (target, payload) pairs, round-robin over the talhoes, each raising exactly one Alerta
+    # ("Temperatura Crítica"): humidity stays >= 30 so neither drought rule fires. Analise records
+    # agrosolutions_alerts_processing_duration_seconds once per Alerta, so its count on /metrics
+    # then tracks the readings Analise has processed.
+    rnd = random.Random(seed)
+    while True:
+        for target in targets:
+            payload = random_reading(target[1], target[2], rnd, origem)
+            payload["metricas"].update(temperaturaCelsius=round(rnd.uniform(36, 45), 2),
+                                       umidadeSoloPercentual=round(rnd.uniform(30, 45), 2))
+            yield target, payload
+
+
+def build_readings(args, targets, seed):
+    # the readings= iterator selected on the command line; None means independent random readings
+    if args.alert_readings:
+        return alert_readings(targets, seed, args.origem)
+    if args.signals:
+        return signal_readings(targets, seed, args.signal_interval, args.origem)
+    return None
+
+
+class SecondStats:
+    __slots__ = ("offered", "latencies", "errors", "dropped", "statuses")
+
+    def __init__(self):
+        self.offered = 0
+        self.latencies = []
+        self.errors = 0
+        self.dropped = 0
+        self.statuses = {}
+
+
+class LoadGenerator:
+    # True: an arrival waits for a free slot when max_inflight requests are pending instead of being dropped
+    block_when_full = False
+
+    def __init__(self, base_url, targets, tokens, profile, duration, connections_per_user=DEFAULT_CONNECTIONS_PER_USER,
+                 max_inflight=DEFAULT_MAX_INFLIGHT, seed=None, origem="simulador", readings=None, capture=None,
+                 registry=None):
+        self.base_url = base_url.rstrip("/")
+        self.targets = targets
+        # TokenManager; only its cache is read here, logins happen on its refresh thread
+        self.tokens = tokens
+        self.profile = profile
+        self.duration = duration
+        self.connections_per_user = connections_per_user
+        self.max_inflight = max_inflight
+        self.origem = origem
+        self.rnd = random.Random(seed)
+        # optional iterator of (target, payload), e.g. signal_readings(); default: random_reading per target
+        self.readings = readings
+        # optional traffic_capture.CaptureWriter: every offered request is recorded with its offset
+        self.capture = capture
+        # optional instrumentation.Registry, fed live (mergeable across processes; see load_driver.py)
+        self.registry = registry
+        self.seconds = {}   # second since start (by due time) -> SecondStats
+        self.inflight = 0
+
+    def _stats(self, second):
+        stats = self.seconds.get(second)
+        if stats is None:
+            stats = self.seconds[second] = SecondStats()
+        return stats
+
+    async def _send(self, session, email, payload, due, second):
+        stats = self._stats(second)
+        headers = {"Authorization": f"Bearer {self.tokens.peek_token(email)}"}
+        try:
+            async with session.post(INGEST_PATH, json=payload, headers=headers) as resp:
+                await resp.read()
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+        # measured from the scheduled time: includes waiting for a pooled connection
+        latency = time.monotonic() - due
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        if status == 401:
+            self.tokens.invalidate(email)
+        ok = status in (200, 201, 202)
+        if ok:
+            stats.latencies.append(latency)
+        else:
+            stats.errors += 1
+        if self.registry is not None:
+            outcome = "ok" if ok else "error"
+            self.registry.histogram(LATENCY_METRIC, outcome=outcome).record(latency)
+            self.registry.rate(REQUESTS_METRIC, outcome=outcome).mark()
+        self.inflight -= 1
+        self._freed.set()
+
+    def arrivals(self):
+        # (offset s, target, payload) in schedule order; an offset of None means "now"
+        targets = itertools.cycle(self.targets)
+        for offset in arrival_times(self.profile, self.duration):
+            if self.readings is not None:
+                target, payload = next(self.readings)
+            else:
+                target = next(targets)
+                payload = random_reading(target[1], target[2], self.rnd, self.origem)
+            yield offset, target, payload
+
+    async def run(self):
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+        # one keep-alive pool per user, like one HttpClient per simulated tenant
+        sessions = {}
+        self._freed = asyncio.Event()
+
+        tasks = set()
+        t0 = time.monotonic()
+        try:
+            for offset, (email, _, _, u), payload in self.arrivals():
+                due = t0 + offset if offset is not None else time.monotonic()
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                second = int(due - t0)
+                stats = self._stats(second)
+                stats.offered += 1
+                if self.capture is not None:
+                    self.capture.record(email, payload, due - t0)
+                if self.inflight >= self.max_inflight:
+                    if not self.block_when_full:
+                        # never block the schedule; shedding is reported instead
+                        stats.dropped += 1
+                        if self.registry is not None:
+                            self.registry.rate(REQUESTS_METRIC, outcome="dropped").mark()
+                        continue
+                    while self.inflight >= self.max_inflight:
+                        self._freed.clear()
+                        await self._freed.wait()
+                    if offset is None:
+                        due = time.monotonic()
+                if u not in sessions:
+                    connector = aiohttp.TCPConnector(limit=self.connections_per_user)
+                    sessions[u] = aiohttp.ClientSession(self.base_url, connector=connector, timeout=timeout)
+                self.inflight += 1
+                task = asyncio.ensure_future(self._send(sessions[u], email, payload, due, second))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            send_elapsed = time.monotonic() - t0
+            if tasks:
+                await asyncio.gather(*tasks)
+            wall = time.monotonic() - t0
+        finally:
+            for session in sessions.values():
+                await session.close()
+        return self.report(send_elapsed, wall)
+
+    def report(self, send_elapsed, wall=None):
+        # offeredRate is the arrival rate the schedule produced; okRate is what the service
+        # completed over the whole run (last response included), the figure for unpaced runs
+        per_second = []
+        all_latencies = []
+        totals = {"offered": 0, "ok": 0, "errors": 0, "dropped": 0}
+        for second in sorted(self.seconds):
+            s = self.seconds[second]
+            row = {"second": second, "offered": s.offered, "ok": len(s.latencies), "errors": s.errors,
+                   "dropped": s.dropped, "statuses": {str(k): v for k, v in s.statuses.items()}}
+            row.update({k: v for k, v in summarize(s.latencies).items() if k != "count"})
+            per_second.append(row)
+            all_latencies.extend(s.latencies)
+            totals["offered"] += s.offered
+            totals["ok"] += len(s.latencies)
+            totals["errors"] += s.errors
+            totals["dropped"] += s.dropped
+        totals["offeredRate"] = round(totals["offered"] / send_elapsed, 2) if send_elapsed > 0 else None
+        totals["wallSeconds"] = None if wall is None else round(wall, 3)
+        totals["okRate"] = round(totals["ok"] / wall, 2) if wall else None
+        return {"totals": totals, "latency": summarize(all_latencies), "perSecond": per_second}
+
+
+def print_report(report):
+    print(f"{'sec':>5}{'offered':>9}{'ok':>7}{'err':>6}{'drop':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for row in report["perSecond"]:
+        cells = "".join(f"{'-' if row[k] is None else row[k]:>10}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+        print(f"{row['second']:>5}{row['offered']:>9}{row['ok']:>7}{row['errors']:>6}{row['dropped']:>6}{cells}")
+    t = report["totals"]
+    s = report["latency"]
+    print(f"\nOffered {t['offered']} ({t['offeredRate']}/s) | OK {t['ok']} ({t['okRate']}/s over {t['wallSeconds']}s) | "
+          f"Errors {t['errors']} | Dropped {t['dropped']}")
+    print(f"Overall p50={s['p50_ms']}ms p95={s['p95_ms']}ms p99={s['p99_ms']}ms max={s['max_ms']}ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the Ingestao API.")
+    parser.add_argument("--base-url", default=BASE_URL_INGESTAO)
+    parser.add_argument("--usuarios-url", default=BASE_URL_USUARIOS, help="Login endpoint host for token refresh")
+    parser.add_argument("--simulation-file", default=SIMULATION_FILE, help="Output of data_seeder.py")
+    parser.add_argument("--profile", choices=["constant", "ramp", "step", "spike"], default="constant")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of offered load")
+    parser.add_argument("--rate", type=float, default=50.0, help="Requests/s (start or base rate)")
+    parser.add_argument("--end-rate", type=float, default=500.0, help="ramp: rate reached at the end")
+    parser.add_argument("--step-rate", type=float, default=50.0, help="step: rate added every step")
+    parser.add_argument("--step-seconds", type=float, default=10.0, help="step: seconds per step")
+    parser.add_argument("--spike-rate", type=float, default=500.0, help="spike: rate during the spike")
+    parser.add_argument("--spike-at", type=float, default=10.0, help="spike: seconds before the spike")
+    parser.add_argument("--spike-seconds", type=float, default=5.0, help="spike: spike length")
+    parser.add_argument("--connections-per-user", type=int, default=DEFAULT_CONNECTIONS_PER_USER)
+    parser.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT,
+                        help="Arrivals beyond this many pending requests are dropped and counted")
+    parser.add_argument("--seed", type=int, help="Seed for the generated readings")
+    parser.add_argument("--origem", default="simulador", help="Value sent as 'origem'")
+    parser.add_argument("--signals", action="store_true",
+                        help="Send correlated series from signal_generator.py instead of independent random readings")
+    parser.add_argument("--signal-interval", type=int, default=300,
+                        help="--signals: capture-time step between one talhao's readings (s)")
+    parser.add_argument("--alert-readings", action="store_true",
+                        help="Send readings that each raise exactly one Alerta (see saturation_finder.py)")
+    parser.add_argument("--capture", help="Record the offered requests to this traffic_capture.py file (.jsonl[.gz])")
+    parser.add_argument("--save-tokens", action="store_true",
+                        help="Write refreshed tokens back to the simulation file")
+    parser.add_argument("--output", help="JSON results file (default: load_generator_<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        targets = load_targets(args.simulation_file)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read {args.simulation_file}: {e}")
+        sys.exit(1)
+    if not targets:
+        print(f"❌ No talhoes in {args.simulation_file}. Run data_seeder.py first.")
+        sys.exit(1)
+
+    # logs in only the users whose saved token is missing or close to expiry
+    tokens = TokenManager(args.usuarios_url)
+    tokens.load_simulation_data(args.simulation_file)
+    tokens.start(TOKEN_CHECK_INTERVAL)
+    missing = [e for e in tokens.emails() if not tokens.peek_token(e)]
+    if missing:
+        print(f"❌ No valid token for {len(missing)} users (first: {missing[0]}).")
+        sys.exit(1)
+
+    users = len({t[3] for t in targets})
+    print(f"🚀 {args.profile} load for {args.duration}s against {args.base_url} "
+          f"({len(targets)} talhoes, {users} users)")
+    capture = None
+    if args.capture:
+        from traffic_capture import CaptureWriter
+        capture = CaptureWriter(args.capture, source=f"load_generator {args.profile}")
+    generator = LoadGenerator(args.base_url, targets, tokens, build_profile(args), args.duration,
+                              args.connections_per_user, args.max_inflight, args.seed, args.origem,
+                              build_readings(args, targets, args.seed), capture)
+    try:
+        report = asyncio.run(generator.run())
+    finally:
+        tokens.close()
+        if capture is not None:
+            capture.close()
+            print(f"📼 {capture.count} requests captured to {args.capture}")
+    report["config"] = {k: v for k, v in vars(args).items() if k != "output"}
+    report["tokenRefreshes"] = tokens.logins
+    if args.save_tokens and tokens.logins:
+        tokens.save_simulation_data(args.simulation_file)
+
+    print_report(report)
+    output = args.output or f"load_generator_{int(time.time())}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+import argparse
+import codecs
+import json
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+
+import kube_utils
+
+# Streaming log collector and index for the services' console logs.
+# The services write Serilog RenderedCompactJsonFormatter lines ({"@t", "@m",
+# "@tr"/"TraceId", ...properties}); kubectl and the committed analise_logs*.txt
+# captures (UTF-16, CRLF) carry the same lines. Instead of fetching the last 200
+# lines and running one regex over them, lines are read once, as they arrive,
+# from a file (optionally tailed) or `kubectl logs -f`. Each is parsed into an
+# Event: what kind of line it is, and which trace, talhao, correlation id and
+# Ingestao Leitura Id it belongs to. The events are indexed by those keys, so
+# "was an alert logged for talhao X?" is a dict lookup no matter how long the
+# log is, and wait_for() blocks until such a line shows up.
+
+NAMESPACE = kube_utils.NAMESPACE
+ANALISE_POD_SELECTOR = "app.kubernetes.io/name=analise"
+
+# (kind, start of the rendered message) for the lines the services write on purpose
+KINDS = (
+    ("leitura_recebida", "Leitura recebida."),          # Ingestao LeiturasSensoresController, after the insert
+    ("msg_recebida", "MSG RECEBIDA"),                   # Analise consumer, message taken from the queue
+    ("processando", "Processando leitura"),             # Analise consumer, before saving the Leitura
+    ("alerta_gerado", "ALERTA GERADO"),                 # Analise consumer, after saving each Alerta
+    ("talhao_forbidden", "Access forbidden for Talh"),  # Ingestao PropriedadesService
+    ("talhao_not_found", "Talh"),                       # Ingestao PropriedadesService: "Talhão {id} not found"
+    ("request_starting", "Request starting"),
+    ("request_finished", "Request finished"),
+)
+TALHAO_PROPERTIES = ("IdTalhao", "Talhao", "TalhaoId")
+NO_PARENT = "0000000000000000"
+
+_GUID = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+_TALHAO_RE = re.compile(r"Talh\w*[=:]? ?(" + _GUID + ")")
+_LEITURA_ID_RE = re.compile(r"Id=(\d+)")
+_TRACE_RE = re.compile(r"TraceId[\"=: ]+([0-9a-f]{32})")
+
+Event = namedtuple("Event", ["ts", "kind", "level", "message", "trace_id", "span_id", "talhao", "correlation_id",
+                             "leitura_id", "source", "fields"])
+
+
+def _kind(message):
+    for kind, prefix in KINDS:
+        if message.startswith(prefix):
+            if kind == "talhao_not_found" and not message.endswith("not found"):
+                continue
+            return kind
+    return "other"
+
+
+def _lower(value):
+    return value.lower() if isinstance(value, str) else None
+
+
+def parse_line(line, source=None):
+    """One log line -> Event, or None for blank lines.
+
+    Lines that are not CLEF JSON (plain console output) get kind "text" unless
+    they carry one of the known messages; ids are then taken with regexes.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        data = json.loads(line) if line[0] == "{" else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        for kind, prefix in KINDS[:5]:
+            if prefix in line:
+                break
+        else:
+            kind = "text"
+        talhao = _TALHAO_RE.search(line)
+        trace = _TRACE_RE.search(line)
+        leitura = _LEITURA_ID_RE.search(line) if kind == "leitura_recebida" else None
+        return Event(None, kind, None, line, trace and trace.group(1), None, talhao and talhao.group(1).lower(), None,
+                     leitura and int(leitura.group(1)), source, {})
+
+    message = data.get("@m") or data.get("@mt") or ""
+    kind = _kind(message)
+    talhao = next((_lower(data[p]) for p in TALHAO_PROPERTIES if p in data), None)
+    correlation = None
+    leitura_id = data.get("Id") if kind == "leitura_recebida" else None
+    if kind == "msg_recebida":
+        # the queue message itself: {"eventId", "leitura": {"id", "idTalhao", "meta": {"correlationId"}}}
+        try:
+            evento = json.loads(data.get("Json") or message.split(":", 1)[1])
+            leitura = evento.get("leitura") or {}
+            leitura_id = leitura.get("id")
+            talhao = talhao or _lower(leitura.get("idTalhao"))
+            correlation = (leitura.get("meta") or {}).get("correlationId")
+            data["EventId"] = evento.get("eventId")
+            data["OccurredAtUtc"] = evento.get("occurredAtUtc")
+        except (ValueError, IndexError, AttributeError):
+            pass
+    elif talhao is None and kind != "other" and not kind.startswith("request"):
+        match = _TALHAO_RE.search(message)
+        talhao = match and match.group(1).lower()
+    return Event(data.get("@t"), kind, data.get("@l", "Information"), message, data.get("@tr") or data.get("TraceId"),
+                 data.get("@sp") or data.get("SpanId"), talhao, correlation,
+                 None if leitura_id is None else int(leitura_id), source, data)
+
+
+class LogIndex:
+    """Events by trace id, correlation id, talhao and Leitura Id; safe to feed from several threads."""
+
+    def __init__(self):
+        self.events = []
+        self.lines = 0
+        self.kinds = Counter()
+        self._keys = {"trace_id": {}, "correlation_id": {}, "talhao": {}, "leitura_id": {}, "kind": {}}
+        self._changed = threading.Condition()
+
+    def add(self, event):
+        with self._changed:
+            i = len(self.events)
+            self.events.append(event)
+            self.kinds[event.kind] += 1
+            for key, index in self._keys.items():
+                value = getattr(event, key)
+                if value is not None:
+                    index.setdefault(value, []).append(i)
+            self._changed.notify_all()
+
+    def ingest(self, lines, source=None):
+        # Parses and indexes every line; returns how many were read
+        n = 0
+        for line in lines:
+            n += 1
+            event = parse_line(line, source)
+            if event is not None:
+                self.add(event)
+        with self._changed:
+            self.lines += n
+        return n
+
+    def find(self, **query):
+        """Events matching every given key (kind, trace_id, correlation_id, talhao, leitura_id), in log order.
+
+        Starts from the shortest posting list among the keys, so the cost is
+        that list's length, not the log's.
+        """
+        query = {k: (v.lower() if k in ("talhao", "trace_id") and isinstance(v, str) else v)
+                 for k, v in query.items() if v is not None}
+        with self._changed:
+            if not query:
+                return list(self.events)
+            postings = [self._keys[k].get(v, ()) for k, v in query.items()]
+            shortest = min(postings, key=len)
+            return [self.events[i] for i in shortest
+                    if all(getattr(self.events[i], k) == v for k, v in query.items())]
+
+    def first(self, **query):
+        found = self.find(**query)
+        return found[0] if found else None
+
+    def has(self, **query):
+        return bool(self.find(**query))
+
+    def chain(self, correlation_id=None, leitura_id=None):
+        """Every event of one reading: the queue message(s) carrying its correlation id,
+        the Ingestao line with the same Leitura Id, and everything logged under those traces."""
+        seen = set()
+        leitura_ids = {leitura_id} if leitura_id is not None else set()
+        for e in self.find(correlation_id=correlation_id) if correlation_id else ():
+            leitura_ids.add(e.leitura_id)
+        events = []
+        for lid in leitura_ids - {None}:
+            events += self.find(leitura_id=lid)
+        for trace in {e.trace_id for e in events} - {None}:
+            events += self.find(trace_id=trace)
+        out = []
+        for e in events:
+            if id(e) not in seen:
+                seen.add(id(e))
+                out.append(e)
+        return sorted(out, key=lambda e: e.ts or "")
+
+    def wait_for(self, timeout=10.0, **query):
+        # Blocks until an event matching `query` is indexed; returns it, or None on timeout
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                found = self.first(**query)
+                remaining = deadline - time.monotonic()
+                if found is not None or remaining <= 0:
+                    return found
+                self._changed.wait(remaining)
+
+    def summary(self):
+        with self._changed:
+            return {"lines": self.lines, "events": len(self.events), "kinds": dict(self.kinds),
+                    "traces": len(self._keys["trace_id"]), "talhoes": len(self._keys["talhao"]),
+                    "correlationIds": len(self._keys["correlation_id"]), "leituraIds": len(self._keys["leitura_id"])}
+
+
+# -- sources -------------------------------------------------------------------
+
+def _encoding(path):
+    # kubectl output saved from PowerShell is UTF-16 with a BOM; everything else is UTF-8
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if b"\x00" in head[:4] and head[1:2] == b"\x00":
+        return "utf-16-le"
+    return "utf-8-sig"
+
+
+def read_log(path, follow=False, stop=None, poll=0.5):
+    """Yields the lines of a log file; with follow=True keeps tailing it until `stop` is set."""
+    with open(path, encoding=_encoding(path), errors="replace", newline=None) as f:
+        pending = ""
+        while True:
+            line = f.readline()
+            if line:
+                pending += line
+                if pending.endswith("\n"):
+                    yield pending
+                    pending = ""
+                continue
+            if not follow or (stop is not None and stop.is_set()):
+                if pending:
+                    yield pending
+                return
+            time.sleep(poll)
+
+
+class LogCollector:
+    """Feeds a LogIndex from files and/or pods in background threads."""
+
+    def __init__(self, index=None):
+        self.index = index or LogIndex()
+        self._stop = threading.Event()
+        self._threads = []
+        self._procs = []
+
+    def _run(self, lines, source):
+        thread = threading.Thread(target=self.index.ingest, args=(lines, source), daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def add_file(self, path, follow=False):
+        return self._run(read_log(path, follow, self._stop), path)
+
+    def add_pod(self, selector=ANALISE_POD_SELECTOR, namespace=NAMESPACE, follow=True, since=None):
+        pod = kube_utils.get_pod_name(selector, namespace)
+        if not pod:
+            raise RuntimeError(f"No pod for {selector}")
+        args = [kube_utils.KUBECTL, "logs", "-n", namespace, pod] + (["-f"] if follow else [])
+        if since:
+            args.append(f"--since={since}")
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                encoding="utf-8", errors="replace")
+        self._procs.append(proc)
+        return self._run(proc.stdout, pod)
+
+    def join(self, timeout=None):
+        # Waits for the non-following sources to be fully read
+        for thread in self._threads:
+            thread.join(timeout)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for proc in self._procs:
+            proc.terminate()
+        for thread in self._threads:
+            thread.join(5)
+
+
+# -- CLI -----------------------------------------------------------------------
+
+def print_event(e):
+    ids = " ".join(f"{k}={v}" for k, v in (("trace", e.trace_id), ("talhao", e.talhao), ("corr", e.correlation_id),
+                                            ("leitura", e.leitura_id)) if v is not None)
+    print(f"  {e.ts or '-':<30}{e.kind:<18}{ids}  {e.message[:80]}")
+
+
+def benchmark(index, text, assertions, rnd):
+    # `assertions` trace-id lookups: the index vs one regex over the whole text each time
+    traces = [e.trace_id for e in index.events if e.trace_id] or ["0" * 32]
+    sample = [rnd.choice(traces) for _ in range(assertions)]
+    started = time.perf_counter()
+    hits_index = sum(index.has(trace_id=t) for t in sample)
+    t_index = time.perf_counter() - started
+    started = time.perf_counter()
+    hits_regex = sum(re.search(t, text) is not None for t in sample)
+    t_regex = time.perf_counter() - started
+    return {"assertions": assertions, "hits": {"index": hits_index, "regex": hits_regex},
+            "usPerAssertion": {"index": round(t_index / assertions * 1e6, 2), "regex": round(t_regex / assertions * 1e6, 2)}}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Indexes service logs by trace, correlation id and talhao.")
+    parser.add_argument("files", nargs="*", help="Log files (UTF-8 or UTF-16), e.g. analise_logs*.txt")
+    parser.add_argument("--pod", nargs="?", const=ANALISE_POD_SELECTOR, help="Also read this pod selector's logs")
+    parser.add_argument("--namespace", default=NAMESPACE)
+    parser.add_argument("--follow", action="store_true", help="Keep reading new lines until Ctrl+C")
+    parser.add_argument("--trace", help="Print the events of this TraceId")
+    parser.add_argument("--talhao", help="Print the events of this talhao")
+    parser.add_argument("--correlation", help="Print every event of the reading with this correlation id")
+    parser.add_argument("--kind", help="Only events of this kind")
+    parser.add_argument("--bench", type=int, default=0, metavar="N", help="Time N lookups: index vs regex rescans")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.files and not args.pod:
+        print("❌ Give log files and/or --pod.")
+        sys.exit(1)
+    collector = LogCollector()
+    started = time.perf_counter()
+    try:
+        for path in args.files:
+            collector.add_file(path, args.follow)
+        if args.pod:
+            collector.add_pod(args.pod, args.namespace, args.follow)
+        if args.follow:
+            print("Following logs, Ctrl+C to stop...")
+            while True:
+                time.sleep(5)
+                s = collector.index.summary()
+                print(f"  {s['lines']} lines, {s['events']} events, kinds {s['kinds']}")
+        collector.join()
+    except KeyboardInterrupt:
+        pass
+    except (OSError, RuntimeError) as e:
+        print(f"❌ Could not read logs: {e}")
+        sys.exit(1)
+    finally:
+        collector.stop()
+    elapsed = time.perf_counter() - started
+    index = collector.index
+    s = index.summary()
+    print(f"Indexed {s['lines']} lines in {elapsed:.3f}s: {s['traces']} traces, {s['talhoes']} talhoes, "
+          f"{s['correlationIds']} correlation ids, {s['leituraIds']} leitura ids")
+    for kind, n in sorted(s["kinds"].items(), key=lambda kv: -kv[1]):
+        print(f"  {kind:<20}{n:>8}")
+
+    if args.correlation:
+        events = [e for e in index.chain(correlation_id=args.correlation) if not args.kind or e.kind == args.kind]
+    elif args.trace or args.talhao or args.kind:
+        events = index.find(trace_id=args.trace, talhao=args.talhao, kind=args.kind)
+    else:
+        events = None
+    if events is not None:
+        print(f"\n{len(events)} matching event(s):")
+        for e in events:
+            print_event(e)
+
+    if args.bench:
+        text = "\n".join(e.message if not e.fields else json.dumps(e.fields) for e in index.events)
+        r = benchmark(index, text, args.bench, random.Random(1))
+        print(f"\n{r['assertions']} TraceId assertions: index {r['usPerAssertion']['index']} us, "
+              f"regex over the log {r['usPerAssertion']['regex']} us per assertion "
+              f"({r['hits']['index']}/{r['hits']['regex']} hits)")
+
+
+if __name__ == "__main__":
+    main()
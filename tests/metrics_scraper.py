@@ -0,0 +1,517 @@
+import argparse
+import datetime
+import json
+import math
+import re
+import subprocess
+import sys
+import threading
+import time
+from array import array
+
+import requests
+
+# Scrapes the services' Prometheus /metrics during a run, without a Prometheus server.
+# One thread per service polls /metrics every --interval seconds and streams the
+# text exposition line by line. Families outside --family (default: the
+# AgroSolutions meters and the ASP.NET Core / HttpClient HTTP histograms) are
+# skipped before their labels are parsed. Every sample lands in a per-service
+# Ring: one timestamp per scrape and one float per series per scrape, in
+# fixed-size arrays, so memory stays at --capacity scrapes whatever the run length.
+# Rates are counter increases over a window (resets handled as Prometheus does),
+# and quantiles are interpolated from the histogram bucket increases like
+# histogram_quantile().
+#
+#   metrics_scraper.py record -o before.json -- python load_driver.py --rate 300
+#   metrics_scraper.py record -o after.json --duration 120
+#   metrics_scraper.py diff before.json after.json
+#
+# record prints live rates and p99s, and writes the per-series summary of the
+# whole run. diff matches the series of two summaries and flags latency
+# quantiles and error rates that got worse by more than --threshold.
+
+SERVICES = {
+    "usuarios": "http://localhost:30001",
+    "propriedades": "http://localhost:30002",
+    "ingestao": "http://localhost:30003",
+    "analise": "http://localhost:30004",
+}
+# IngestaoMetrics.LeiturasTotal / RabbitMqErrorsTotal, AnaliseMetrics.AlertProcessingDuration,
+# and the OpenTelemetry ASP.NET Core and HttpClient instrumentation
+DEFAULT_FAMILIES = ("agrosolutions_", "http_server_request_duration_seconds", "http_client_request_duration_seconds")
+LEITURAS_METRIC = "agrosolutions_sensor_readings_total"
+ALERTS_METRIC = "agrosolutions_alerts_processing_duration_seconds"
+HTTP_SERVER_METRIC = "http_server_request_duration_seconds"
+DEFAULT_INTERVAL = 1.0
+DEFAULT_CAPACITY = 3600
+DEFAULT_LIVE_WINDOW = 10.0
+DEFAULT_THRESHOLD = 0.10
+QUANTILES = (0.5, 0.95, 0.99)
+HISTOGRAM_SUFFIXES = ("_bucket", "_sum", "_count")
+
+_LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+_UNESCAPE = {"\\\\": "\\", '\\"': '"', "\\n": "\n"}
+
+
+# -- parsing -------------------------------------------------------------------
+
+def _unescape(value):
+    return re.sub(r'\\[\\"n]', lambda m: _UNESCAPE[m.group(0)], value) if "\\" in value else value
+
+
+def parse(lines, families=None):
+    """(sample name, labels tuple, value) for each sample in Prometheus text exposition lines.
+
+    `lines` may be any iterable (e.g. response.iter_lines()), so a scrape is parsed as it
+    arrives. Samples whose name does not start with one of `families` are skipped unparsed.
+    """
+    for line in lines:
+        if not line or line[0] == "#":
+            continue
+        if families is not None and not line.startswith(families):
+            continue
+        brace = line.find("{")
+        space = line.find(" ")
+        if brace != -1 and (space == -1 or brace < space):
+            name = line[:brace]
+            end = line.rindex("}")
+            labels = tuple(sorted((k, _unescape(v)) for k, v in _LABEL_RE.findall(line[brace + 1:end])))
+            rest = line[end + 1:]
+        else:
+            name, labels, rest = line[:space], (), line[space:]
+        yield name, labels, float(rest.split()[0])
+
+
+def scrape(http, url, families=DEFAULT_FAMILIES, timeout=5):
+    # {(name, labels): value} from one GET of <url>/metrics
+    with http.get(f"{url}/metrics", timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        return {(name, labels): value
+                for name, labels, value in parse(resp.iter_lines(decode_unicode=True), families)}
+
+
+def total(samples, name):
+    # sum of `name` over all its label sets
+    return sum(v for (n, _), v in samples.items() if n == name)
+
+
+# -- storage -------------------------------------------------------------------
+
+class Ring:
+    """The last `capacity` scrapes of one service.
+
+    times[i] is when scrape slot i was taken; series[key][i] the sample of that series
+    in it (NaN when the series was absent). Slots are reused oldest first.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.times = array("d", [math.nan]) * capacity
+        self.series = {}     # (name, labels) -> array("d")
+        self.head = 0        # next slot written
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def append(self, t, samples):
+        with self._lock:
+            i = self.head
+            self.times[i] = t
+            for key, values in self.series.items():
+                values[i] = samples.get(key, math.nan)
+            for key, value in samples.items():
+                if key not in self.series:
+                    values = self.series[key] = array("d", [math.nan]) * self.capacity
+                    values[i] = value
+            self.head = (i + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def slots(self, since=None):
+        # slot indexes oldest -> newest, taken at or after `since`
+        with self._lock:
+            order = [(self.head - self.size + k) % self.capacity for k in range(self.size)]
+        return [i for i in order if since is None or self.times[i] >= since]
+
+    def keys(self, name=None):
+        with self._lock:
+            return [k for k in self.series if name is None or k[0] == name]
+
+
+def increase(values, slots):
+    # counter increase across the slots; a drop is a restart, counted from zero. A series
+    # missing from a scrape before its first sample did not exist yet, so it starts at zero
+    out, prev = 0.0, None
+    for i in slots:
+        v = values[i]
+        if math.isnan(v):
+            if prev is None:
+                prev = 0.0
+            continue
+        if prev is not None:
+            out += v - prev if v >= prev else v
+        prev = v
+    return out
+
+
+def histogram_quantile(q, buckets):
+    # buckets: [(le, cumulative count)] sorted by le, ending with +Inf; linear within a bucket
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower_le, lower_count = 0.0, 0.0
+    for le, count in buckets:
+        if count >= rank:
+            if math.isinf(le):
+                return lower_le
+            if count == lower_count:
+                return le
+            return lower_le + (le - lower_le) * (rank - lower_count) / (count - lower_count)
+        lower_le, lower_count = le, count
+    return buckets[-1][0]
+
+
+def _without(labels, name):
+    return tuple(kv for kv in labels if kv[0] != name)
+
+
+def summarize(ring, since=None):
+    """Per-series summary over the ring (from `since`): counters and gauges by label set,
+    histograms by label set without `le`."""
+    slots = ring.slots(since)
+    if len(slots) < 2:
+        return []
+    span = ring.times[slots[-1]] - ring.times[slots[0]]
+    keys = sorted(ring.keys())
+    bases = {name[:-len("_bucket")] for name, _ in keys if name.endswith("_bucket")}
+    out = []
+    histograms = {}
+    for name, labels in keys:
+        values = ring.series[(name, labels)]
+        base = next((name[:-len(s)] for s in HISTOGRAM_SUFFIXES if name.endswith(s) and name[:-len(s)] in bases), None)
+        if base is not None:
+            h = histograms.setdefault((base, _without(labels, "le")), {"buckets": []})
+            if name.endswith("_bucket"):
+                le = dict(labels)["le"]
+                h["buckets"].append((float(le), increase(values, slots)))
+            else:
+                h[name[len(base) + 1:]] = increase(values, slots)
+            continue
+        inc = increase(values, slots)
+        last = next((values[i] for i in reversed(slots) if not math.isnan(values[i])), None)
+        if name.endswith("_total"):
+            out.append({"name": name, "type": "counter", "labels": dict(labels), "increase": inc,
+                        "rate": inc / span if span > 0 else None})
+        else:
+            out.append({"name": name, "type": "gauge", "labels": dict(labels), "last": last})
+    for (base, labels), h in sorted(histograms.items()):
+        count = h.get("count", 0.0)
+        if not count:
+            continue
+        out.append(_histogram_entry(base, dict(labels), sorted(h["buckets"]), count, h.get("sum", 0.0), span))
+    return out
+
+
+def _histogram_entry(name, labels, buckets, count, sum_, span):
+    entry = {"name": name, "type": "histogram", "labels": labels, "count": count,
+             "rate": count / span if span else None, "mean": sum_ / count, "sum": sum_, "span": span}
+    for q in QUANTILES:
+        entry[f"p{int(q * 100)}"] = histogram_quantile(q, buckets)
+    # cumulative increases per `le`, so label sets can be merged (combine) after the run
+    entry["buckets"] = [["+Inf" if math.isinf(le) else le, c] for le, c in buckets]
+    return entry
+
+
+def combine(entries, name, **match):
+    """One summary entry summing every label set of `name` whose labels include `match`."""
+    picked = [e for e in entries if e["name"] == name and all(e["labels"].get(k) == v for k, v in match.items())]
+    if not picked:
+        return None
+    rates = [e["rate"] for e in picked if e.get("rate") is not None]
+    if picked[0]["type"] != "histogram":
+        return {"increase": sum(e["increase"] for e in picked), "rate": sum(rates) if rates else None}
+    # bucket increases add up across label sets (the bounds are per family)
+    merged = {}
+    for e in picked:
+        for le, c in e["buckets"]:
+            merged[float(le)] = merged.get(float(le), 0.0) + c
+    out = _histogram_entry(name, match, sorted(merged.items()), sum(e["count"] for e in picked),
+                           sum(e["sum"] for e in picked), picked[0]["span"])
+    out["rate"] = sum(rates) if rates else None
+    return out
+
+
+# -- scraping ------------------------------------------------------------------
+
+class Scraper:
+    """Polls each service's /metrics into its own Ring until stop()."""
+
+    def __init__(self, services, interval=DEFAULT_INTERVAL, capacity=DEFAULT_CAPACITY, families=DEFAULT_FAMILIES):
+        self.services = dict(services)
+        self.interval = interval
+        self.families = families
+        self.rings = {service: Ring(capacity) for service in self.services}
+        self.errors = {service: 0 for service in self.services}
+        self.last_error = {}
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _poll(self, service, url):
+        http = requests.Session()
+        ring = self.rings[service]
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                samples = scrape(http, url, self.families, timeout=max(self.interval, 1))
+                ring.append(time.time(), samples)
+            except (requests.RequestException, ValueError) as e:
+                self.errors[service] += 1
+                self.last_error[service] = str(e)
+            # fixed schedule: a slow scrape does not push the following ones back
+            next_at += self.interval
+            self._stop.wait(max(0.0, next_at - time.monotonic()))
+
+    def start(self):
+        for service, url in self.services.items():
+            thread = threading.Thread(target=self._poll, args=(service, url), name=f"scrape-{service}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def summary(self, since=None):
+        return {service: {"url": self.services[service], "scrapes": len(ring.slots(since)),
+                          "errors": self.errors[service], "series": summarize(ring, since)}
+                for service, ring in self.rings.items()}
+
+
+def _ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}ms"
+
+
+def live_line(scraper, window):
+    since = time.time() - window
+    parts = []
+    for service, ring in scraper.rings.items():
+        entries = summarize(ring, since)
+        if not entries:
+            parts.append(f"{service} -" if not scraper.errors[service] else f"{service} ❌")
+            continue
+        bits = []
+        http = combine(entries, HTTP_SERVER_METRIC)
+        if http:
+            bits.append(f"{http['rate'] or 0:.0f} req/s p99 {_ms(http['p99'])}")
+        leituras = combine(entries, LEITURAS_METRIC)
+        if leituras and leituras["rate"] is not None:
+            bits.append(f"{leituras['rate']:.0f} leituras/s")
+        alerts = combine(entries, ALERTS_METRIC)
+        if alerts:
+            bits.append(f"{alerts['rate'] or 0:.0f} alertas/s")
+        parts.append(f"{service} {', '.join(bits) or '-'}")
+    return " | ".join(parts)
+
+
+# -- diff ----------------------------------------------------------------------
+
+def _by_key(summary):
+    # (service, name, labels) -> entry; counters are summed per family, since their labels
+    # (propriedade_id, ...) name entities that differ from run to run
+    out = {}
+    for service, data in summary["services"].items():
+        for e in data["series"]:
+            if e["type"] == "counter":
+                agg = out.setdefault((service, e["name"], ()), {"name": e["name"], "type": "counter", "labels": {},
+                                                                "increase": 0.0, "rate": 0.0})
+                agg["increase"] += e["increase"]
+                agg["rate"] += e["rate"] or 0.0
+            else:
+                out[(service, e["name"], tuple(sorted(e["labels"].items())))] = e
+    return out
+
+
+def _change(before, after):
+    if before is None or after is None:
+        return None
+    if before == 0:
+        return 0.0 if after == 0 else math.inf
+    return (after - before) / before
+
+
+def _errors_per_request(series):
+    # 5xx share of the server requests, from the http_server histogram counts
+    counts = [(e["labels"].get("http_response_status_code", ""), e["count"])
+              for e in series if e["name"] == HTTP_SERVER_METRIC]
+    requests_total = sum(c for _, c in counts)
+    return sum(c for status, c in counts if status.startswith("5")) / requests_total if requests_total else None
+
+
+def diff(before, after, threshold=DEFAULT_THRESHOLD):
+    """Rows comparing the two runs' summaries; a row is a regression when a latency
+    quantile or the 5xx share grew by more than `threshold`."""
+    rows = []
+    old, new = _by_key(before), _by_key(after)
+    for key in sorted(set(old) | set(new)):
+        a, b = old.get(key), new.get(key)
+        entry = b or a
+        row = {"service": key[0], "name": key[1], "labels": entry["labels"], "type": entry["type"], "changes": {}}
+        fields = ("rate", "mean") + tuple(f"p{int(q * 100)}" for q in QUANTILES) if entry["type"] == "histogram" \
+            else ("rate",) if entry["type"] == "counter" else ("last",)
+        for field in fields:
+            x, y = (a or {}).get(field), (b or {}).get(field)
+            row["changes"][field] = {"before": x, "after": y, "change": _change(x, y)}
+        row["regression"] = entry["type"] == "histogram" and any(
+            (row["changes"][f]["change"] or 0) > threshold for f in fields[2:])
+        row["only"] = None if a and b else ("before" if a else "after")
+        rows.append(row)
+    for service in sorted(set(before["services"]) | set(after["services"])):
+        x = _errors_per_request(before["services"].get(service, {}).get("series", []))
+        y = _errors_per_request(after["services"].get(service, {}).get("series", []))
+        if x is None and y is None:
+            continue
+        rows.append({"service": service, "name": "http 5xx share", "labels": {}, "type": "ratio",
+                     "changes": {"share": {"before": x, "after": y, "change": _change(x, y)}},
+                     "regression": y is not None and y > (x or 0) * (1 + threshold) and y - (x or 0) > 0.001,
+                     "only": None})
+    return rows
+
+
+def _fmt(value, seconds):
+    if value is None:
+        return "-"
+    return f"{value * 1000:.1f}ms" if seconds else f"{value:.4g}"
+
+
+def print_diff(rows, show_all=False):
+    print(f"{'service / series':<76}{'field':>7}{'before':>12}{'after':>12}{'change':>9}")
+    for row in rows:
+        if not show_all and not row["regression"] and row["type"] not in ("counter", "ratio"):
+            continue
+        labels = ",".join(f"{k}={v}" for k, v in row["labels"].items())
+        title = f"{'⚠️ ' if row['regression'] else ''}{row['service']} {row['name']}{'{' + labels + '}' if labels else ''}"
+        if row["only"]:
+            title += f" (only {row['only']})"
+        for field, c in row["changes"].items():
+            seconds = row["name"].endswith("_seconds") and field not in ("rate",)
+            change = "-" if c["change"] is None else "new" if math.isinf(c["change"]) else f"{c['change']:+.0%}"
+            print(f"{title[:75]:<76}{field:>7}{_fmt(c['before'], seconds):>12}{_fmt(c['after'], seconds):>12}{change:>9}")
+            title = ""
+
+
+# -- CLI -----------------------------------------------------------------------
+
+def parse_services(values):
+    if not values:
+        return dict(SERVICES)
+    services = {}
+    for value in values:
+        name, _, url = value.partition("=")
+        services[name] = url.rstrip("/") if url else SERVICES[name]
+    return services
+
+
+def record(args):
+    scraper = Scraper(parse_services(args.service), args.interval, args.capacity,
+                      None if args.all_families else tuple(args.family or DEFAULT_FAMILIES))
+    started = time.time()
+    started_at = datetime.datetime.utcnow().isoformat() + "Z"
+    print(f"📈 Scraping {', '.join(scraper.services)} every {args.interval:g}s")
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    proc = subprocess.Popen(command) if command else None
+    next_live = time.monotonic() + args.live_window
+    with scraper:
+        try:
+            while True:
+                if proc is not None and proc.poll() is not None:
+                    break
+                if args.duration and time.time() - started >= args.duration:
+                    break
+                time.sleep(min(0.2, args.interval))
+                if not args.quiet and time.monotonic() >= next_live:
+                    print(f"[{time.time() - started:>6.0f}s] {live_line(scraper, args.live_window)}", flush=True)
+                    next_live += args.live_window
+        except KeyboardInterrupt:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+        # one last scrape after the load, so the run's final increments are included
+        time.sleep(args.interval)
+
+    report = {"startedAt": started_at, "endedAt": datetime.datetime.utcnow().isoformat() + "Z",
+              "interval": args.interval, "command": command or None,
+              "exitCode": proc.returncode if proc is not None else None, "services": scraper.summary()}
+    for service, data in report["services"].items():
+        if data["errors"]:
+            print(f"⚠️ {service}: {data['errors']} failed scrapes ({scraper.last_error.get(service)})")
+    print_summary(report)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"\n✅ Run saved to {args.output}")
+    return proc.returncode if proc is not None else 0
+
+
+def print_summary(report):
+    print(f"\n{'service':<14}{'http req/s':>11}{'p50':>10}{'p95':>10}{'p99':>10}{'leituras/s':>12}{'alertas':>9}")
+    for service, data in report["services"].items():
+        series = data["series"]
+        http = combine(series, HTTP_SERVER_METRIC)
+        leituras = combine(series, LEITURAS_METRIC)
+        alerts = combine(series, ALERTS_METRIC)
+        print(f"{service:<14}{(http['rate'] or 0) if http else 0:>11.1f}{_ms(http and http['p50']):>10}{_ms(http and http['p95']):>10}"
+              f"{_ms(http and http['p99']):>10}"
+              f"{(leituras['rate'] or 0) if leituras else 0:>12.1f}{int(alerts['count']) if alerts else 0:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scrapes the services' /metrics during a run and diffs runs")
+    sub = parser.add_subparsers(dest="command_name", required=True)
+    rec = sub.add_parser("record", help="Scrape until --duration or the wrapped command ends (Ctrl-C stops)")
+    rec.add_argument("--service", action="append", metavar="NAME[=URL]",
+                     help=f"Service to scrape (repeatable; default all of {', '.join(SERVICES)})")
+    rec.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between scrapes")
+    rec.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY, help="Scrapes kept per service")
+    rec.add_argument("--family", action="append", help="Metric name prefix to keep (repeatable)")
+    rec.add_argument("--all-families", action="store_true", help="Keep every metric (runtime, kestrel, ...)")
+    rec.add_argument("--duration", type=float, help="Seconds to scrape (default: until the command ends)")
+    rec.add_argument("--live-window", type=float, default=DEFAULT_LIVE_WINDOW,
+                     help="Seconds covered by (and between) the live lines")
+    rec.add_argument("--quiet", action="store_true", help="No live lines")
+    rec.add_argument("-o", "--output", required=True, help="JSON summary of the run")
+    rec.add_argument("command", nargs=argparse.REMAINDER, help="-- command to run while scraping")
+    cmp_ = sub.add_parser("diff", help="Compare two recorded runs")
+    cmp_.add_argument("before")
+    cmp_.add_argument("after")
+    cmp_.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                      help="Relative growth of a latency quantile or 5xx share flagged as a regression")
+    cmp_.add_argument("--all", action="store_true", help="Show every series, not only counters and regressions")
+    cmp_.add_argument("--output", help="JSON file with the diff rows")
+    args = parser.parse_args(argv)
+
+    if args.command_name == "record":
+        sys.exit(record(args))
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    rows = diff(before, after, args.threshold)
+    print_diff(rows, args.all)
+    regressions = [r for r in rows if r["regression"]]
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=1, default=str)
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} series regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import requests
+import json
+import time
+import sys
+import datetime
+import argparse
+import math
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import db_access
+
+# End-to-end latency benchmark built on the qa_validation_v2 flow:
+# register -> login -> property -> talhao, then readings POSTed at a fixed rate,
+# each tagged with a unique meta.correlationId. Latencies count from the time
+# each reading was due on the schedule, so a backed-up sender shows up in them.
+# A poller thread batches one SensorLeitura query and one Alerta query per tick
+# and timestamps when each reading shows up in SensorLeitura. Alerta rows carry
+# no reading reference (LeituraId is 0), so alerts are reported in aggregate:
+# how many appeared and how long after the last due reading the last one did.
+# Reports p50/p95/p99/max for ingest-ack and SensorLeitura persistence, and
+# writes everything as JSON.
+
+BASE_URL_USUARIOS = "http://localhost:30001"
+BASE_URL_PROPRIEDADES = "http://localhost:30002"
+BASE_URL_INGESTAO = "http://localhost:30003"
+DB_INGESTAO = "Ingestao"
+DB_ANALISE = "Analise"
+
+# > 35°C with humidity >= 30%: MotorDeAlertas emits exactly one "Temperatura Crítica" alert per
+# reading and neither humidity rule fires (drought needs every reading of the last 24h below 30%)
+BENCH_METRICAS = {"umidadeSoloPercentual": 35, "temperaturaCelsius": 40, "precipitacaoMilimetros": 0}
+BENCH_ALERTA = "Temperatura Cr%"
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_samples, p):
+    # nearest-rank percentile
+    if not sorted_samples:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples):
+    data = sorted(samples)
+    summary = {"count": len(data)}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = None if not data else round(percentile(data, p) * 1000, 3)
+    summary["max_ms"] = None if not data else round(data[-1] * 1000, 3)
+    summary["mean_ms"] = None if not data else round(sum(data) / len(data) * 1000, 3)
+    return summary
+
+
+def setup_tenant(session, urls):
+    # Same steps as qa_validation_v2: a fresh user/property/talhao per run
+    email = f"bench_{uuid.uuid4().hex[:12]}@test.com"
+    password = "QaPassword123!"
+    resp = session.post(f"{urls['usuarios']}/api/usuarios/registrar",
+                        json={"nome": "Benchmark", "email": email, "senha": password, "tipoId": 1})
+    if resp.status_code not in [200, 201]:
+        raise RuntimeError(f"Register failed: {resp.status_code} {resp.text}")
+    resp = session.post(f"{urls['usuarios']}/api/usuarios/login", json={"email": email, "password": password})
+    if resp.status_code != 200:
+        raise RuntimeError(f"Login failed: {resp.status_code} {resp.text}")
+    headers = {"Authorization": f"Bearer {resp.json().get('token')}"}
+
+    resp = session.post(f"{urls['propriedades']}/api/v1/Propriedades",
+                        json={"nome": "Benchmark Farm", "localizacao": "Bench Lab"}, headers=headers)
+    if resp.status_code not in [200, 201]:
+        raise RuntimeError(f"Create Property failed: {resp.status_code} {resp.text}")
+    prop_id = resp.json().get("id")
+    resp = session.post(f"{urls['propriedades']}/api/v1/Propriedades/{prop_id}/talhoes",
+                        json={"nome": "Talhao Benchmark", "cultura": "Milho", "area": 30}, headers=headers)
+    if resp.status_code not in [200, 201]:
+        raise RuntimeError(f"Create Talhao failed: {resp.status_code} {resp.text}")
+    return headers, prop_id, resp.json().get("id")
+
+
+class PipelineBenchmark:
+    def __init__(self, urls, run_sql_batch, count, rate, concurrency=8, poll_interval=0.1, timeout=60,
+                 db_ingestao=DB_INGESTAO, db_analise=DB_ANALISE):
+        self.urls = urls
+        self.run_sql_batch = run_sql_batch
+        self.count = count
+        self.rate = rate
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.db_ingestao = db_ingestao
+        self.db_analise = db_analise
+        self.run_id = uuid.uuid4().hex[:10]
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+        self._lock = threading.Lock()
+        self.sent_at = {}        # correlationId -> monotonic time it was due
+        self.ack_latency = []
+        self.errors = 0
+        self.persisted_at = {}   # correlationId -> first time seen in SensorLeitura
+        self.alert_count = 0
+        self.last_alert_at = None  # when alert_count last grew
+        self._last_leitura_id = 0
+
+    def _send(self, i, due, headers, prop_id, talhao_id):
+        correlation_id = f"bench-{self.run_id}-{i}"
+        payload = {
+            "idPropriedade": prop_id,
+            "idTalhao": talhao_id,
+            "origem": "BENCHMARK",
+            "dataHoraCapturaUtc": datetime.datetime.utcnow().isoformat() + "Z",
+            "metricas": BENCH_METRICAS,
+            "meta": {"idDispositivo": "BENCH-DEV-01", "correlationId": correlation_id},
+        }
+        with self._lock:
+            self.sent_at[correlation_id] = due
+        try:
+            resp = self.session.post(f"{self.urls['ingestao']}/api/v1/leituras-sensores", json=payload, headers=headers, timeout=30)
+            ok = resp.status_code in [200, 201, 202]
+        except requests.exceptions.RequestException:
+            ok = False
+        elapsed = time.monotonic() - due
+        with self._lock:
+            if ok:
+                self.ack_latency.append(elapsed)
+            else:
+                self.errors += 1
+                del self.sent_at[correlation_id]
+
+    def _poll_once(self, talhao_id):
+        leituras, alertas = self.run_sql_batch([
+            (f"SELECT Id, CorrelationId FROM SensorLeitura WHERE IdTalhao = '{talhao_id}' AND Id > {self._last_leitura_id}",
+             self.db_ingestao),
+            (f"SELECT COUNT(*) FROM Alerta WHERE IdTalhao = '{talhao_id}' AND Mensagem LIKE '{BENCH_ALERTA}'",
+             self.db_analise),
+        ])
+        now = time.monotonic()
+        with self._lock:
+            for line in (leituras or "").splitlines():
+                parts = line.split(None, 1)
+                if len(parts) != 2:
+                    continue
+                self._last_leitura_id = max(self._last_leitura_id, int(parts[0]))
+                if parts[1] in self.sent_at:
+                    self.persisted_at.setdefault(parts[1], now)
+            try:
+                alert_count = int((alertas or "0").split()[0])
+            except (ValueError, IndexError):
+                alert_count = self.alert_count
+            if alert_count > self.alert_count:
+                self.alert_count, self.last_alert_at = alert_count, now
+
+    def _done(self):
+        with self._lock:
+            acked = len(self.ack_latency)
+            return len(self.persisted_at) >= acked and self.alert_count >= acked
+
+    def run(self):
+        print(f"Setting up tenant (run {self.run_id})...")
+        headers, prop_id, talhao_id = setup_tenant(self.session, self.urls)
+        print(f"✅ Talhao {talhao_id} ready. Sending {self.count} readings at {self.rate}/s...")
+
+        sending = threading.Event()
+        sending.set()
+
+        def poller():
+            while sending.is_set() or not self._done():
+                self._poll_once(talhao_id)
+                if time.monotonic() > deadline:
+                    return
+                time.sleep(self.poll_interval)
+
+        deadline = float("inf")
+        poll_thread = threading.Thread(target=poller, daemon=True)
+        poll_thread.start()
+
+        # Open-loop schedule: reading i is due at t0 + i / rate regardless of response times
+        t0 = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for i in range(self.count):
+                due = t0 + i / self.rate
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._send, i, due, headers, prop_id, talhao_id)
+        send_elapsed = time.monotonic() - t0
+        last_due = t0 + (self.count - 1) / self.rate
+
+        deadline = time.monotonic() + self.timeout
+        sending.clear()
+        poll_thread.join()
+
+        with self._lock:
+            persisted = [self.persisted_at[c] - self.sent_at[c] for c in self.persisted_at]
+            acked = len(self.ack_latency)
+            alert_count = self.alert_count
+            all_alerted = alert_count >= acked and self.last_alert_at is not None
+            drain = round((self.last_alert_at - last_due) * 1000, 3) if all_alerted else None
+
+        return {
+            "runId": self.run_id,
+            "startedAtUtc": datetime.datetime.utcnow().isoformat() + "Z",
+            "config": {"count": self.count, "rate": self.rate, "concurrency": self.concurrency,
+                       "pollIntervalSeconds": self.poll_interval, "urls": self.urls},
+            "talhaoId": talhao_id,
+            "sent": self.count,
+            "acked": acked,
+            "errors": self.errors,
+            "offeredRate": round(self.count / send_elapsed, 2) if send_elapsed > 0 else None,
+            "latency": {
+                "ingest_ack": summarize(self.ack_latency),
+                "sensor_leitura_persisted": summarize(persisted),
+            },
+            # one alert per reading, but not attributable to a reading: counts and the drain time only
+            "alerta": {"created": alert_count, "lastAfterLastDueMs": drain},
+            "missing": {"sensor_leitura": acked - len(persisted), "alerta": max(0, acked - alert_count)},
+        }
+
+
+def print_report(report):
+    print(f"\nSent {report['sent']} | Acked {report['acked']} | Errors {report['errors']} | Offered {report['offeredRate']}/s")
+    print(f"{'stage':<26}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for stage, s in report["latency"].items():
+        cells = "".join(f"{'-' if s[k] is None else s[k]:>10}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+        print(f"{stage:<26}{s['count']:>7}{cells}")
+    alerta = report["alerta"]
+    drain = "-" if alerta["lastAfterLastDueMs"] is None else f"{alerta['lastAfterLastDueMs']}ms"
+    print(f"Alerta: {alerta['created']} created, the last {drain} after the last reading was due")
+    if any(report["missing"].values()):
+        print(f"⚠️ Not observed before timeout: {report['missing']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measures ingest -> SensorLeitura -> Alerta latency.")
+    parser.add_argument("--count", type=int, default=100, help="Readings to send")
+    parser.add_argument("--rate", type=float, default=10.0, help="Readings per second")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max requests in flight")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Seconds between DB polls")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for stragglers after sending")
+    parser.add_argument("--db-ingestao", default=DB_INGESTAO)
+    parser.add_argument("--db-analise", default=DB_ANALISE)
+    parser.add_argument("--local", action="store_true", help="Run against the in-process fake stack (no cluster)")
+    parser.add_argument("--output", help="JSON results file (default: pipeline_benchmark_<runId>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print("🚀 Starting Pipeline Latency Benchmark...")
+
+    stack = None
+    urls = {"usuarios": BASE_URL_USUARIOS, "propriedades": BASE_URL_PROPRIEDADES, "ingestao": BASE_URL_INGESTAO}
+    run_sql_batch = db_access.run_sql_batch
+    if args.local:
+        from fake_stack import FakeStack
+        stack = FakeStack().start()
+        urls = stack.urls
+        run_sql_batch = stack.sql.query_many
+        print(f"Using local fake stack: {urls}")
+
+    try:
+        bench = PipelineBenchmark(urls, run_sql_batch, args.count, args.rate, args.concurrency,
+                                  args.poll_interval, args.timeout, args.db_ingestao, args.db_analise)
+        report = bench.run()
+    except (RuntimeError, requests.exceptions.ConnectionError) as e:
+        print(f"❌ Benchmark failed: {e}")
+        sys.exit(1)
+    finally:
+        if stack:
+            stack.stop()
+
+    print_report(report)
+    output = args.output or f"pipeline_benchmark_{report['runId']}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import db_access
+import kube_utils
+import verification
+from log_index import ANALISE_POD_SELECTOR, LogCollector
+from instrumentation import InstrumentedSession, Registry, export, print_summary, timed_sql
+from verification import Verifier
+from wait_utils import wait_for_http
+
+# Parallel runner for the QA / reproduction flows.
+# qa_validation.py, qa_validation_v2.py, reproduce_issue.py and
+# reproduce_issue_db.py each register a user and walk the API one step after
+# another, and check persistence with global COUNT(*) before/after, so they
+# must run one at a time. Here their flows are scenarios made of steps. Each
+# scenario runs in its own process with its own user, property and talhao, and
+# every check is keyed by those ids (verification.py), so
+# scenarios do not see each other's rows. A full pass takes as long as the
+# slowest scenario. Steps are timed one by one, and the HTTP/SQL timings of every
+# process are merged into one Registry.
+#
+# Scenarios marked exclusive (the rollout restart) disturb the others and run
+# alone after the parallel phase, only with --restart.
+
+BASE_URL_USUARIOS = "http://localhost:30001"
+BASE_URL_PROPRIEDADES = "http://localhost:30002"
+BASE_URL_INGESTAO = "http://localhost:30003"
+NAMESPACE = "agrosolutions-local"
+JOB = "qa_runner"
+STEP_METRIC = "qa_step_duration_seconds"
+
+Step = namedtuple("Step", ["name", "run", "required"])
+Scenario = namedtuple("Scenario", ["name", "steps", "exclusive"])
+
+
+class StepSkipped(Exception):
+    pass
+
+
+class Context:
+    """Everything one scenario's steps share: endpoints, clients and the ids it created."""
+
+    def __init__(self, scenario, urls, run_sql_query, http, local=False):
+        self.scenario = scenario
+        self.urls = urls
+        self.run_sql_query = run_sql_query
+        self.http = http
+        self.local = local
+        # unique per scenario run: user e-mail and entity names
+        self.tag = f"{scenario}_{uuid.uuid4().hex[:10]}"
+        self.headers = None
+        self.email = None
+        self.password = "QaPassword123!"
+        self.prop_id = None
+        self.talhao_id = None
+        self.readings_sent = 0
+
+    def expect(self, resp, accept, what):
+        if resp.status_code not in accept:
+            raise AssertionError(f"{what} failed: {resp.status_code} {resp.text[:200]}")
+        return resp
+
+    def verify(self, check, timeout, name):
+        # Polls one keyed verification.Check until it passes
+        verifier = Verifier(lambda statements: [self.run_sql_query(sql, db) for sql, db in statements])
+        waited = verifier.wait([check], timeout=timeout, name=name)
+        count = waited.value[0]
+        if not waited.ok:
+            raise AssertionError(f"{name}: count {count} < {check.minimum} after {waited.elapsed:.2f}s")
+        return f"count {count} after {waited.elapsed:.2f}s"
+
+
+# -- steps ----------------------------------------------------------------------
+# Each step takes the Context, raises on failure and may return a detail string.
+
+def sql_ready(ctx):
+    res = ctx.run_sql_query("SELECT 1", "master")
+    if not res or "1" not in res:
+        raise AssertionError(f"SQL Server check failed. Output: {res}")
+
+
+def register(ctx):
+    ctx.email = f"qa_{ctx.tag}@test.com"
+    resp = ctx.http.post(f"{ctx.urls['usuarios']}/api/usuarios/registrar",
+                         json={"nome": "QA Automation", "email": ctx.email, "senha": ctx.password, "tipoId": 1})
+    ctx.expect(resp, (200, 201), "Register")
+    return ctx.email
+
+
+def login(ctx):
+    resp = ctx.expect(ctx.http.post(f"{ctx.urls['usuarios']}/api/usuarios/login",
+                                    json={"email": ctx.email, "password": ctx.password}), (200,), "Login")
+    token = resp.json().get("token")
+    if not token:
+        raise AssertionError("No token returned.")
+    ctx.headers = {"Authorization": f"Bearer {token}"}
+
+
+def create_property(ctx):
+    resp = ctx.expect(ctx.http.post(f"{ctx.urls['propriedades']}/api/v1/Propriedades",
+                                    json={"nome": f"Fazenda {ctx.tag}", "localizacao": "QA Lab"}, headers=ctx.headers),
+                      (200, 201), "Create Property")
+    ctx.prop_id = resp.json().get("id")
+    return ctx.prop_id
+
+
+def create_talhao(ctx):
+    resp = ctx.expect(ctx.http.post(f"{ctx.urls['propriedades']}/api/v1/Propriedades/{ctx.prop_id}/talhoes",
+                                    json={"nome": f"Talhao {ctx.tag}", "cultura": "Milho", "area": 30},
+                                    headers=ctx.headers),
+                      (200, 201), "Create Talhao")
+    ctx.talhao_id = resp.json().get("id")
+    return ctx.talhao_id
+
+
+def property_in_db(ctx):
+    return ctx.verify(verification.propriedade(ctx.prop_id), timeout=5, name="propriedade_persisted")
+
+
+def property_listed(ctx):
+    resp = ctx.expect(ctx.http.get(f"{ctx.urls['propriedades']}/api/v1/Propriedades", headers=ctx.headers),
+                      (200,), "List properties")
+    if not any(p.get("id") == ctx.prop_id for p in resp.json() or []):
+        raise AssertionError("Property NOT found in API list!")
+
+
+def talhao_listed(ctx):
+    resp = ctx.expect(ctx.http.get(f"{ctx.urls['propriedades']}/api/v1/Propriedades/{ctx.prop_id}/talhoes",
+                                   headers=ctx.headers), (200,), "List talhoes")
+    if not any(t.get("id") == ctx.talhao_id for t in resp.json() or []):
+        raise AssertionError("Talhao NOT found in API list!")
+
+
+def send_reading(umidade):
+    def step(ctx):
+        payload = {
+            "idPropriedade": ctx.prop_id,
+            "idTalhao": ctx.talhao_id,
+            "origem": "QA_SCRIPT",
+            "dataHoraCapturaUtc": datetime.datetime.utcnow().isoformat() + "Z",
+            "metricas": {"umidadeSoloPercentual": umidade, "temperaturaCelsius": 30, "precipitacaoMilimetros": 0},
+            "meta": {"idDispositivo": "QA-DEV-01"},
+        }
+        ctx.expect(ctx.http.post(f"{ctx.urls['ingestao']}/api/v1/leituras-sensores", json=payload, headers=ctx.headers),
+                   (200, 201, 202), "Ingestion")
+        ctx.readings_sent += 1
+    step.__name__ = "send_reading"
+    return step
+
+
+def reading_in_db(ctx):
+    return ctx.verify(verification.sensor_leitura(ctx.talhao_id, minimum=ctx.readings_sent), timeout=10,
+                      name="sensor_leitura_persisted")
+
+
+def alert_in_db(ctx):
+    return ctx.verify(verification.alerta(ctx.talhao_id), timeout=20, name="alerta_created")
+
+
+def ingestao_metrics(ctx):
+    ctx.expect(ctx.http.get(f"{ctx.urls['ingestao']}/metrics", timeout=5), (200,), "Metrics endpoint")
+
+
+def analise_logs_traceid(ctx):
+    # The "ALERTA GERADO" line for this scenario's talhao, carrying a TraceId, streamed from the Analise pod
+    if ctx.local:
+        raise StepSkipped("no pod logs on the local stack")
+    collector = LogCollector()
+    try:
+        collector.add_pod(ANALISE_POD_SELECTOR, NAMESPACE)
+        event = collector.index.wait_for(timeout=10, kind="alerta_gerado", talhao=ctx.talhao_id)
+    except RuntimeError as e:
+        raise AssertionError(str(e))
+    finally:
+        collector.stop()
+    if event is None:
+        raise AssertionError(f"No 'ALERTA GERADO' line for talhao {ctx.talhao_id} in Analise logs.")
+    if not event.trace_id:
+        raise AssertionError("The alert line has no TraceId.")
+    return event.trace_id
+
+
+def restart_propriedades(ctx):
+    if ctx.local:
+        raise StepSkipped("no deployment to restart on the local stack")
+    if not kube_utils.rollout_restart("propriedades", NAMESPACE):
+        raise AssertionError("rollout restart failed")
+    waited = wait_for_http(lambda: ctx.http.get(f"{ctx.urls['propriedades']}/api/v1/Propriedades",
+                                                headers=ctx.headers, timeout=5),
+                           timeout=60, max_interval=5, name="propriedades_ready_after_rollout")
+    if not waited.ok:
+        raise AssertionError(f"Propriedades not ready after {waited.elapsed:.2f}s")
+    return f"ready after {waited.elapsed:.2f}s"
+
+
+# -- scenarios --------------------------------------------------------------------
+
+def _steps(*items):
+    # callables are required steps; (callable, False) marks a step whose failure only warns
+    out = []
+    for item in items:
+        run, required = item if isinstance(item, tuple) else (item, True)
+        out.append(Step(run.__name__, run, required))
+    return out
+
+
+SCENARIOS = {s.name: s for s in [
+    # qa_validation.py: a 25%/30°C reading, which no rule turns into an alert, so none is waited for
+    Scenario("qa_validation", _steps(register, login, create_property, create_talhao, send_reading(25),
+                                     reading_in_db), False),
+    # qa_validation_v2.py: a 15% reading must raise the "Seca Extrema" alert
+    Scenario("qa_validation_v2", _steps(sql_ready, register, login, create_property, (property_in_db, False),
+                                        create_talhao, send_reading(15), (reading_in_db, False), alert_in_db,
+                                        (ingestao_metrics, False), (analise_logs_traceid, False)), False),
+    # reproduce_issue.py without the restart: both entities listed by the API
+    Scenario("reproduce_issue", _steps(register, login, create_property, create_talhao, property_listed,
+                                       talhao_listed), False),
+    # reproduce_issue_db.py: the property row exists in the Propriedades database
+    Scenario("reproduce_issue_db", _steps(register, login, create_property, property_in_db), False),
+    # reproduce_issue.py's restart: still listed after the Propriedades rollout
+    Scenario("persistence_after_restart", _steps(register, login, create_property, create_talhao,
+                                                 restart_propriedades, property_listed, talhao_listed), True),
+]}
+
+
+def run_scenario(name, urls, sql_dir=None, local=False):
+    """Runs one scenario (in a worker process) and returns its report with the timings as a dict."""
+    registry = Registry()
+    job = JOB
+    sql = db_access.sqlite_pool(sql_dir) if sql_dir else db_access.get_executor()
+    ctx = Context(name, urls, timed_sql(sql.query, registry, job), InstrumentedSession(registry, job), local)
+    steps = []
+    ok = True
+    started = time.perf_counter()
+    for step in SCENARIOS[name].steps:
+        t0 = time.perf_counter()
+        detail = None
+        try:
+            detail = step.run(ctx)
+            status = "ok"
+        except StepSkipped as e:
+            status, detail = "skipped", str(e)
+        except Exception as e:
+            status, detail = ("failed" if step.required else "warning"), f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - t0
+        registry.histogram(STEP_METRIC, job=job, scenario=name, step=step.name, status=status).record(elapsed)
+        steps.append({"step": step.name, "status": status, "seconds": round(elapsed, 3),
+                      "detail": None if detail is None else str(detail)})
+        if status == "failed":
+            ok = False
+            break
+    ctx.http.close()
+    return {"scenario": name, "ok": ok, "seconds": round(time.perf_counter() - started, 3),
+            "ids": {"email": ctx.email, "propriedade": ctx.prop_id, "talhao": ctx.talhao_id},
+            "steps": steps, "metrics": registry.to_dict()}
+
+
+def run_all(names, urls, sql_dir=None, local=False, processes=None, serial=False):
+    parallel = [n for n in names if not SCENARIOS[n].exclusive]
+    exclusive = [n for n in names if SCENARIOS[n].exclusive]
+    results = []
+    started = time.perf_counter()
+    if serial:
+        results += [run_scenario(n, urls, sql_dir, local) for n in parallel]
+    elif parallel:
+        # spawn: the parent may be running the fake stack's threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes or len(parallel), mp_context=context) as pool:
+            futures = [pool.submit(run_scenario, n, urls, sql_dir, local) for n in parallel]
+            results += [f.result() for f in futures]
+    results += [run_scenario(n, urls, sql_dir, local) for n in exclusive]
+    return results, time.perf_counter() - started
+
+
+ICONS = {"ok": "✅", "failed": "❌", "warning": "⚠️", "skipped": "⏭️"}
+
+
+def print_report(results, wall):
+    for r in results:
+        print(f"\n{'✅' if r['ok'] else '❌'} {r['scenario']}  ({r['seconds']:.2f}s, talhao {r['ids']['talhao']})")
+        for s in r["steps"]:
+            detail = f"  {s['detail']}" if s["detail"] and s["status"] != "ok" else ""
+            print(f"   {ICONS[s['status']]} {s['step']:<24}{s['seconds'] * 1000:>9.1f} ms{detail}")
+    total = sum(r["seconds"] for r in results)
+    slowest = max((r["seconds"] for r in results), default=0)
+    print(f"\nWall time {wall:.2f}s | slowest scenario {slowest:.2f}s | scenarios back to back {total:.2f}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the QA/reproduction flows as parallel, isolated scenarios.")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all). One of {', '.join(SCENARIOS)}")
+    parser.add_argument("--restart", action="store_true", help="Include the exclusive rollout-restart scenario")
+    parser.add_argument("--processes", type=int, help="Worker processes (default: one per scenario)")
+    parser.add_argument("--serial", action="store_true", help="Run the scenarios one after another, for comparison")
+    parser.add_argument("--local", action="store_true", help="Run against the in-process fake stack (no cluster)")
+    parser.add_argument("--metrics", help="Write the merged timings here (JSON and .prom)")
+    parser.add_argument("--output", help="JSON results file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = args.scenarios or [n for n, s in SCENARIOS.items() if args.restart or not s.exclusive]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f"❌ Unknown scenario(s): {', '.join(unknown)}")
+        sys.exit(1)
+    print(f"🚀 Running {len(names)} QA scenario(s){' serially' if args.serial else ' in parallel'}...")
+
+    stack = None
+    sql_dir = None
+    urls = {"usuarios": BASE_URL_USUARIOS, "propriedades": BASE_URL_PROPRIEDADES, "ingestao": BASE_URL_INGESTAO}
+    if args.local:
+        from fake_stack import FakeStack
+        # file-backed so the worker processes can run their SQL checks
+        sql_dir = tempfile.mkdtemp(prefix="qa_runner_")
+        stack = FakeStack(sql_dir=sql_dir).start()
+        urls = stack.urls
+        print(f"Using local fake stack: {urls}")
+    try:
+        results, wall = run_all(names, urls, sql_dir, args.local, args.processes, args.serial)
+    finally:
+        if stack:
+            stack.stop()
+
+    merged = Registry()
+    for r in results:
+        merged.merge(r.pop("metrics"))
+    print_report(results, wall)
+    print_summary(merged)
+    if args.metrics:
+        export(args.metrics, merged)
+        print(f"📈 Metrics written to {args.metrics} and {args.metrics}.prom")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"wallSeconds": round(wall, 3), "scenarios": results}, f, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+    if not all(r["ok"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
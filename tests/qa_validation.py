@@ -1,9 +1,11 @@
-import requests
 import json
-import subprocess
 import time
 import sys
 import datetime
+import db_access
+from instrumentation import InstrumentedSession, timed_sql
+import verification
+from verification import Verifier
 
 # Configuration
 BASE_URL_USUARIOS = "http://localhost:30001"
@@ -12,31 +14,16 @@ BASE_URL_INGESTAO = "http://localhost:30003"
 SQL_POD_SELECTOR = "app=sql-server"
 NAMESPACE = "agrosolutions-local"
 
-def get_sql_pod_name():
-    cmd = f"kubectl get pods -n {NAMESPACE} -l {SQL_POD_SELECTOR} -o jsonpath={{.items[0].metadata.name}}"
-    res = subprocess.run(["powershell", "-c", cmd], capture_output=True, text=True)
-    return res.stdout.strip()
-
-def run_sql_query(query, database):
-    pod_name = get_sql_pod_name()
-    if not pod_name:
-        print("❌ Could not find SQL Pod.")
-        return None
-    
-    # Using sqlcmd inside the pod
-    # Password set in .env is Fi@p2026 (updated in configmap patch)
-    
-    # Note: Use single quotes for PowerShell execution string, double quotes for query
-    cmd_str = f'kubectl exec -n {NAMESPACE} {pod_name} -- /opt/mssql-tools18/bin/sqlcmd -C -S localhost -U sa -P "Fi@p2026" -d {database} -Q "{query}" -h -1 -W'
-    
-    # print(f"Executing SQL on {database}...")
-    res = subprocess.run(["powershell", "-c", cmd_str], capture_output=True, text=True)
-    if res.returncode != 0:
-        print(f"❌ SQL Error: {res.stderr}")
-        return None
-    return res.stdout.strip()
+# SQL goes through db_access.get_executor(): AGRO_SQL_BACKEND picks the backend and
+# AGRO_SQL_* override the sqlcmd defaults set in main(); nothing connects on import
+run_sql_query = timed_sql(db_access.run_sql_query)
+# Persistence checks keyed by the ids this run created (verification.py), each query still timed
+verifier = Verifier(lambda statements: [run_sql_query(query, database) for query, database in statements])
+# Every HTTP call and SQL check is timed; see instrumentation.py for the exports
+http = InstrumentedSession()
 
 def main():
+    db_access.configure_executor(namespace=NAMESPACE, selector=SQL_POD_SELECTOR)
     print("🚀 Starting QA Validation Script...")
     
     # 1. Authentication
@@ -47,7 +34,7 @@ def main():
     # Register
     print(f"Registering {email}...")
     try:
-        reg_resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/registrar", json={
+        reg_resp = http.post(f"{BASE_URL_USUARIOS}/api/usuarios/registrar", json={
             "nome": "QA Automation",
             "email": email,
             "senha": password,
@@ -62,7 +49,7 @@ def main():
     # Login
     print("Logging in...")
     try:
-        login_resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/login", json={
+        login_resp = http.post(f"{BASE_URL_USUARIOS}/api/usuarios/login", json={
             "email": email,
             "password": password
         })
@@ -88,7 +75,7 @@ def main():
     try:
         # Create Property
         prop_payload = {"nome": "QA Farm", "localizacao": "QA Lab"}
-        prop_resp = requests.post(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", json=prop_payload, headers=headers)
+        prop_resp = http.post(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", json=prop_payload, headers=headers)
         if prop_resp.status_code not in [200, 201]:
             print(f"❌ Create Property failed: {prop_resp.status_code} {prop_resp.text}")
             sys.exit(1)
@@ -99,7 +86,7 @@ def main():
         
         # Create Talhao
         talhao_payload = {"nome": "Talhao QA", "cultura": "Milho", "area": 30}
-        talhao_resp = requests.post(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades/{prop_id}/talhoes", json=talhao_payload, headers=headers)
+        talhao_resp = http.post(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades/{prop_id}/talhoes", json=talhao_payload, headers=headers)
         if talhao_resp.status_code not in [200, 201]:
             print(f"❌ Create Talhao failed: {talhao_resp.status_code} {talhao_resp.text}")
             sys.exit(1)
@@ -112,16 +99,12 @@ def main():
         print(f"❌ Property/Talhao flow failed: {e}")
         sys.exit(1)
 
-    # 3. Ingestao (Sensor Reading) - With Low Humidity to trigger Alert
-    print("\n--- 3. Ingestion & Alerts ---")
+    # 3. Ingestao (Sensor Reading) - low humidity, but not low enough for an alert on its own
+    print("\n--- 3. Ingestion ---")
     try:
-        # Check initial count in Ingestao
-        initial_leituras = run_sql_query("SELECT COUNT(*) FROM Leituras", "AgroSolutionsIngestao")
-        print(f"Initial Leituras Count: {initial_leituras}")
-        
         # Send Reading
         metricas = {
-            "umidadeSoloPercentual": 25, # < 30% to trigger low humidity alert
+            "umidadeSoloPercentual": 25, # < 30%: one drought reading, no alert by itself
             "temperaturaCelsius": 30,
             "precipitacaoMilimetros": 0
         }
@@ -135,37 +118,26 @@ def main():
         }
         
         print("Sending low humidity reading...")
-        ingest_resp = requests.post(f"{BASE_URL_INGESTAO}/api/v1/leituras-sensores", json=payload, headers=headers)
+        ingest_resp = http.post(f"{BASE_URL_INGESTAO}/api/v1/leituras-sensores", json=payload, headers=headers)
         if ingest_resp.status_code not in [200, 201]:
             print(f"❌ Ingestion failed: {ingest_resp.status_code} {ingest_resp.text}")
             sys.exit(1)
         print("✅ Reading sent successfully.")
         
-        # Validate Persistence
-        time.sleep(2) # Wait for persistence
-        final_leituras = run_sql_query("SELECT COUNT(*) FROM Leituras", "AgroSolutionsIngestao")
-        print(f"Final Leituras Count: {final_leituras}")
+        # Validate Persistence (poll for this talhao's reading instead of a fixed sleep)
+        waited = verifier.wait([verification.sensor_leitura(talhao_id)], timeout=10, name="leitura_persisted")
+        print(f"Leituras for talhao {talhao_id}: {waited.value[0]} (after {waited.elapsed:.2f}s)")
         
-        if final_leituras and initial_leituras and int(final_leituras) > int(initial_leituras):
-             print("✅ DB Validation: Data persisted in AgroSolutionsIngestao.")
+        if waited.ok:
+             print("✅ DB Validation: Data persisted in Ingestao.")
         else:
-             print("❌ DB Validation: Count did not increase or invalid response.")
-             
-        # Validate Alert Generation
-        print("Waiting for alert generation (Async)...")
-        time.sleep(10) # Give RabbitMQ and Analise worker time to process.
-        
-        # Check Alertas table in AgroSolutionsAnalise
-        alerts_count = run_sql_query("SELECT COUNT(*) FROM Alertas", "AgroSolutionsAnalise")
-        print(f"Alerts Count: {alerts_count}") 
-        
-        if alerts_count and int(alerts_count) > 0:
-            print("✅ Alert Validation: Alert found is database.")
-        else:
-            print("⚠️ Alert Validation: No alerts found.")
-            
+             print("❌ DB Validation: Reading not found in Ingestao.")
+
+        # No alert to wait for: Seca Extrema needs < 20% and Risco de Seca ten readings < 30%
+        # within 24h (qa_validation_v2.py covers the alert path)
+
     except Exception as e:
-        print(f"❌ Ingestion/Alert flow failed: {e}")
+        print(f"❌ Ingestion flow failed: {e}")
         sys.exit(1)
 
     print("\n--- QA VALIDATION COMPLETE ---")
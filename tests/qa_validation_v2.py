@@ -1,11 +1,14 @@
-import requests
 import json
-import subprocess
 import time
 import sys
 import datetime
 import re
-import pyodbc 
+import kube_utils
+import db_access
+from instrumentation import InstrumentedSession, timed_sql
+from token_manager import decode_jwt_claims
+import verification
+from verification import Verifier
 
 # Configuration
 BASE_URL_USUARIOS = "http://localhost:30001"
@@ -18,54 +21,23 @@ NAMESPACE = "agrosolutions-local"
 
 # Azure SQL Connection String
 SQL_CONN_STR = "Driver={ODBC Driver 17 for SQL Server};Server=tcp:agrosolutions.database.windows.net,1433;Database={database};Uid=usr_agro;Pwd=Fi@p2026;Encrypt=yes;TrustServerCertificate=yes;Connection Timeout=60;"
-SQL_CONN_STR_MASTER = "Driver={ODBC Driver 17 for SQL Server};Server=tcp:agrosolutions.database.windows.net,1433;Database=master;Uid=usr_agro;Pwd=Fi@p2026;Encrypt=yes;TrustServerCertificate=yes;Connection Timeout=60;"
 
-def get_pod_name(selector):
-    # Use output=name and strip 'pod/' prefix
-    cmd = f"kubectl get pods -n {NAMESPACE} -l {selector} -o name"
-    try:
-        res = subprocess.run(["powershell", "-c", cmd], capture_output=True, text=True)
-        if res.returncode == 0 and res.stdout.strip():
-            # Return first line, remove 'pod/'
-            first_pod = res.stdout.strip().split('\n')[0]
-            return first_pod.replace("pod/", "")
-    except Exception as e:
-        print(f"Error getting pod name: {e}")
-    return ""
-
-def run_sql_query(query, database):
-    try:
-        # Use replace instead of format to avoid issues with curly braces in Driver definition
-        conn_str = SQL_CONN_STR.replace("{database}", database)
-        if database == "master":
-             conn_str = SQL_CONN_STR_MASTER
-        
-        print(f"DEBUG: Connecting to {database}...")
-        with pyodbc.connect(conn_str) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query)
-            
-            # If query returns rows (SELECT), fetch result
-            if query.strip().upper().startswith("SELECT"):
-                row = cursor.fetchone()
-                if row:
-                    res = str(row[0]) # Start with first column
-                    return res
-                else:
-                    return "0" 
-            
-            conn.commit()
-            return "OK"
+# SQL goes through db_access.get_executor(): pooled pyodbc connections with SQL_CONN_STR unless
+# AGRO_SQL_BACKEND / AGRO_SQL_CONN_STR say otherwise; nothing connects on import
+run_sql_query = timed_sql(db_access.run_sql_query)
+# Persistence checks keyed by the ids this run created (verification.py), each query still timed
+verifier = Verifier(lambda statements: [run_sql_query(query, database) for query, database in statements])
+# Every HTTP call and SQL check is timed; see instrumentation.py for the exports
+http = InstrumentedSession()
 
-    except Exception as e:
-        print(f"❌ SQL Error using pyodbc: {e}")
-        return None
+def get_pod_name(selector):
+    return kube_utils.get_pod_name(selector, NAMESPACE)
 
 def check_metrics_endpoint(base_url, service_name):
     url = f"{base_url}/metrics"
     print(f"Checking metrics at {url}...")
     try:
-        resp = requests.get(url, timeout=5)
+        resp = http.get(url, timeout=5)
         if resp.status_code == 200:
             print(f"✅ Metrics endpoint functional for {service_name}")
             return True
@@ -83,11 +55,11 @@ def check_logs_for_pattern(selector, pattern, service_name):
          return False
     
     print(f"Checking logs of {pod_name} for pattern '{pattern}'...")
-    cmd = f"kubectl logs -n {NAMESPACE} {pod_name} --tail=200"
-    res = subprocess.run(["powershell", "-c", cmd], capture_output=True, text=True)
+    res = kube_utils.kubectl("logs", "-n", NAMESPACE, pod_name, "--tail=200")
     
     if res.returncode != 0:
         print(f"❌ Failed to get logs for {service_name}: {res.stderr}")
+        kube_utils.invalidate(selector, NAMESPACE)
         return False
         
     if re.search(pattern, res.stdout, re.IGNORECASE):
@@ -98,6 +70,7 @@ def check_logs_for_pattern(selector, pattern, service_name):
         return False
 
 def main():
+    db_access.configure_executor(backend="pyodbc", conn_str=SQL_CONN_STR)
     print("🚀 Starting QA Validation Script (v2)...")
     
     # Check SQL connection first
@@ -121,7 +94,7 @@ def main():
     # Register
     print(f"Registering {email}...")
     try:
-        reg_resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/registrar", json={
+        reg_resp = http.post(f"{BASE_URL_USUARIOS}/api/usuarios/registrar", json={
             "nome": "QA Automation",
             "email": email,
             "senha": password,
@@ -138,7 +111,7 @@ def main():
     # Login
     print("Logging in...")
     try:
-        login_resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/login", json={
+        login_resp = http.post(f"{BASE_URL_USUARIOS}/api/usuarios/login", json={
             "email": email,
             "password": password
         })
@@ -152,17 +125,11 @@ def main():
             sys.exit(1)
         print("✅ Login Successful. Token obtained.")
         print(f"DEBUG: Token: {token}")
-        try:
-            # Simple debug decode without external libs since we might not have pyjwt installed
-            import base64
-            import json
-            parts = token.split('.')
-            if len(parts) > 1:
-                padding = '=' * (4 - len(parts[1]) % 4)
-                payload = json.loads(base64.urlsafe_b64decode(parts[1] + padding).decode('utf-8'))
-                print(f"DEBUG: Token Payload: {json.dumps(payload, indent=2)}")
-        except Exception as ex:
-             print(f"DEBUG: Failed to decode token: {ex}")
+        claims = decode_jwt_claims(token)
+        if claims is not None:
+            print(f"DEBUG: Token Payload: {json.dumps(claims, indent=2)}")
+        else:
+            print("DEBUG: Failed to decode token")
 
     except Exception as e:
         print(f"❌ Login failed: {e}")
@@ -175,12 +142,9 @@ def main():
     prop_id = None
     talhao_id = None
     try:
-        # Check Initial Prop Count
-        initial_props = run_sql_query("SELECT COUNT(*) FROM Propriedades", "Propriedades") # DB Name fixed for Azure
-
         # Create Property
         prop_payload = {"nome": "QA Farm", "localizacao": "QA Lab"}
-        prop_resp = requests.post(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", json=prop_payload, headers=headers)
+        prop_resp = http.post(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", json=prop_payload, headers=headers)
         if prop_resp.status_code not in [200, 201]:
             print(f"❌ Create Property failed: {prop_resp.status_code} {prop_resp.text}")
             sys.exit(1)
@@ -190,17 +154,16 @@ def main():
         print(f"✅ Property Created: {prop_id}")
         
         # Verify Persistence
-        time.sleep(1)
-        final_props = run_sql_query("SELECT COUNT(*) FROM Propriedades", "Propriedades")
-        if final_props and initial_props and int(final_props) > int(initial_props):
+        waited = verifier.wait([verification.propriedade(prop_id)], timeout=5, name="propriedade_persisted")
+        if waited.ok:
              print("✅ DB Validation: Property persisted.")
         else:
-             print(f"❌ DB Validation: Property persistance check failed (Initial: {initial_props}, Final: {final_props}).")
+             print(f"❌ DB Validation: Property {prop_id} not found (rows: {waited.value[0]}).")
              # sys.exit(1) 
 
         # Create Talhao
         talhao_payload = {"nome": "Talhao QA", "cultura": "Milho", "area": 30}
-        talhao_resp = requests.post(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades/{prop_id}/talhoes", json=talhao_payload, headers=headers)
+        talhao_resp = http.post(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades/{prop_id}/talhoes", json=talhao_payload, headers=headers)
         if talhao_resp.status_code not in [200, 201]:
             print(f"❌ Create Talhao failed: {talhao_resp.status_code} {talhao_resp.text}")
             sys.exit(1)
@@ -216,10 +179,6 @@ def main():
     # 3. Ingestao (Sensor Reading) - With Low Humidity to trigger Alert
     print("\n--- 3. Ingestion & Alerts ---")
     try:
-        # Check initial count in Ingestao
-        initial_leituras = run_sql_query("SELECT COUNT(*) FROM SensorLeitura", "Ingestao") # Database name fixed for Azure
-        print(f"Initial Leituras Count: {initial_leituras}")
-        
         # Send Reading
         metricas = {
             "umidadeSoloPercentual": 15, # < 20% to trigger critical low humidity alert
@@ -236,31 +195,29 @@ def main():
         }
         
         print("Sending low humidity reading...")
-        ingest_resp = requests.post(f"{BASE_URL_INGESTAO}/api/v1/leituras-sensores", json=payload, headers=headers)
+        ingest_resp = http.post(f"{BASE_URL_INGESTAO}/api/v1/leituras-sensores", json=payload, headers=headers)
         if ingest_resp.status_code not in [202, 201, 200]:
             print(f"❌ Ingestion failed: {ingest_resp.status_code} {ingest_resp.text}")
             sys.exit(1)
         print("✅ Reading sent successfully.")
         
         # Validate Persistence
-        print("Waiting for processing and persistence (5s)...")
-        time.sleep(5) # Wait for RabbitMQ -> Analise -> DB
-        
-        final_leituras = run_sql_query("SELECT COUNT(*) FROM SensorLeitura", "Ingestao")
-        print(f"Final Leituras Count: {final_leituras}")
+        print("Waiting for processing and persistence...")
+        waited = verifier.wait([verification.sensor_leitura(talhao_id)], timeout=10, name="sensor_leitura_persisted")
+        print(f"Leituras for talhao {talhao_id}: {waited.value[0]} (after {waited.elapsed:.2f}s)")
         
-        if final_leituras is not None and initial_leituras is not None and int(final_leituras) > int(initial_leituras):
+        if waited.ok:
              print("✅ DB Validation: Data persisted in Ingestao.")
         else:
              print("⚠️ DB Validation: Count did not increase in Ingestao (Check if it stores locally or only via queue).")
         
         # 4. Alertas validation
         
-        # Check Alertas table in Analise
-        alerts_count = run_sql_query("SELECT COUNT(*) FROM Alerta", "Analise")
-        print(f"Alerts Count: {alerts_count}") 
+        # Check Alertas table in Analise, polling while RabbitMQ -> Analise -> DB catches up
+        waited = verifier.wait([verification.alerta(talhao_id)], timeout=20, name="alerta_created")
+        print(f"Alerts for talhao {talhao_id}: {waited.value[0]} (after {waited.elapsed:.2f}s)")
         
-        if alerts_count and int(alerts_count) > 0:
+        if waited.ok:
             print("✅ Alert Validation: Alert found is database.")
         else:
             print("❌ Alert Validation: No alerts found.")
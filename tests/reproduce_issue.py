@@ -1,52 +1,25 @@
 import requests
 import json
-import subprocess
 import time
 import sys
 import datetime
+import kube_utils
+import db_access
+from instrumentation import InstrumentedSession, timed_sql
+from wait_utils import wait_for_http
 
 # Configuration
 BASE_URL_USUARIOS = "http://localhost:30001"
 BASE_URL_PROPRIEDADES = "http://localhost:30002"
 NAMESPACE = "agrosolutions-local"
 
-def get_sql_pod_name():
-    cmd = f"kubectl get pods -n {NAMESPACE} -l app=sql-server -o jsonpath={{.items[0].metadata.name}}"
-    try:
-        # Simply run directly? Windows needs shell=True for path resolution if not full path
-        res = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        # Check stderr
-        if res.returncode != 0:
-            print(f"Kubectl error: {res.stderr}")
-            return None
-            
-        return res.stdout.strip()
-    except Exception as e:
-        print(f"Error getting pod name: {e}")
-        return None
-
-def run_sql_query(query, database):
-    pod_name = get_sql_pod_name()
-    if not pod_name:
-        print("❌ Could not find SQL Pod.")
-        return None
-    
-    # Escape quotes for shell command if necessary, but keep it simple
-    # The query is simple enough
-    
-    cmd_str = f'kubectl exec -n {NAMESPACE} {pod_name} -- /opt/mssql-tools18/bin/sqlcmd -C -S localhost -U sa -P "Fi@p2026" -d {database} -Q "{query}" -h -1 -W'
-    
-    if sys.platform == "win32":
-        res = subprocess.run(["powershell", "-c", cmd_str], capture_output=True, text=True)
-    else:
-        res = subprocess.run(cmd_str, shell=True, capture_output=True, text=True)
-        
-    if res.returncode != 0:
-        print(f"❌ SQL Error: {res.stderr}")
-        return None
-    return res.stdout.strip()
+# SQL goes through db_access.get_executor() (AGRO_SQL_BACKEND, AGRO_SQL_* for sqlcmd); nothing connects on import
+run_sql_query = timed_sql(db_access.run_sql_query)
+# Every HTTP call and SQL check is timed; see instrumentation.py for the exports
+http = InstrumentedSession()
 
 def main():
+    db_access.configure_executor(namespace=NAMESPACE)
     print("🚀 Starting Issue Reproduction Script...")
     
     timestamp = int(time.time())
@@ -63,7 +36,7 @@ def main():
             "tipoId": 1
         }
         
-        reg_resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/registrar", json=reg_payload)
+        reg_resp = http.post(f"{BASE_URL_USUARIOS}/api/usuarios/registrar", json=reg_payload)
         
         if reg_resp.status_code == 200:
             print("✅ Registered.")
@@ -75,7 +48,7 @@ def main():
             
         # Login
         print("Logging in...")
-        login_resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/login", json={
+        login_resp = http.post(f"{BASE_URL_USUARIOS}/api/usuarios/login", json={
             "email": reg_payload["email"],
             "password": reg_payload["senha"]
         })
@@ -98,7 +71,7 @@ def main():
     
     print(f"Creating property '{prop_name}'...")
     try:
-        create_resp = requests.post(
+        create_resp = http.post(
             f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", 
             json={"nome": prop_name, "localizacao": "SP"},
             headers=headers
@@ -126,7 +99,7 @@ def main():
     
     print(f"Creating talhao '{talhao_name}' in property {prop_id}...")
     try:
-        talhao_resp = requests.post(
+        talhao_resp = http.post(
             f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades/{prop_id}/talhoes", 
             json={"nome": talhao_name, "cultura": "Soja", "area": 100.5},
             headers=headers
@@ -150,11 +123,11 @@ def main():
 
     # 3. Check via API
     print("\n--- 3. Verifying Property and Talhao via API ---")
-    list_resp = requests.get(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", headers=headers)
+    list_resp = http.get(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", headers=headers)
     # ... (rest of check)
     
     # Check Talhao
-    talhao_list_resp = requests.get(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades/{prop_id}/talhoes", headers=headers)
+    talhao_list_resp = http.get(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades/{prop_id}/talhoes", headers=headers)
     if talhao_list_resp.status_code == 200:
         talhoes = talhao_list_resp.json()
         print(f"Found {len(talhoes)} talhoes.")
@@ -185,23 +158,18 @@ def main():
     # 4. Verify Persistence after Restart
     print("\n--- 4. Restarting Propriedades Deployment to verify persistence ---")
     
-    # Trigger restart
-    cmd_restart = f"kubectl rollout restart deployment/propriedades -n {NAMESPACE}"
-    print(f"Executing: {cmd_restart}")
-    subprocess.run(cmd_restart, shell=True, capture_output=True)
-    
-    print("Waiting for rollout to complete (this may take a minute)...")
-    # Wait for rollout
-    cmd_status = f"kubectl rollout status deployment/propriedades -n {NAMESPACE}"
-    subprocess.run(cmd_status, shell=True, capture_output=True)
+    # Trigger restart (also drops the cached pod names for the namespace)
+    kube_utils.rollout_restart("propriedades", NAMESPACE)
     
-    # Wait a bit more just in case
-    time.sleep(10)
+    # Wait until the API answers again instead of a fixed sleep
+    waited = wait_for_http(lambda: http.get(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", headers=headers, timeout=5),
+                           timeout=60, max_interval=5, name="propriedades_ready_after_rollout")
+    print(f"Propriedades ready: {waited.ok} (after {waited.elapsed:.2f}s, {waited.attempts} polls)")
     
     # 5. Check via API again
     print("\n--- 5. Verifying Property and Talhao via API After Restart ---")
     try:
-        list_resp = requests.get(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", headers=headers)
+        list_resp = http.get(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", headers=headers)
         if list_resp.status_code == 200:
              # (existing check for property)
              pass
@@ -209,7 +177,7 @@ def main():
              print(f"❌ Failed to list properties: {list_resp.status_code}")
              
         # Check Talhao
-        talhao_list_resp = requests.get(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades/{prop_id}/talhoes", headers=headers)
+        talhao_list_resp = http.get(f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades/{prop_id}/talhoes", headers=headers)
         if talhao_list_resp.status_code == 200:
             talhoes = talhao_list_resp.json()
             print(f"Found {len(talhoes)} talhoes.")
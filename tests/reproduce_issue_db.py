@@ -1,9 +1,10 @@
 import requests
 import json
-import subprocess
 import time
 import sys
 import datetime
+import db_access
+from instrumentation import InstrumentedSession, timed_sql
 
 # Configuration
 BASE_URL_USUARIOS = "http://localhost:30001"
@@ -11,41 +12,13 @@ BASE_URL_PROPRIEDADES = "http://localhost:30002"
 NAMESPACE = "agrosolutions-local"
 DB_NAME = "AgroSolutionsPropriedades"
 
-def get_sql_pod_name():
-    cmd = f"kubectl get pods -n {NAMESPACE} -l app=sql-server --output name"
-    try:
-        if sys.platform == "win32":
-            res = subprocess.run(["powershell", "-c", cmd], capture_output=True, text=True)
-            if res.returncode != 0:
-                 print(f"Error finding pod: {res.stderr}")
-            # Output is pod/sql-server-xxx
-            return res.stdout.strip().replace("pod/", "")
-        else:
-             res = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-             return res.stdout.strip().replace("pod/", "")
-    except Exception as e:
-        print(f"Error getting pod name: {e}")
-        return None
-
-def run_sql_query(query, database):
-    pod_name = get_sql_pod_name()
-    if not pod_name:
-        print("❌ Could not find SQL Pod.")
-        return None
-    
-    cmd_str = f'kubectl exec -n {NAMESPACE} {pod_name} -- /opt/mssql-tools18/bin/sqlcmd -C -S localhost -U sa -P "Fi@p2026" -d {database} -Q "{query}" -h -1 -W'
-    
-    if sys.platform == "win32":
-        res = subprocess.run(["powershell", "-c", cmd_str], capture_output=True, text=True)
-    else:
-        res = subprocess.run(cmd_str, shell=True, capture_output=True, text=True)
-        
-    if res.returncode != 0:
-        print(f"❌ SQL Error: {res.stderr}")
-        return None
-    return res.stdout.strip()
+# SQL goes through db_access.get_executor() (AGRO_SQL_BACKEND, AGRO_SQL_* for sqlcmd); nothing connects on import
+run_sql_query = timed_sql(db_access.run_sql_query)
+# Every HTTP call and SQL check is timed; see instrumentation.py for the exports
+http = InstrumentedSession()
 
 def main():
+    db_access.configure_executor(namespace=NAMESPACE)
     print("🚀 Starting Persistence Test Script (with DB Check)...")
     timestamp = int(time.time())
     
@@ -58,7 +31,7 @@ def main():
     }
     
     try:
-        reg_resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/registrar", json={
+        reg_resp = http.post(f"{BASE_URL_USUARIOS}/api/usuarios/registrar", json={
             "email": reg_payload["email"],
             "senha": reg_payload["senha"],
             "tipoId": reg_payload["tipoId"]
@@ -72,7 +45,7 @@ def main():
             print(f"❌ Registration failed: {reg_resp.text}")
             sys.exit(1)
         
-        login_resp = requests.post(f"{BASE_URL_USUARIOS}/api/usuarios/login", json={
+        login_resp = http.post(f"{BASE_URL_USUARIOS}/api/usuarios/login", json={
             "email": reg_payload["email"],
             "password": reg_payload["senha"]
         })
@@ -92,7 +65,7 @@ def main():
     # 2. Create Property
     print("\n--- 2. Create Property ---")
     prop_name = f"Fazenda DB Check {timestamp}"
-    create_resp = requests.post(
+    create_resp = http.post(
         f"{BASE_URL_PROPRIEDADES}/api/v1/Propriedades", 
         json={"nome": prop_name, "localizacao": "SP"},
         headers=headers
@@ -0,0 +1,537 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from alert_replay import to_float, to_micros
+from columnar_export import TABLES, load_table, stream_rows
+from db_access import SCHEMA, db_timestamp, sqlite_pool
+
+# Multi-resolution rollups of SensorLeitura.
+# Readings are pre-aggregated per IdTalhao into 1-min, 15-min, 1-h and 1-day
+# buckets aligned to 1900-01-01 like the agruparMinutos SQL. Each bucket keeps
+# sums and non-null counts instead of averages, so levels merge exactly:
+# coarser levels are built from the 1-min one, and new readings (streamed from
+# the database by Id, or from a columnar export) are merged in without a
+# rebuild. A query picks the coarsest level whose buckets divide the requested
+# agruparMinutos (or fit the requested number of points) for the part of the
+# range aligned to it, the 1-min level for the whole minutes around that, and
+# raw readings for minutes cut by the range ends, then re-groups those rows:
+# AVG humidity/temperature = sum/count, SUM precipitation, NULL when a bucket
+# has no values, as in the SQL.
+
+RESOLUTIONS = (1, 15, 60, 1440)
+MICROS_PER_MINUTE = 60 * 1000000
+EPOCH_1900_US = int(np.datetime64("1900-01-01T00:00:00", "us").astype(np.int64))
+METRICS = ("umidade", "temperatura", "precipitacao")
+FIELDS = ("rows",) + tuple(f"{kind}_{m}" for m in METRICS for kind in ("sum", "n"))
+# columns read from SensorLeitura rows, in TABLES order
+_COLUMN_INDEX = {name: i for i, (name, _) in enumerate(TABLES["SensorLeitura"][1])}
+
+
+def micros(ts):
+    # datetime, ISO string or int64 us -> int64 us since the Unix epoch
+    return int(ts) if isinstance(ts, (int, np.integer)) else int(np.datetime64(ts, "us").astype(np.int64))
+
+
+def minutes_1900(ts):
+    # datetime or ISO string -> whole minutes since 1900-01-01 (floor)
+    us = int(np.datetime64(ts, "us").astype(np.int64)) if not isinstance(ts, (int, np.integer)) else int(ts)
+    return (us - EPOCH_1900_US) // MICROS_PER_MINUTE
+
+
+class Level:
+    """One resolution: parallel arrays sorted by (talhao, bucket).
+
+    `bucket` is the start in minutes since 1900-01-01; `offsets[c]:offsets[c+1]`
+    is the slice of talhao code c.
+    """
+
+    def __init__(self, talhao, bucket, fields, talhoes_count=0):
+        self.talhao = talhao
+        self.bucket = bucket
+        self.fields = fields
+        self.offsets = np.searchsorted(talhao, np.arange(max(talhoes_count, int(talhao.max()) + 1 if len(talhao) else 0) + 1))
+
+    def __len__(self):
+        return len(self.bucket)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, np.int32), np.zeros(0, np.int64), {f: np.zeros(0, _dtype(f)) for f in FIELDS})
+
+
+def _dtype(field):
+    return np.float64 if field.startswith("sum_") else np.int64
+
+
+def _reduce(talhao, bucket, fields, talhoes_count=0):
+    # rows sorted by (talhao, bucket) -> one row per distinct pair, fields summed
+    if len(bucket) == 0:
+        return Level.empty()
+    change = np.flatnonzero((np.diff(bucket) != 0) | (np.diff(talhao) != 0)) + 1
+    starts = np.concatenate(([0], change))
+    return Level(talhao[starts], bucket[starts], {f: np.add.reduceat(v, starts) for f, v in fields.items()},
+                 talhoes_count)
+
+
+def aggregate_raw(talhao, ts, umidade, temperatura, precipitacao, talhoes_count=0):
+    """Readings (int32 talhao codes, int64 us timestamps, float metrics with NaN) -> 1-min Level."""
+    bucket = (np.asarray(ts, dtype=np.int64) - EPOCH_1900_US) // MICROS_PER_MINUTE
+    order = np.lexsort((bucket, talhao))
+    fields = {"rows": np.ones(len(order), dtype=np.int64)}
+    for name, values in zip(METRICS, (umidade, temperatura, precipitacao)):
+        values = np.asarray(values, dtype=np.float64)[order]
+        present = ~np.isnan(values)
+        fields[f"sum_{name}"] = np.where(present, values, 0.0)
+        fields[f"n_{name}"] = present.astype(np.int64)
+    return _reduce(np.asarray(talhao, dtype=np.int32)[order], bucket[order], fields, talhoes_count)
+
+
+def coarsen(level, minutes, talhoes_count=0):
+    # Regroup a finer level into `minutes` buckets; the order is already (talhao, bucket)
+    return _reduce(level.talhao, level.bucket // minutes * minutes, level.fields, talhoes_count)
+
+
+def merge(a, b, talhoes_count=0):
+    if not len(a):
+        return b
+    if not len(b):
+        return a
+    talhao = np.concatenate((a.talhao, b.talhao))
+    bucket = np.concatenate((a.bucket, b.bucket))
+    order = np.lexsort((bucket, talhao))
+    return _reduce(talhao[order], bucket[order], {f: np.concatenate((a.fields[f], b.fields[f]))[order] for f in FIELDS},
+                   talhoes_count)
+
+
+class Rollups:
+    def __init__(self, resolutions=RESOLUTIONS):
+        if resolutions[0] != 1 or any(b % a for a, b in zip(resolutions, resolutions[1:])):
+            raise ValueError("resolutions must start at 1 and each must divide the next")
+        self.resolutions = tuple(resolutions)
+        self.talhoes = []
+        self._codes = {}
+        self.levels = {r: Level.empty() for r in self.resolutions}
+        self.last_id = 0
+        self.readings = 0
+
+    # -- building ------------------------------------------------------------
+    def _encode(self, talhoes):
+        # GUID strings -> this rollup's own int32 codes
+        distinct, inverse = np.unique(np.asarray(talhoes, dtype=str), return_inverse=True)
+        table = np.empty(len(distinct), dtype=np.int32)
+        for i, t in enumerate(distinct.tolist()):
+            t = t.lower()
+            code = self._codes.get(t)
+            if code is None:
+                code = self._codes[t] = len(self.talhoes)
+                self.talhoes.append(t)
+            table[i] = code
+        return table[inverse]
+
+    def add(self, talhoes, ts, umidade, temperatura, precipitacao):
+        """Merges readings into every level; `talhoes` are IdTalhao strings, `ts` int64 us."""
+        if len(ts) == 0:
+            return
+        delta = aggregate_raw(self._encode(talhoes), ts, umidade, temperatura, precipitacao)
+        n = len(self.talhoes)
+        for r in self.resolutions:
+            level_delta = delta if r == 1 else coarsen(delta, r)
+            self.levels[r] = merge(self.levels[r], level_delta, n)
+        self.readings += len(ts)
+
+    def add_rows(self, rows):
+        # SensorLeitura row tuples, as stream_rows() yields them
+        columns = list(zip(*rows))
+        get = lambda name: columns[_COLUMN_INDEX[name]]
+        self.add(get("IdTalhao"), to_micros([str(v) for v in get("DataHoraCapturaUtc")]),
+                 to_float([None if v is None else str(v) for v in get("UmidadeSoloPercentual")]),
+                 to_float([None if v is None else str(v) for v in get("TemperaturaCelsius")]),
+                 to_float([None if v is None else str(v) for v in get("PrecipitacaoMilimetros")]))
+        self.last_id = max(self.last_id, int(get("Id")[-1]))
+
+    def follow(self, executor=None, chunk_size=50000):
+        # Consumes SensorLeitura rows added since the last call (Id > last_id); returns how many
+        before = self.readings
+        for rows in stream_rows("SensorLeitura", executor, chunk_size, self.last_id):
+            self.add_rows(rows)
+        return self.readings - before
+
+    @classmethod
+    def from_table(cls, table, resolutions=RESOLUTIONS, chunk_size=5000000):
+        # From a columnar_export SensorLeitura directory (or a loaded Table)
+        table = load_table(table) if isinstance(table, str) else table
+        rollups = cls(resolutions)
+        names = table.dictionary("IdTalhao")
+        for lo in range(0, len(table), chunk_size):
+            rows = slice(lo, lo + chunk_size)
+            rollups.add(names[table["IdTalhao"][rows]], table["DataHoraCapturaUtc"][rows].view(np.int64),
+                        table["UmidadeSoloPercentual"][rows], table["TemperaturaCelsius"][rows],
+                        table["PrecipitacaoMilimetros"][rows])
+        rollups.last_id = table.meta["lastId"]
+        return rollups
+
+    # -- storage -------------------------------------------------------------
+    def save(self, path):
+        for r, level in self.levels.items():
+            target = os.path.join(path, f"{r}min")
+            os.makedirs(target, exist_ok=True)
+            np.save(os.path.join(target, "talhao.npy"), level.talhao)
+            np.save(os.path.join(target, "bucket.npy"), level.bucket)
+            for f, values in level.fields.items():
+                np.save(os.path.join(target, f"{f}.npy"), values)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"resolutions": self.resolutions, "talhoes": self.talhoes, "lastId": self.last_id,
+                       "readings": self.readings}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        rollups = cls(meta["resolutions"])
+        rollups.talhoes = meta["talhoes"]
+        rollups._codes = {t: i for i, t in enumerate(rollups.talhoes)}
+        rollups.last_id, rollups.readings = meta["lastId"], meta["readings"]
+        mode = "r" if mmap else None
+        for r in rollups.resolutions:
+            target = os.path.join(path, f"{r}min")
+            load = lambda name: np.load(os.path.join(target, f"{name}.npy"), mmap_mode=mode)
+            rollups.levels[r] = Level(load("talhao"), load("bucket"), {f: load(f) for f in FIELDS},
+                                      len(rollups.talhoes))
+        return rollups
+
+    # -- queries -------------------------------------------------------------
+    def choose(self, de_min, ate_min, minutos=None, max_points=None):
+        """-> (resolution, step) for a query over [de_min, ate_min) minutes.
+
+        With `minutos` (agruparMinutos) the step is fixed and the level is the
+        coarsest one that divides it. With `max_points` the step is the smallest multiple of a level that
+        keeps the answer within max_points buckets, read from the coarsest
+        level not wider than that step.
+        """
+        if minutos:
+            return max(r for r in self.resolutions if minutos % r == 0), minutos
+        if max_points:
+            target = max(1, math.ceil((ate_min - de_min) / max_points))
+            r = max(r for r in self.resolutions if r <= target)
+            return r, math.ceil(target / r) * r
+        return 1, 1
+
+    def _span(self, resolution, code, lo_min, hi_min):
+        # index range of one talhao's `resolution` buckets starting in [lo_min, hi_min)
+        level = self.levels[resolution]
+        if code is None or code + 1 >= len(level.offsets) or lo_min >= hi_min:
+            return 0, 0
+        lo, hi = level.offsets[code], level.offsets[code + 1]
+        buckets = level.bucket[lo:hi]
+        return lo + np.searchsorted(buckets, lo_min), lo + np.searchsorted(buckets, hi_min)
+
+    def query(self, id_talhao, de, ate, minutos=None, max_points=None, raw=None):
+        """Aggregated buckets of one talhao over [de, ate), exactly as the SQL filters it.
+
+        The chosen level answers the part of the range aligned to its buckets, the
+        1-min level the whole minutes on either side of it, and `raw(id_talhao,
+        de_us, ate_us) -> (ts, umidade, temperatura, precipitacao)` the readings of
+        a minute cut by `de` or `ate`; it is required only when an end falls inside
+        a minute. Returns a dict of arrays (bucket start as datetime64, AVG
+        humidity and temperature, SUM precipitation, readings per bucket; NaN
+        where no value), plus the level used and how many rows were read.
+        """
+        de_us, ate_us = micros(de), micros(ate)
+        to_us = lambda minute: minute * MICROS_PER_MINUTE + EPOCH_1900_US
+        first, last = minutes_1900(de_us), minutes_1900(ate_us)   # minutes holding de and ate
+        whole_lo = first if to_us(first) == de_us else first + 1
+        resolution, step = self.choose(first, last if to_us(last) == ate_us else last + 1, minutos, max_points)
+        code = self._codes.get(id_talhao.lower())
+
+        edges = [(de_us, ate_us)] if whole_lo > last else [(de_us, to_us(whole_lo)), (to_us(last), ate_us)]
+        edges = [(lo, hi) for lo, hi in edges if lo < hi]
+        if edges and raw is None:
+            raise ValueError("the range ends inside a minute: pass raw= to read the readings of its partial minutes")
+        # level r for [a, b), the 1-min level for the whole minutes around it
+        a = -(-whole_lo // resolution) * resolution
+        b = max(a, last // resolution * resolution)
+        spans = [(1, whole_lo, min(a, last)), (resolution, a, b), (1, max(b, whole_lo), last)] if resolution > 1 \
+            else [(1, whole_lo, last)]
+
+        pieces, rows_read = [], 0
+        for r, lo_min, hi_min in spans:
+            lo, hi = self._span(r, code, lo_min, hi_min)
+            level = self.levels[r]
+            pieces.append((level.bucket[lo:hi], {f: np.asarray(level.fields[f][lo:hi]) for f in FIELDS}))
+            rows_read += hi - lo
+        for lo_us, hi_us in edges:
+            ts, *metrics = raw(id_talhao, lo_us, hi_us)
+            if len(ts):
+                level = aggregate_raw(np.zeros(len(ts), np.int32), ts, *metrics)
+                pieces.insert(0 if lo_us == de_us else len(pieces), (level.bucket, level.fields))
+                rows_read += len(ts)
+
+        groups = np.concatenate([p[0] for p in pieces]) // step * step
+        if len(groups):
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(groups)) + 1))
+            sums = {f: np.add.reduceat(np.concatenate([p[1][f] for p in pieces]), starts) for f in FIELDS}
+            groups = groups[starts]
+        else:
+            sums = {f: np.zeros(0, _dtype(f)) for f in FIELDS}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg = lambda m: np.where(sums[f"n_{m}"] > 0, sums[f"sum_{m}"] / sums[f"n_{m}"], np.nan)
+            result = {
+                "dataHoraCapturaUtc": (groups * MICROS_PER_MINUTE + EPOCH_1900_US).astype("datetime64[us]"),
+                "umidadeSoloPercentual": avg("umidade"),
+                "temperaturaCelsius": avg("temperatura"),
+                "precipitacaoMilimetros": np.where(sums["n_precipitacao"] > 0, sums["sum_precipitacao"], np.nan),
+                "leituras": sums["rows"],
+            }
+        return {"resolution": resolution, "step": step, "rowsRead": int(rows_read), "buckets": result}
+
+
+# -- references ----------------------------------------------------------------
+
+def sql_aggregate(conn, id_talhao, de, ate, minutos):
+    # The agruparMinutos GROUP BY on sqlite: DATEDIFF(minute, 0, ts) as whole seconds since 1900 / 60
+    rows = conn.execute(
+        "SELECT (CAST(strftime('%s', substr(DataHoraCapturaUtc, 1, 19)) AS INTEGER) + 2208988800) / 60 / ? * ? AS b, "
+        "AVG(UmidadeSoloPercentual), AVG(TemperaturaCelsius), SUM(PrecipitacaoMilimetros), COUNT(*) "
+        "FROM SensorLeitura WHERE IdTalhao = ? AND DataHoraCapturaUtc >= ? AND DataHoraCapturaUtc < ? "
+        "GROUP BY b ORDER BY b",
+        (minutos, minutos, id_talhao, db_timestamp(de), db_timestamp(ate))).fetchall()
+    return rows
+
+
+def sql_readings(conn, id_talhao, de_us, ate_us):
+    # Raw readings of one talhao in [de_us, ate_us), as Rollups.query(raw=...) takes them
+    stamp = lambda us: str(np.datetime64(us, "us"))
+    rows = conn.execute(
+        "SELECT DataHoraCapturaUtc, UmidadeSoloPercentual, TemperaturaCelsius, PrecipitacaoMilimetros "
+        "FROM SensorLeitura WHERE IdTalhao = ? AND DataHoraCapturaUtc >= ? AND DataHoraCapturaUtc < ?",
+        (id_talhao, stamp(de_us), stamp(ate_us))).fetchall()
+    columns = list(zip(*rows)) or [(), (), (), ()]
+    return (to_micros(columns[0]),) + tuple(to_float(c) for c in columns[1:])
+
+
+class RawIndex:
+    """Raw readings sorted by (talhao, ts), for the scan-the-rows baseline."""
+
+    def __init__(self, talhao, ts, umidade, temperatura, precipitacao, talhoes):
+        order = np.lexsort((ts, talhao))
+        self.talhao = np.asarray(talhao)[order]
+        self.ts = np.asarray(ts, dtype=np.int64)[order]
+        self.metrics = [np.asarray(v, dtype=np.float64)[order] for v in (umidade, temperatura, precipitacao)]
+        self.codes = {t: i for i, t in enumerate(talhoes)}
+        self.offsets = np.searchsorted(self.talhao, np.arange(len(talhoes) + 1))
+
+    def _range(self, id_talhao, de, ate):
+        code = self.codes[id_talhao]
+        lo, hi = self.offsets[code], self.offsets[code + 1]
+        ts = self.ts[lo:hi]
+        return lo + np.searchsorted(ts, micros(de)), lo + np.searchsorted(ts, micros(ate))
+
+    def readings(self, id_talhao, de, ate):
+        # -> (ts, umidade, temperatura, precipitacao) in [de, ate), the Rollups.query(raw=...) shape
+        a, b = self._range(id_talhao, de, ate)
+        return (self.ts[a:b],) + tuple(m[a:b] for m in self.metrics)
+
+    def aggregate(self, id_talhao, de, ate, minutos):
+        a, b = self._range(id_talhao, de, ate)
+        level = aggregate_raw(np.zeros(b - a, np.int32), self.ts[a:b], *(m[a:b] for m in self.metrics))
+        return coarsen(level, minutos), b - a
+
+    def rows(self, id_talhao, de, ate, minutos):
+        # aggregate() shaped like the sql_aggregate() rows
+        level, _ = self.aggregate(id_talhao, de, ate, minutos)
+        f = level.fields
+        value = lambda total, n: float(total) if n else None
+        return [(int(level.bucket[i]), value(f["sum_umidade"][i] / max(f["n_umidade"][i], 1), f["n_umidade"][i]),
+                 value(f["sum_temperatura"][i] / max(f["n_temperatura"][i], 1), f["n_temperatura"][i]),
+                 value(f["sum_precipitacao"][i], f["n_precipitacao"][i]), int(f["rows"][i]))
+                for i in range(len(level))]
+
+
+def compare(rollup_result, sql_rows, tolerance=1e-6):
+    # -> None when equal, else a description of the first difference
+    got = rollup_result["buckets"]
+    starts = [minutes_1900(t) for t in got["dataHoraCapturaUtc"]]
+    if starts != [r[0] for r in sql_rows]:
+        return f"buckets differ: {len(starts)} vs {len(sql_rows)}"
+    for i, row in enumerate(sql_rows):
+        for j, key in enumerate(("umidadeSoloPercentual", "temperaturaCelsius", "precipitacaoMilimetros"), start=1):
+            a, b = got[key][i], row[j]
+            if (b is None) != bool(np.isnan(a)) or (b is not None and abs(a - b) > tolerance * max(1.0, abs(b))):
+                return f"bucket {starts[i]} {key}: {a} vs {b}"
+        if got["leituras"][i] != row[4]:
+            return f"bucket {starts[i]} count: {got['leituras'][i]} vs {row[4]}"
+    return None
+
+
+# -- CLI -----------------------------------------------------------------------
+
+def synthetic_rows(talhoes, days, interval_seconds, seed, end=None):
+    # SensorLeitura-shaped tuples (TABLES order) ending at `end`; ~2% NULL metrics
+    rng = np.random.default_rng(seed)
+    end = end or datetime.datetime(2026, 1, 1)
+    per = int(days * 86400 // interval_seconds)
+    ids = [f"{i:08x}-0000-4000-8000-{i:012x}" for i in range(talhoes)]
+    base = np.datetime64(end, "us").astype(np.int64) - per * interval_seconds * 1000000
+    rows = []
+    for t, talhao in enumerate(ids):
+        ts = base + np.arange(per, dtype=np.int64) * interval_seconds * 1000000 + rng.integers(0, interval_seconds * 1000000, per)
+        metrics = np.round(np.column_stack([rng.uniform(15, 40, per), rng.uniform(18, 35, per),
+                                            np.where(rng.random(per) < 0.7, 0, rng.uniform(0, 12, per))]), 2)
+        metrics[rng.random((per, 3)) < 0.02] = np.nan
+        stamps = ts.astype("datetime64[us]").astype(str)
+        for i in range(per):
+            u, tc, p = (None if v != v else float(v) for v in metrics[i])
+            rows.append((0, "p", talhao, "simulador", stamps[i], u, tc, p, "SIM-001", None))
+    return ids, rows
+
+
+def load_sqlite(rows):
+    pool = sqlite_pool()
+    pool.query_many([(s, "Ingestao") for s in SCHEMA["Ingestao"]])
+    with pool.connection("Ingestao") as conn:
+        conn.executemany(
+            "INSERT INTO SensorLeitura (IdPropriedade, IdTalhao, Origem, DataHoraCapturaUtc, UmidadeSoloPercentual, "
+            "TemperaturaCelsius, PrecipitacaoMilimetros, IdDispositivo, CorrelationId) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (r[1:] for r in sorted(rows, key=lambda r: r[4])))
+        conn.commit()
+    return pool
+
+
+def _timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        value = fn()
+    return (time.perf_counter() - started) / repeat, value
+
+
+def run_checks(rollups, reference, raw, talhoes, end, checks, rng):
+    # Random agruparMinutos queries with microsecond range ends; rollups (partial minutes
+    # read through raw) vs reference(talhao, de, ate, minutos)
+    failures = 0
+    for _ in range(checks):
+        talhao = talhoes[rng.integers(len(talhoes))]
+        minutos = int(rng.choice([1, 5, 10, 15, 30, 60, 90, 120, 360, 1440]))
+        span = datetime.timedelta(microseconds=int(rng.integers(minutos * MICROS_PER_MINUTE, 14 * 1440 * MICROS_PER_MINUTE)))
+        ate = end - datetime.timedelta(microseconds=int(rng.integers(0, 3 * 1440 * MICROS_PER_MINUTE)))
+        de = ate - span
+        problem = compare(rollups.query(talhao, de, ate, minutos=minutos, raw=raw), reference(talhao, de, ate, minutos))
+        if problem:
+            failures += 1
+            print(f"  ❌ {talhao} [{de}, {ate}) N={minutos}: {problem}")
+    return failures
+
+
+def run_benchmark(rollups, raw, pool, talhoes, end, spans_hours, max_points, repeat):
+    results = []
+    conn_ctx = pool.connection("Ingestao") if pool else None
+    conn = conn_ctx.__enter__() if conn_ctx else None
+    try:
+        for hours in spans_hours:
+            talhao = talhoes[0]
+            de, ate = end - datetime.timedelta(hours=hours), end
+            t_rollup, q = _timed(lambda: rollups.query(talhao, de, ate, max_points=max_points, raw=raw.readings), repeat)
+            t_raw, (_, raw_rows) = _timed(lambda: raw.aggregate(talhao, de, ate, q["step"]), repeat)
+            t_sql = _timed(lambda: sql_aggregate(conn, talhao, de, ate, q["step"]), max(1, repeat // 5))[0] if conn else None
+            results.append({"rangeHours": hours, "step": q["step"], "resolution": q["resolution"],
+                            "points": len(q["buckets"]["leituras"]), "rowsRead": {"rollup": q["rowsRead"], "raw": int(raw_rows)},
+                            "ms": {"rollup": round(t_rollup * 1000, 3), "raw": round(t_raw * 1000, 3),
+                                   "sql": None if t_sql is None else round(t_sql * 1000, 3)}})
+    finally:
+        if conn_ctx:
+            conn_ctx.__exit__(None, None, None)
+    return results
+
+
+def print_benchmark(results):
+    print(f"\n{'range':>8}{'step':>7}{'level':>7}{'points':>8}{'rows raw':>10}{'rows rollup':>13}"
+          f"{'sql ms':>10}{'raw ms':>10}{'rollup ms':>11}")
+    for r in results:
+        sql = "-" if r["ms"]["sql"] is None else r["ms"]["sql"]
+        print(f"{r['rangeHours']:>7}h{r['step']:>6}m{r['resolution']:>6}m{r['points']:>8}{r['rowsRead']['raw']:>10}"
+              f"{r['rowsRead']['rollup']:>13}{sql:>10}{r['ms']['raw']:>10}{r['ms']['rollup']:>11}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Builds multi-resolution rollups of SensorLeitura, checks and benchmarks them.")
+    parser.add_argument("--columnar", help="SensorLeitura directory from columnar_export.py (default: synthetic data)")
+    parser.add_argument("--talhoes", type=int, default=20)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--interval-seconds", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--checks", type=int, default=200, help="Random queries compared with the SQL aggregation (raw readings for --columnar)")
+    parser.add_argument("--spans", default="1,6,24,168,720", help="Benchmark range lengths in hours")
+    parser.add_argument("--max-points", type=int, default=300, help="Dashboard points per benchmark query")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--save", help="Write the rollups to this directory")
+    parser.add_argument("--output", help="JSON results file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    pool = None
+    started = time.perf_counter()
+    if args.columnar:
+        try:
+            table = load_table(args.columnar)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Could not load the export: {e}")
+            sys.exit(1)
+        rollups = Rollups.from_table(table)
+        talhoes = rollups.talhoes
+        end = table["DataHoraCapturaUtc"].max().astype(datetime.datetime) + datetime.timedelta(microseconds=1)
+        raw = RawIndex(table["IdTalhao"], table["DataHoraCapturaUtc"].view(np.int64), table["UmidadeSoloPercentual"],
+                       table["TemperaturaCelsius"], table["PrecipitacaoMilimetros"], list(table.dictionary("IdTalhao")[:-1]))
+        print(f"Built rollups from {len(table)} exported readings in {time.perf_counter() - started:.2f}s")
+    else:
+        end = datetime.datetime(2026, 1, 1)
+        talhoes, rows = synthetic_rows(args.talhoes, args.days, args.interval_seconds, args.seed, end)
+        pool = load_sqlite(rows)
+        print(f"Loaded {len(rows)} synthetic readings into sqlite in {time.perf_counter() - started:.2f}s")
+        # built the "live" way: consumed from the table in Id order, chunk by chunk
+        started = time.perf_counter()
+        rollups = Rollups()
+        rollups.follow(pool)
+        print(f"Built rollups by following SensorLeitura in {time.perf_counter() - started:.2f}s")
+        codes = {t: i for i, t in enumerate(talhoes)}
+        raw = RawIndex(np.array([codes[r[2]] for r in rows], dtype=np.int32), to_micros([r[4] for r in rows]),
+                       *(to_float([r[k] for r in rows]) for k in (5, 6, 7)), talhoes)
+    print("  " + ", ".join(f"{r}min: {len(level)} rows" for r, level in rollups.levels.items()))
+
+    failures = 0
+    if args.checks:
+        if pool:
+            print(f"Checking {args.checks} random agruparMinutos queries against the SQL aggregation...")
+            with pool.connection("Ingestao") as conn:
+                failures = run_checks(rollups, lambda *q: sql_aggregate(conn, *q), lambda *q: sql_readings(conn, *q),
+                                      talhoes, end, args.checks, rng)
+        else:
+            print(f"Checking {args.checks} random agruparMinutos queries against the raw readings...")
+            failures = run_checks(rollups, raw.rows, raw.readings, talhoes, end, args.checks, rng)
+        print("  ✅ All match." if not failures else f"  ❌ {failures} mismatches.")
+
+    spans = [float(s) for s in args.spans.split(",")]
+    results = run_benchmark(rollups, raw, pool, talhoes, end, spans, args.max_points, args.repeat)
+    print_benchmark(results)
+
+    if args.save:
+        rollups.save(args.save)
+        print(f"\n✅ Rollups saved to {args.save}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "checkFailures": failures, "benchmark": results}, f, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
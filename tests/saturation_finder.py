@@ -0,0 +1,316 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+import kube_utils
+import load_driver
+from load_driver import credentials, drive, latency, seed_local
+from load_generator import load_targets
+from metrics_scraper import ALERTS_METRIC, LEITURAS_METRIC, scrape, total
+
+# Maximum sustainable ingest rate of a deployment.
+# Drives Ingestao with load_driver.py at constant arrival rates and checks each
+# step against an SLO:
+#   - p99 ingest latency (client side, accepted requests) <= --p99-ms
+#   - (errors + client-side drops) / offered             <= --max-error-rate
+#   - achieved rate >= --min-achieved of the target rate (else the client, not
+#     the deployment, was the limit)
+#   - ingest-to-Alerta lag <= --max-lag seconds
+# Lag comes from the services' /metrics. Every reading sent here raises exactly
+# one Alerta (load_generator --alert-readings), so Analise's
+# agrosolutions_alerts_processing_duration_seconds_count advances once per
+# reading processed, and Ingestao's agrosolutions_sensor_readings_total once
+# per reading accepted. After a step the finder polls both until Analise has
+# caught up with what Ingestao accepted during the step: the wait is the lag of
+# the last reading sent. Other traffic moves these counters too, so suspend the
+# Simulador CronJob while this runs.
+# Both services run several replicas behind their Service, and each pod counts
+# only what it handled, so /metrics is read from every pod through its own
+# kubectl port-forward and summed (--local reads the fake stack directly). The
+# pods are looked up once: a rollout during the run resets counters and breaks
+# the forwards, which stops the search.
+#
+# --search step raises the rate by --increment until a step fails; --search
+# binary (default) doubles from --start-rate until a step fails and then
+# bisects down to --resolution. The result is written as a JSON artifact;
+# --baseline compares it with the artifact of a previous release.
+
+BASE_URL_ANALISE = "http://localhost:30004"
+INGESTAO_POD_SELECTOR = "app.kubernetes.io/name=ingestao"
+ANALISE_POD_SELECTOR = "app.kubernetes.io/name=analise"
+METRICS_PORT = 8080
+INGESTED_METRIC = LEITURAS_METRIC
+PROCESSED_METRIC = f"{ALERTS_METRIC}_count"
+DEFAULT_STEP_SECONDS = 30.0
+DEFAULT_P99_MS = 500.0
+DEFAULT_MAX_ERROR_RATE = 0.01
+DEFAULT_MAX_LAG = 10.0
+DEFAULT_MIN_ACHIEVED = 0.95
+DEFAULT_DRAIN_TIMEOUT = 120.0
+POLL_INTERVAL = 0.5
+
+
+# -- /metrics ------------------------------------------------------------------
+
+def pipeline_counts(http, ingestao_urls, analise_urls):
+    # (readings accepted by Ingestao, readings processed by Analise) so far, summed over the pods
+    return (sum(total(scrape(http, url, (INGESTED_METRIC,)), INGESTED_METRIC) for url in ingestao_urls),
+            sum(total(scrape(http, url, (PROCESSED_METRIC,)), PROCESSED_METRIC) for url in analise_urls))
+
+
+def forward_pods(selector, port, namespace):
+    # One started PortForward per running pod of `selector`
+    forwards = []
+    try:
+        for pod in kube_utils.pod_names(selector, namespace):
+            forwards.append(kube_utils.PortForward(pod, port, namespace).start())
+    except (RuntimeError, OSError):
+        for forward in forwards:
+            forward.close()
+        raise
+    if not forwards:
+        raise RuntimeError(f"no running pods match {selector}")
+    return forwards
+
+
+def drain(http, args, before, timeout):
+    """Seconds until Analise has processed every reading Ingestao accepted since `before`,
+    or None if it has not caught up after `timeout`. Also returns the backlog left."""
+    started = time.monotonic()
+    while True:
+        ingested, processed = pipeline_counts(http, args.ingestao_metrics, args.analise_metrics)
+        backlog = (ingested - before[0]) - (processed - before[1])
+        waited = time.monotonic() - started
+        if backlog <= 0:
+            return waited, 0
+        if waited >= timeout:
+            return None, int(backlog)
+        time.sleep(POLL_INTERVAL)
+
+
+# -- steps ---------------------------------------------------------------------
+
+def run_step(http, args, targets, creds, rate):
+    print(f"\n⏱️  Step at {rate:g} readings/s for {args.duration:g}s")
+    before = pipeline_counts(http, args.ingestao_metrics, args.analise_metrics)
+    args.rate = rate
+    registry, totals, failed, _ = drive(args, targets, creds)
+    lag, backlog = drain(http, args, before, args.max_lag) if args.max_lag else (None, 0)
+
+    offered = sum(t["offered"] for t in totals.values())
+    ok = sum(t["ok"] for t in totals.values())
+    errors = sum(t["errors"] for t in totals.values()) + sum(t["dropped"] for t in totals.values())
+    s = latency(registry).summary()
+    p99_ms = None if s["p99"] is None else s["p99"] * 1000
+    error_rate = errors / offered if offered else 1.0
+    achieved = ok / args.duration
+    failures = []
+    if failed:
+        failures.append(f"{len(failed)} workers failed")
+    if p99_ms is None or p99_ms > args.p99_ms:
+        failures.append(f"p99 {p99_ms if p99_ms is None else round(p99_ms, 1)}ms > {args.p99_ms:g}ms")
+    if error_rate > args.max_error_rate:
+        failures.append(f"error rate {error_rate:.2%} > {args.max_error_rate:.2%}")
+    if achieved < args.min_achieved * rate:
+        failures.append(f"achieved {achieved:.1f}/s < {args.min_achieved:.0%} of target")
+    if args.max_lag and lag is None:
+        failures.append(f"lag > {args.max_lag:g}s ({backlog} readings behind)")
+
+    step = {"rate": rate, "passed": not failures, "failures": failures, "offered": offered, "ok": ok,
+            "errors": errors, "errorRate": round(error_rate, 5), "achievedRate": round(achieved, 2),
+            "latencyMs": {k: None if s[k] is None else round(s[k] * 1000, 3) for k in ("p50", "p95", "p99", "max")},
+            "lagSeconds": None if lag is None else round(lag, 2), "backlog": backlog}
+    lag_text = "-" if lag is None else f"{lag:.1f}s"
+    print(f"{'✅' if step['passed'] else '❌'} {rate:g}/s: achieved {achieved:.1f}/s, p99 "
+          f"{step['latencyMs']['p99']}ms, errors {error_rate:.2%}, lag {lag_text}"
+          + (f" — {'; '.join(failures)}" if failures else ""))
+
+    if backlog:
+        # let Analise catch up so the next step starts from an empty queue
+        _, backlog = drain(http, args, before, args.drain_timeout)
+        if backlog:
+            raise RuntimeError(f"Analise still {backlog} readings behind after {args.drain_timeout:g}s")
+    return step
+
+
+def find_max(test, args):
+    """Highest rate whose step passed (None if the first one failed)."""
+    best = None
+    rate = args.start_rate
+    if args.search == "step":
+        while rate <= args.max_rate and test(rate):
+            best, rate = rate, rate + args.increment
+        return best
+
+    # double until a step fails (or --max-rate passes), then bisect between the two
+    failed_at = None
+    while True:
+        if not test(rate):
+            failed_at = rate
+            break
+        best = rate
+        if rate >= args.max_rate:
+            return best
+        rate = min(rate * 2, args.max_rate)
+    if best is None:
+        return None
+    while failed_at - best > args.resolution * best:
+        rate = (best + failed_at) / 2
+        if rate in (best, failed_at):
+            break   # the bracket cannot be split any further
+        if test(rate):
+            best = rate
+        else:
+            failed_at = rate
+    return best
+
+
+# -- report --------------------------------------------------------------------
+
+def compare(report, path):
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    before, after = baseline.get("maxSustainableRate"), report["maxSustainableRate"]
+    label = baseline.get("label") or path
+    if not before or after is None:
+        print(f"\nBaseline {label}: {before} readings/s (not comparable)")
+        return None
+    change = (after - before) / before
+    icon = "✅" if change >= -0.05 else "⚠️"
+    print(f"\n{icon} vs {label}: {before:g} -> {after:g} readings/s ({change:+.1%})")
+    return {"file": path, "label": baseline.get("label"), "maxSustainableRate": before, "change": round(change, 4)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Finds the highest ingest rate that still meets the SLO. "
+                                                 "Also takes every load_driver.py / load_generator.py option.")
+    parser.add_argument("--analise-url", default=BASE_URL_ANALISE, help="Analise host (recorded in the artifact)")
+    parser.add_argument("--namespace", default=kube_utils.NAMESPACE, help="Namespace of the pods scraped for /metrics")
+    parser.add_argument("--ingestao-selector", default=INGESTAO_POD_SELECTOR)
+    parser.add_argument("--analise-selector", default=ANALISE_POD_SELECTOR)
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Container port serving /metrics")
+    parser.add_argument("--search", choices=["binary", "step"], default="binary")
+    parser.add_argument("--start-rate", type=float, default=50.0, help="First rate tried (readings/s)")
+    parser.add_argument("--max-rate", type=float, default=5000.0, help="Never drive above this rate")
+    parser.add_argument("--increment", type=float, default=50.0, help="step: rate added per step")
+    parser.add_argument("--resolution", type=float, default=0.05,
+                        help="binary: stop once the pass/fail bracket is within this fraction")
+    parser.add_argument("--step-duration", type=float, default=DEFAULT_STEP_SECONDS, help="Seconds of load per step")
+    parser.add_argument("--p99-ms", type=float, default=DEFAULT_P99_MS, help="SLO: p99 ingest latency")
+    parser.add_argument("--max-error-rate", type=float, default=DEFAULT_MAX_ERROR_RATE,
+                        help="SLO: failed or dropped fraction of the offered requests")
+    parser.add_argument("--max-lag", type=float, default=DEFAULT_MAX_LAG,
+                        help="SLO: seconds for Analise to catch up after a step (0 skips the lag check)")
+    parser.add_argument("--min-achieved", type=float, default=DEFAULT_MIN_ACHIEVED,
+                        help="Fraction of the target rate that must be accepted")
+    parser.add_argument("--drain-timeout", type=float, default=DEFAULT_DRAIN_TIMEOUT,
+                        help="Seconds to wait for a backlog to clear before the next step")
+    parser.add_argument("--label", help="Release or build this run measured (stored in the artifact)")
+    parser.add_argument("--baseline", help="Artifact of a previous run to compare with")
+    args, rest = parser.parse_known_args(argv)
+    for key, value in vars(load_driver.parse_args(rest)).items():
+        setattr(args, key, value)
+    # every step is a constant-rate run of readings that each raise one Alerta
+    args.profile, args.duration, args.alert_readings, args.signals = "constant", args.step_duration, True, False
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stack = None
+    if args.local:
+        from fake_stack import FakeStack
+        stack = FakeStack().start()
+        args.base_url, args.usuarios_url, args.analise_url = (stack.urls[s] for s in ("ingestao", "usuarios", "analise"))
+        args.simulation_file = os.path.join(tempfile.mkdtemp(prefix="saturation_finder_"), "simulation_data.json")
+        seed_local(stack.urls, *args.local, args.simulation_file)
+        print(f"Using local fake stack: {stack.urls}")
+
+    forwards = []
+    http = requests.Session()
+    started_at = datetime.datetime.utcnow().isoformat() + "Z"
+    steps = []
+    try:
+        try:
+            targets = load_targets(args.simulation_file)
+            creds = credentials(args.simulation_file)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Could not read {args.simulation_file}: {e}")
+            sys.exit(1)
+        if not targets:
+            print(f"❌ No talhoes in {args.simulation_file}. Run data_seeder.py first.")
+            sys.exit(1)
+        try:
+            if stack:
+                args.ingestao_metrics, args.analise_metrics = [args.base_url], [args.analise_url]
+            else:
+                ingestao = forward_pods(args.ingestao_selector, args.metrics_port, args.namespace)
+                forwards += ingestao
+                analise = forward_pods(args.analise_selector, args.metrics_port, args.namespace)
+                forwards += analise
+                args.ingestao_metrics = [f.url for f in ingestao]
+                args.analise_metrics = [f.url for f in analise]
+                print(f"📈 Scraping /metrics of {len(ingestao)} Ingestao and {len(analise)} Analise pods")
+            pipeline_counts(http, args.ingestao_metrics, args.analise_metrics)
+        except (RuntimeError, OSError, requests.RequestException) as e:
+            print(f"❌ Could not read /metrics: {e}")
+            sys.exit(1)
+
+        def test(rate):
+            step = run_step(http, args, targets, creds, rate)
+            steps.append(step)
+            return step["passed"]
+
+        complete = True
+        try:
+            best = find_max(test, args)
+        except (RuntimeError, requests.RequestException) as e:
+            print(f"⚠️ Search stopped: {e}")
+            complete = False
+            best = max((s["rate"] for s in steps if s["passed"]), default=None)
+    finally:
+        for forward in forwards:
+            forward.close()
+        if stack:
+            stack.stop()
+
+    first_fail = min((s for s in steps if not s["passed"] and (best is None or s["rate"] > best)),
+                     key=lambda s: s["rate"], default=None)
+    report = {
+        "label": args.label, "startedAt": started_at, "complete": complete,
+        "maxSustainableRate": best, "unit": "readings/s",
+        "limitedBy": first_fail["failures"] if first_fail else ["--max-rate reached"],
+        "deployment": {"ingestao": args.base_url, "analise": args.analise_url,
+                       "metricsPods": {"ingestao": len(args.ingestao_metrics), "analise": len(args.analise_metrics)},
+                       "talhoes": len(targets),
+                       "users": len({t[3] for t in targets}), "workers": args.workers},
+        "slo": {"p99Ms": args.p99_ms, "maxErrorRate": args.max_error_rate, "maxLagSeconds": args.max_lag,
+                "minAchieved": args.min_achieved},
+        "search": {"mode": args.search, "startRate": args.start_rate, "maxRate": args.max_rate,
+                   "increment": args.increment, "resolution": args.resolution, "stepSeconds": args.step_duration},
+        "steps": steps,
+    }
+    print(f"\n{'=' * 60}")
+    if best is None:
+        print(f"❌ Not even {args.start_rate:g} readings/s met the SLO: {'; '.join(report['limitedBy'])}")
+    else:
+        print(f"🏁 Max sustainable rate: {best:g} readings/s (limited by: {'; '.join(report['limitedBy'])})")
+    if args.baseline:
+        report["baseline"] = compare(report, args.baseline)
+
+    output = args.output or f"saturation_{int(time.time())}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+    if best is None or not complete:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
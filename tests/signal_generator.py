@@ -0,0 +1,379 @@
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from collections import namedtuple
+
+import numpy as np
+
+from alert_replay import DEFAULT_RULES, RULES, Readings, replay
+
+# Seeded generator of realistic sensor signals, as NumPy arrays.
+# LeituraSensorDto.CriarAleatoria draws every reading independently and uniformly
+# (umidade 15-40, temperatura 18-35), so humidity never stays under 30% for the
+# 24h the "Risco de Seca" rule needs, and frost or a 35°C afternoon is as likely
+# at 3 a.m. as at noon. Here each talhao has its own climate and the series are
+# correlated in time:
+#   temperatura  - daily cycle peaking at 15h local (UTC-3), a few slow weather
+#                  waves, and frost nights pulling the dawn minimum below 0°C
+#   umidade      - soil water from hourly rain events, drying exponentially
+#                  (per-talhao time constant) between a dry and a wet level
+#   precipitacao - the rain that fell during each reading interval
+#   droughts     - random or scripted episodes with no rain and humidity held
+#                  under the drought threshold, so the 24h rule fires
+# All talhoes advance together: batch(steps) returns the next `steps` intervals
+# for every talhao, time-major. Randomness is drawn per day (rain, frost,
+# droughts) and per block of STEPS_PER_BLOCK steps (sensor noise) from
+# np.random.default_rng([seed, ...]), so the output depends only on the seed and
+# the settings, not on the batch sizes used to produce it.
+
+START = "2026-01-01T00:00:00"
+UTC_OFFSET_HOURS = -3
+US_PER_SECOND = 1000000
+STEPS_PER_BLOCK = 256
+# slow weather waves (days) and their amplitudes (°C)
+WEATHER_PERIODS_DAYS = (2.7, 6.1, 13.3)
+WEATHER_AMPLITUDES = (1.5, 1.0, 0.8)
+MAX_RAIN_HOURS = 4
+# soil water (mm) at which humidity is ~63% of the way from the dry to the wet level
+SOIL_WATER_MM = 20.0
+DROUGHT_RAMP_HOURS = 6.0
+SENSOR_FAILURE = 0.05
+
+# talhao: index, or None for every talhao; start_hour: hours after the generator's start
+Episode = namedtuple("Episode", ["talhao", "start_hour", "hours", "umidade"])
+Batch = namedtuple("Batch", ["ts", "talhao", "temperatura", "umidade", "precipitacao", "nitrogenio", "status_ok"])
+
+
+def parse_episode(text):
+    # "TALHAO:START_HOUR:HOURS[:UMIDADE]", TALHAO an index or "*"
+    parts = text.split(":")
+    if len(parts) not in (3, 4):
+        raise ValueError(f"Bad drought episode {text!r}; expected TALHAO:START_HOUR:HOURS[:UMIDADE]")
+    talhao = None if parts[0] == "*" else int(parts[0])
+    return Episode(talhao, float(parts[1]), float(parts[2]), float(parts[3]) if len(parts) == 4 else 24.0)
+
+
+class SignalGenerator:
+    """Correlated temperatura/umidade/precipitacao series for a set of talhoes.
+
+    `talhoes` is a count or a list of IdTalhao GUIDs. Rates are per talhao and
+    day: rain_rate rain events, frost_rate frost nights, drought_rate random
+    drought starts (each lasting 30-96 h). `episodes` adds scripted droughts.
+    """
+
+    def __init__(self, talhoes, interval_seconds=300, start=START, seed=1, rain_rate=0.3, frost_rate=0.03,
+                 drought_rate=0.0, episodes=()):
+        if isinstance(talhoes, int):
+            rnd = random.Random(seed)
+            talhoes = [str(uuid.UUID(int=rnd.getrandbits(128), version=4)) for _ in range(talhoes)]
+        self.talhoes = np.array([t.lower() for t in talhoes], dtype=object)
+        self.interval = int(interval_seconds)
+        self.seed = seed
+        self.rain_rate, self.frost_rate, self.drought_rate = rain_rate, frost_rate, drought_rate
+        self.episodes = list(episodes)
+        self.start_s = int(np.datetime64(start, "s").astype(np.int64))
+        self.first_day = self.start_s // 86400
+        self.step = 0
+
+        n = len(self.talhoes)
+        rng = np.random.default_rng([seed, 0])
+        self.temp_base = rng.normal(24.0, 2.5, n)
+        self.temp_amp = rng.uniform(4.0, 8.0, n)
+        self.weather_phase = rng.uniform(0, 2 * np.pi, (len(WEATHER_PERIODS_DAYS), n))
+        self.dry = rng.uniform(18.0, 32.0, n)
+        self.wet = rng.uniform(55.0, 80.0, n)
+        self.decay = np.exp(-1.0 / rng.uniform(36.0, 96.0, n))  # per hour
+        self.nitrogen = rng.uniform(20.0, 50.0, n)
+        self.nitrogen_phase = rng.uniform(0, 2 * np.pi, n)
+
+        # carried from one day to the next
+        self._water = rng.uniform(0.0, 2 * SOIL_WATER_MM, n)
+        self._drought_start = np.full(n, -np.inf)
+        self._drought_end = np.full(n, -np.inf)
+        self._drought_target = np.full(n, 24.0)
+        self._days = {}
+        self._next_day = 0
+        self._noise = (None, None)
+
+    def __len__(self):
+        return len(self.talhoes)
+
+    # -- per-day draws ---------------------------------------------------------
+    def _day(self, d):
+        # hourly rain, drought and soil water of day d (days after the start day), computed in order
+        while self._next_day <= d:
+            self._days = {self._next_day: self._draw_day(self._next_day)}
+            self._next_day += 1
+        return self._days[d]
+
+    def _draw_day(self, d):
+        n = len(self)
+        rng = np.random.default_rng([self.seed, 1, d])
+        hours = np.arange(24)
+
+        # rain events: a start hour, 1-MAX_RAIN_HOURS hours long (cut at midnight), exponential mm/h
+        starts = rng.random((n, 24)) < self.rain_rate / 24
+        duration = rng.integers(1, MAX_RAIN_HOURS + 1, (n, 24))
+        intensity = rng.exponential(3.0, (n, 24)) * starts
+        rain = np.zeros((n, 24))
+        for offset in range(MAX_RAIN_HOURS):
+            lasting = np.where(duration > offset, intensity, 0.0)
+            rain[:, offset:] = np.maximum(rain[:, offset:], lasting[:, :24 - offset])
+
+        # random droughts start on talhoes not already in one
+        absolute = d * 24 + hours
+        idle = self._drought_end <= d * 24
+        new = idle & (rng.random(n) < self.drought_rate)
+        begin = d * 24 + rng.uniform(0, 24, n)
+        self._drought_start = np.where(new, begin, self._drought_start)
+        self._drought_end = np.where(new, begin + rng.uniform(30.0, 96.0, n), self._drought_end)
+        self._drought_target = np.where(new, rng.uniform(20.0, 27.0, n), self._drought_target)
+        start = np.repeat(self._drought_start[:, None], 24, axis=1)
+        end = np.repeat(self._drought_end[:, None], 24, axis=1)
+        target = np.repeat(self._drought_target[:, None], 24, axis=1)
+        for e in self.episodes:
+            rows = slice(None) if e.talhao is None else slice(e.talhao, e.talhao + 1)
+            cover = (absolute + 1 > e.start_hour) & (absolute < e.start_hour + e.hours)
+            start[rows] = np.where(cover, e.start_hour, start[rows])
+            end[rows] = np.where(cover, e.start_hour + e.hours, end[rows])
+            target[rows] = np.where(cover, e.umidade, target[rows])
+        drought = (absolute + 1 > start) & (absolute < end)
+        rain[drought] = 0.0
+
+        # soil water at each hour boundary: W[k+1] = decay * W[k] + rain[k], as a scaled cumulative sum
+        powers = self.decay[:, None] ** np.arange(25)
+        water = np.empty((n, 25))
+        water[:, 0] = self._water
+        water[:, 1:] = powers[:, 1:] * (self._water[:, None] + np.cumsum(rain / powers[:, 1:], axis=1))
+        self._water = water[:, 24]
+
+        frost = rng.random(n) < self.frost_rate
+        frost_min = rng.uniform(-4.0, -0.5, n)
+        return {"rain": rain, "water": water, "drought": drought, "drought_start": start, "target": target,
+                "frost": frost, "frost_min": frost_min}
+
+    def _noise_for(self, first, count):
+        # sensor noise of steps [first, first + count), drawn per block of STEPS_PER_BLOCK steps
+        blocks = []
+        for b in range(first // STEPS_PER_BLOCK, (first + count - 1) // STEPS_PER_BLOCK + 1):
+            if self._noise[0] != b:
+                rng = np.random.default_rng([self.seed, 2, b])
+                shape = (STEPS_PER_BLOCK, len(self))
+                self._noise = (b, (rng.standard_normal(shape, dtype=np.float32),
+                                   rng.standard_normal(shape, dtype=np.float32),
+                                   rng.random(shape, dtype=np.float32)))
+            blocks.append(self._noise[1])
+        lo = first - (first // STEPS_PER_BLOCK) * STEPS_PER_BLOCK
+        return [np.concatenate([blk[i] for blk in blocks])[lo:lo + count] for i in range(3)]
+
+    # -- signals ---------------------------------------------------------------
+    def _segment(self, first, count):
+        # steps [first, first + count), all inside one day
+        seconds = self.start_s + (first + np.arange(count, dtype=np.int64)) * self.interval
+        d = int(seconds[0] // 86400 - self.first_day)
+        day = self._day(d)
+        of_day = (seconds % 86400).astype(np.float64)
+        hour = (of_day // 3600).astype(np.intp)
+        frac = (of_day % 3600 / 3600)[:, None]
+        t_noise, u_noise, status = self._noise_for(first, count)
+
+        local_h = ((of_day / 3600 + UTC_OFFSET_HOURS) % 24)[:, None]
+        days = (seconds / 86400.0)[:, None]
+        temp = self.temp_base + self.temp_amp * np.cos(2 * np.pi * (local_h - 15) / 24)
+        # sin(x + phase) = sin x cos phase + cos x sin phase: the transcendental part is per step only
+        for k, (period, amplitude) in enumerate(zip(WEATHER_PERIODS_DAYS, WEATHER_AMPLITUDES)):
+            x = 2 * np.pi * days / period
+            temp += np.sin(x) * (amplitude * np.cos(self.weather_phase[k])) + \
+                np.cos(x) * (amplitude * np.sin(self.weather_phase[k]))
+        # frost nights: a dawn dip (01h-11h local) down to frost_min at 06h
+        dawn = np.abs(local_h - 6) < 5
+        if day["frost"].any() and dawn.any():
+            bump = np.where(dawn, np.cos(np.pi * (local_h - 6) / 10) ** 2, 0.0) * day["frost"]
+            temp -= bump * np.maximum(temp - day["frost_min"], 0.0)
+        temp += 0.3 * t_noise
+
+        water = day["water"].T  # (25, talhoes)
+        soil = water[hour] + (water[hour + 1] - water[hour]) * frac
+        umid = self.dry + (self.wet - self.dry) * (1 - np.exp(-soil / SOIL_WATER_MM))
+        umid -= 1.5 * np.cos(2 * np.pi * (local_h - 15) / 24)
+        umid += 0.6 * u_noise
+        drought = day["drought"].T[hour]
+        if drought.any():
+            elapsed = (of_day[:, None] / 3600 + d * 24) - day["drought_start"].T[hour]
+            target = day["target"].T[hour]
+            ramp = np.clip(1 - elapsed / DROUGHT_RAMP_HOURS, 0.0, 1.0)
+            cap = target + (self.wet - target) * ramp + np.clip(0.5 * u_noise, -1.5, 1.5)
+            umid = np.where(drought, np.minimum(umid, cap), umid)
+        np.clip(umid, 0.0, 100.0, out=umid)
+
+        rain = day["rain"].T[hour] * (self.interval / 3600)
+        x = 2 * np.pi * days / 9.0
+        nitrogen = self.nitrogen + np.sin(x) * (2.0 * np.cos(self.nitrogen_phase)) + \
+            np.cos(x) * (2.0 * np.sin(self.nitrogen_phase))
+        n = len(self)
+        return Batch(np.repeat(seconds * US_PER_SECOND, n), np.tile(np.arange(n, dtype=np.int32), count),
+                     temp.ravel(), umid.ravel(), rain.ravel(), nitrogen.ravel(), (status >= SENSOR_FAILURE).ravel())
+
+    def batch(self, steps):
+        """The next `steps` reading intervals for every talhao: steps * len(self) readings, time-major."""
+        parts = []
+        end = self.step + steps
+        while self.step < end:
+            seconds = self.start_s + self.step * self.interval
+            to_midnight = -(-(86400 - seconds % 86400) // self.interval)
+            count = min(end - self.step, to_midnight)
+            parts.append(self._segment(self.step, count))
+            self.step += count
+        if len(parts) == 1:
+            return parts[0]
+        return Batch(*(np.concatenate(column) for column in zip(*parts)))
+
+    def batches(self, steps, steps_per_batch=STEPS_PER_BLOCK):
+        while steps > 0:
+            yield self.batch(min(steps, steps_per_batch))
+            steps -= steps_per_batch
+
+    def readings(self, steps, first_id=1):
+        """The next `steps` intervals as alert_replay.Readings (ids from first_id)."""
+        b = self.batch(steps)
+        return Readings(first_id + np.arange(len(b.ts), dtype=np.int64), b.talhao, self.talhoes, b.ts,
+                        b.temperatura, b.umidade)
+
+    def payloads(self, batch, prop_ids=None, origem="simulador", id_dispositivo="SIM-001"):
+        """CriarLeituraSensorRequest bodies for a batch, like load_generator.random_reading (2-decimal values)."""
+        when = np.datetime_as_string(batch.ts.astype("datetime64[us]"), unit="ms")
+        columns = [np.round(c, 2).tolist() for c in (batch.umidade, batch.temperatura, batch.precipitacao,
+                                                    batch.nitrogenio)]
+        for i, (code, ok) in enumerate(zip(batch.talhao.tolist(), batch.status_ok.tolist())):
+            yield {
+                "idPropriedade": prop_ids[code] if prop_ids is not None else None,
+                "idTalhao": self.talhoes[code],
+                "origem": origem,
+                "dataHoraCapturaUtc": when[i] + "Z",
+                "metricas": {
+                    "umidadeSoloPercentual": columns[0][i],
+                    "temperaturaCelsius": columns[1][i],
+                    "precipitacaoMilimetros": columns[2][i],
+                    "nivelNitrogenio": columns[3][i],
+                    "statusSensor": "Ativo" if ok else "Falha de Leitura",
+                },
+                "meta": {"idDispositivo": id_dispositivo, "correlationId": uuid.uuid4().hex},
+            }
+
+
+# -- CLI ---------------------------------------------------------------------------
+
+def describe(readings, precipitacao, interval_seconds):
+    per_talhao = len(readings) / max(len(readings.talhoes), 1)
+    return {
+        "readings": len(readings),
+        "temperatura": {"min": round(float(readings.temperatura.min()), 2),
+                        "mean": round(float(readings.temperatura.mean()), 2),
+                        "max": round(float(readings.temperatura.max()), 2)},
+        "umidade": {"min": round(float(readings.umidade.min()), 2), "mean": round(float(readings.umidade.mean()), 2),
+                    "max": round(float(readings.umidade.max()), 2),
+                    "under30Percent": round(float((readings.umidade < 30).mean() * 100), 1)},
+        "rainHoursPerTalhaoDay": round(float((precipitacao > 0).sum() * interval_seconds / 3600
+                                             / max(len(readings.talhoes), 1) / (per_talhao * interval_seconds / 86400)), 2),
+        "readingsUnderZeroC": int((readings.temperatura < 0).sum()),
+    }
+
+
+def benchmark(generator_args, steps, steps_per_batch):
+    # readings per second, and whether the batch size changed any value
+    gen = SignalGenerator(**generator_args)
+    started = time.perf_counter()
+    n = 0
+    for b in gen.batches(steps, steps_per_batch):
+        n += len(b.ts)
+    elapsed = time.perf_counter() - started
+    one = SignalGenerator(**generator_args).batch(min(steps, 1000))
+    other = Batch(*(np.concatenate(c) for c in zip(*SignalGenerator(**generator_args).batches(min(steps, 1000), 37))))
+    same = all(np.array_equal(a, b) for a, b in zip(one, other))
+    return {"readings": n, "seconds": round(elapsed, 3), "readingsPerSecond": round(n / elapsed),
+            "batchSizeIndependent": same}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generates seeded, correlated sensor signals as NumPy arrays.")
+    parser.add_argument("--talhoes", type=int, default=20)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--interval-seconds", type=int, default=300)
+    parser.add_argument("--start", default=START, help="UTC start of the series")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rain-rate", type=float, default=0.3, help="Rain events per talhao and day")
+    parser.add_argument("--frost-rate", type=float, default=0.03, help="Frost nights per talhao and day")
+    parser.add_argument("--drought-rate", type=float, default=0.02, help="Random drought starts per talhao and day")
+    parser.add_argument("--drought", action="append", default=[], metavar="TALHAO:START_HOUR:HOURS[:UMIDADE]",
+                        help="Scripted drought episode (TALHAO an index or *); repeatable")
+    parser.add_argument("--replay", action="store_true", help="Run alert_replay's rules over the series")
+    parser.add_argument("--csv", help="Write the readings as a SensorLeitura CSV (alert_replay/drought_window --csv)")
+    parser.add_argument("--bench", type=int, default=0, metavar="TALHOES",
+                        help="Throughput with this many talhoes over --days, in batches of --batch-steps")
+    parser.add_argument("--batch-steps", type=int, default=STEPS_PER_BLOCK)
+    parser.add_argument("--output", help="JSON summary file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        episodes = [parse_episode(e) for e in args.drought]
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    settings = {"interval_seconds": args.interval_seconds, "start": args.start, "seed": args.seed,
+                "rain_rate": args.rain_rate, "frost_rate": args.frost_rate, "drought_rate": args.drought_rate,
+                "episodes": episodes}
+    steps = int(args.days * 86400 // args.interval_seconds)
+    results = {"config": vars(args)}
+
+    if args.bench:
+        bench = benchmark(dict(settings, talhoes=args.bench), steps, args.batch_steps)
+        results["benchmark"] = bench
+        print(f"{'✅' if bench['batchSizeIndependent'] else '❌'} {bench['readings']} readings in {bench['seconds']}s: "
+              f"{bench['readingsPerSecond'] / 1e6:.1f}M readings/s ({args.bench} talhoes, {args.batch_steps} steps "
+              f"per batch); batch-size independent: {bench['batchSizeIndependent']}")
+
+    gen = SignalGenerator(args.talhoes, **settings)
+    started = time.perf_counter()
+    parts = list(gen.batches(steps, args.batch_steps))
+    batch = Batch(*(np.concatenate(c) for c in zip(*parts)))
+    readings = Readings(np.arange(1, len(batch.ts) + 1), batch.talhao, gen.talhoes, batch.ts, batch.temperatura,
+                        batch.umidade)
+    print(f"Generated {len(readings)} readings ({args.talhoes} talhoes x {steps} intervals) "
+          f"in {time.perf_counter() - started:.2f}s")
+    results["summary"] = describe(readings, batch.precipitacao, args.interval_seconds)
+    for key, value in results["summary"].items():
+        print(f"  {key:<24}{value}")
+
+    if args.replay:
+        result = replay(readings, DEFAULT_RULES)
+        counts = result.count_by_rule()
+        results["alerts"] = counts
+        print("\nAlerts with the current rules:")
+        for name, _, _ in RULES:
+            print(f"  {name:<24}{counts[name]}")
+        if episodes and not counts["risco_de_seca"]:
+            print("⚠️ Scripted droughts produced no 'Risco de Seca' alert.")
+
+    if args.csv:
+        when = np.datetime_as_string(batch.ts.astype("datetime64[us]"), unit="s")
+        with open(args.csv, "w", encoding="utf-8", newline="") as f:
+            f.write("Id,IdTalhao,DataHoraCapturaUtc,TemperaturaCelsius,UmidadeSoloPercentual,PrecipitacaoMilimetros\n")
+            for i in range(len(readings)):
+                f.write(f"{i + 1},{gen.talhoes[batch.talhao[i]]},{when[i]},{batch.temperatura[i]:.2f},"
+                        f"{batch.umidade[i]:.2f},{batch.precipitacao[i]:.2f}\n")
+        print(f"\n✅ Readings saved to {args.csv}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
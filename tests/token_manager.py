@@ -0,0 +1,234 @@
+import base64
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import InstrumentedSession
+
+# Per-user bearer tokens for multi-user runs.
+# Tokens issued by Usuarios expire 8h after login (TokenService), so the ones saved
+# in simulation_data.json go stale and a long load run ends in a burst of 401s and
+# inline re-logins. TokenManager reads `exp` from the JWT itself, keeps one token
+# per email and re-logs users in *before* expiry, a few at a time, from a background
+# thread. Callers get pre-authorised pooled sessions (or plain headers) that always
+# carry the current token, so the request path never waits on a login.
+
+BASE_URL_USUARIOS = "http://localhost:30001"
+LOGIN_PATH = "/api/usuarios/login"
+
+# Refresh once less than this is left; each token gets an extra random share of
+# the margin so tokens issued together are not all refreshed in the same second
+REFRESH_MARGIN_SECONDS = 600
+MAX_CONCURRENT_LOGINS = 4
+REFRESH_CHECK_INTERVAL = 30
+
+
+def decode_jwt_claims(token):
+    # Payload of a JWT without verifying it (no pyjwt needed); None if malformed
+    try:
+        part = token.split(".")[1]
+        padding = "=" * (-len(part) % 4)
+        return json.loads(base64.urlsafe_b64decode(part + padding).decode("utf-8"))
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def token_expiry(token):
+    claims = decode_jwt_claims(token) or {}
+    exp = claims.get("exp")
+    return float(exp) if exp is not None else None
+
+
+class _Entry:
+    __slots__ = ("email", "password", "token", "expires", "refresh_at", "lock")
+
+    def __init__(self, email, password):
+        self.email = email
+        self.password = password
+        self.token = None
+        self.expires = 0.0
+        self.refresh_at = 0.0
+        # single-flight: one login per user at a time
+        self.lock = threading.Lock()
+
+
+class BearerAuth(requests.auth.AuthBase):
+    # Reads the user's current token on every request
+    def __init__(self, manager, email):
+        self.manager = manager
+        self.email = email
+
+    def __call__(self, r):
+        r.headers["Authorization"] = f"Bearer {self.manager.get_token(self.email)}"
+        return r
+
+
+class TokenManager:
+    def __init__(self, base_url=BASE_URL_USUARIOS, refresh_margin=REFRESH_MARGIN_SECONDS,
+                 max_concurrent_logins=MAX_CONCURRENT_LOGINS, pool_size=8, clock=time.time):
+        self.base_url = base_url.rstrip("/")
+        self.refresh_margin = refresh_margin
+        self.max_concurrent_logins = max_concurrent_logins
+        self.pool_size = pool_size
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._logins = threading.BoundedSemaphore(max_concurrent_logins)
+        self._login_session = InstrumentedSession()
+        self._login_session.mount("http://", HTTPAdapter(pool_maxsize=max_concurrent_logins))
+        self._sessions = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.logins = 0
+        self.failures = 0
+
+    # --- cache ---
+
+    def add_user(self, email, password, token=None):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                entry = self._entries[email] = _Entry(email, password)
+            entry.password = password
+        if token:
+            self._set_token(entry, token)
+        return entry
+
+    def load_simulation_data(self, path):
+        # users written by data_seeder.py; their saved tokens are reused while still valid
+        with open(path, encoding="utf-8") as f:
+            users = json.load(f)
+        for user in users:
+            self.add_user(user["email"], user["password"], user.get("token"))
+        return users
+
+    def save_simulation_data(self, path):
+        # writes the current tokens back so the next run starts with fresh ones
+        with open(path, encoding="utf-8") as f:
+            users = json.load(f)
+        for user in users:
+            entry = self._entries.get(user["email"])
+            if entry and entry.token:
+                user["token"] = entry.token
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(users, f, indent=2)
+
+    def _set_token(self, entry, token):
+        expires = token_expiry(token)
+        if expires is None:
+            # opaque token: assume the TokenService lifetime from now
+            expires = self.clock() + 8 * 3600
+        entry.token = token
+        entry.expires = expires
+        entry.refresh_at = expires - self.refresh_margin * (1 + random.random())
+
+    def _fresh(self, entry, now):
+        return entry.token is not None and now < entry.refresh_at
+
+    # --- login ---
+
+    def _login(self, entry):
+        with entry.lock:
+            # another thread may have refreshed it while we waited
+            if self._fresh(entry, self.clock()):
+                return entry.token
+            token = None
+            with self._logins:
+                try:
+                    resp = self._login_session.post(f"{self.base_url}{LOGIN_PATH}",
+                                                    json={"email": entry.email, "password": entry.password},
+                                                    timeout=30)
+                    if resp.status_code == 200:
+                        token = resp.json().get("token")
+                    error = f"{resp.status_code} - {resp.text}"
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    error = str(e)
+            if token:
+                self._set_token(entry, token)
+                self.logins += 1
+                return entry.token
+            self.failures += 1
+            print(f"❌ Login failed for {entry.email}: {error}")
+            # keep serving the old token until it actually expires
+            return entry.token if entry.token and self.clock() < entry.expires else None
+
+    def get_token(self, email):
+        entry = self._entries[email]
+        if self._fresh(entry, self.clock()):
+            return entry.token
+        return self._login(entry)
+
+    def peek_token(self, email):
+        # cached token without ever logging in (for event loops); may be stale
+        return self._entries[email].token
+
+    def headers(self, email):
+        return {"Authorization": f"Bearer {self.get_token(email)}"}
+
+    def invalidate(self, email):
+        # e.g. after a 401: the next get_token() logs in again
+        entry = self._entries.get(email)
+        if entry:
+            entry.refresh_at = 0.0
+
+    def refresh_due(self):
+        # Logs in every user whose token is missing or inside its refresh window,
+        # at most max_concurrent_logins at a time. Returns the number refreshed.
+        now = self.clock()
+        due = [e for e in list(self._entries.values()) if not self._fresh(e, now)]
+        if not due:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_logins) as pool:
+            list(pool.map(self._login, due))
+        return len(due)
+
+    def start(self, interval=REFRESH_CHECK_INTERVAL):
+        # Proactive refresh loop; call once all users are added
+        self.refresh_due()
+        if self._thread is None:
+            def run():
+                while not self._stop.wait(interval):
+                    self.refresh_due()
+            self._thread = threading.Thread(target=run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # --- sessions ---
+
+    def session(self, email):
+        """Pooled session for one user; every request carries the current token."""
+        with self._lock:
+            session = self._sessions.get(email)
+            if session is None:
+                session = InstrumentedSession()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.auth = BearerAuth(self, email)
+                # a rejected token is re-issued on the next request instead of failing every call
+                session.hooks["response"].append(
+                    lambda r, *args, **kwargs: self.invalidate(email) if r.status_code == 401 else None)
+                self._sessions[email] = session
+        return session
+
+    def emails(self):
+        return list(self._entries)
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+        self._login_session.close()
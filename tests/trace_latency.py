@@ -0,0 +1,367 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import uuid
+from collections import Counter, namedtuple
+
+import requests
+
+from instrumentation import Histogram
+from log_index import LogCollector, LogIndex
+from wait_utils import wait_until
+
+# Per-hop latency of a sensor reading, from the services' logs and spans.
+# A reading crosses: the Ingestao HTTP request (http_ingest), the ownership
+# call to Propriedades inside it (ownership), the SensorLeitura INSERT
+# (db_insert), the RabbitMQ publish (publish), the queue (queue_wait), the
+# Analise consumer (consumer_processing) and its Alerta INSERTs (alert_insert).
+# The Ingestao "Leitura recebida. Id=…" line and the Analise "MSG RECEBIDA"
+# line share the Leitura Id (and the message carries meta.correlationId); each
+# side's TraceId then finds its spans (OTLP/JSON files, or the Jaeger query API).
+# The consumer does not continue the producer's trace, so the join across the
+# queue is by Leitura Id, never by TraceId. Where a span is missing the hop is
+# taken from log timestamps instead, and the report says how many samples came
+# from each source. The hops overlap: queue_wait starts at the publish, while
+# the HTTP response is still being written, so the shares do not add up to 100%.
+
+JAEGER_URL = os.environ.get("JAEGER_URL", "http://localhost:16686")
+LOCAL_DRAIN_TIMEOUT = 10.0
+HOPS = ("http_ingest", "ownership", "db_insert", "publish", "queue_wait", "consumer_processing", "alert_insert")
+SPAN_KINDS = {1: "internal", 2: "server", 3: "client", 4: "producer", 5: "consumer"}
+
+Span = namedtuple("Span", ["trace_id", "span_id", "parent_id", "service", "name", "kind", "start_us", "duration_us",
+                           "attributes"])
+
+
+def parse_ts(value):
+    """ISO-8601 timestamp (7 fractional digits, "Z" or offset, or naive = UTC) -> epoch microseconds."""
+    if not value:
+        return None
+    value = str(value).strip().replace("Z", "+00:00")
+    date, sep, rest = value.partition(".")
+    if sep:
+        # .NET writes 100 ns ticks; fromisoformat takes at most 6 digits
+        digits = len(rest) - len(rest.lstrip("0123456789"))
+        value = f"{date}.{rest[:min(digits, 6)].ljust(6, '0')}{rest[digits:]}"
+    try:
+        dt = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp() * 1_000_000)
+
+
+# -- spans ---------------------------------------------------------------------
+
+def _otlp_value(value):
+    for key in ("stringValue", "intValue", "doubleValue", "boolValue"):
+        if key in value:
+            return value[key]
+    return None
+
+
+def _otlp_kind(kind):
+    # numbers in OTLP/JSON, "SPAN_KIND_SERVER" from some exporters
+    if isinstance(kind, str):
+        return kind.replace("SPAN_KIND_", "").lower()
+    return SPAN_KINDS.get(kind, "internal")
+
+
+def parse_otlp(data):
+    """Spans of one OTLP/JSON export ({"resourceSpans": [...]})."""
+    for resource in data.get("resourceSpans") or ():
+        attrs = {a["key"]: _otlp_value(a["value"]) for a in (resource.get("resource") or {}).get("attributes") or ()}
+        service = attrs.get("service.name", "")
+        for scope in resource.get("scopeSpans") or resource.get("instrumentationLibrarySpans") or ():
+            for s in scope.get("spans") or ():
+                start = int(s["startTimeUnixNano"])
+                yield Span(s["traceId"].lower(), s["spanId"].lower(), (s.get("parentSpanId") or "").lower() or None,
+                           service, s.get("name", ""), _otlp_kind(s.get("kind")), start // 1000,
+                           (int(s["endTimeUnixNano"]) - start) // 1000,
+                           {a["key"]: _otlp_value(a["value"]) for a in s.get("attributes") or ()})
+
+
+def load_otlp(path):
+    # the collector's file exporter writes one export per line; a single pretty-printed export works too
+    with open(path, encoding="utf-8-sig") as f:
+        text = f.read()
+    try:
+        exports = [json.loads(text)]
+    except ValueError:
+        exports = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for data in exports:
+        yield from parse_otlp(data)
+
+
+def parse_jaeger(trace):
+    """Spans of one trace from the Jaeger query API (times in microseconds, tags, CHILD_OF references)."""
+    processes = trace.get("processes") or {}
+    for s in trace.get("spans") or ():
+        tags = {t["key"]: t.get("value") for t in s.get("tags") or ()}
+        parent = next((r["spanID"] for r in s.get("references") or () if r.get("refType") == "CHILD_OF"), None)
+        yield Span(s["traceID"].lower().rjust(32, "0"), s["spanID"].lower(), parent and parent.lower(),
+                   (processes.get(s.get("processID")) or {}).get("serviceName", ""), s.get("operationName", ""),
+                   str(tags.get("span.kind", "internal")), int(s["startTime"]), int(s["duration"]), tags)
+
+
+def fetch_jaeger(trace_ids, base_url=JAEGER_URL, session=None):
+    # one GET per trace; traces Jaeger does not have (sampled out, expired) are skipped
+    session = session or requests.Session()
+    missing = 0
+    for trace_id in trace_ids:
+        try:
+            resp = session.get(f"{base_url}/api/traces/{trace_id}", timeout=10)
+        except requests.RequestException as e:
+            print(f"⚠️ Jaeger unreachable at {base_url}: {e}")
+            return
+        if resp.status_code != 200:
+            missing += 1
+            continue
+        for trace in resp.json().get("data") or ():
+            yield from parse_jaeger(trace)
+    if missing:
+        print(f"⚠️ {missing} trace(s) not found in Jaeger")
+
+
+class SpanIndex:
+    def __init__(self, spans=()):
+        self.by_trace = {}
+        self.add(spans)
+
+    def add(self, spans):
+        for span in spans:
+            self.by_trace.setdefault(span.trace_id, []).append(span)
+        return self
+
+    def __len__(self):
+        return sum(len(spans) for spans in self.by_trace.values())
+
+    def find(self, trace_id, kind=None, service=None, parent_id=None):
+        # service matches by substring, so "ingestao" finds "AgroSolutions.Ingestao.WebApi"
+        return [s for s in self.by_trace.get((trace_id or "").lower(), ())
+                if (kind is None or s.kind == kind)
+                and (service is None or service in s.service.lower())
+                and (parent_id is None or s.parent_id == parent_id)]
+
+
+def _is_db(span):
+    return "db.system" in span.attributes
+
+
+def _is_ownership(span):
+    url = str(span.attributes.get("url.full") or span.attributes.get("http.url") or "").lower()
+    return "propriedades" in str(span.attributes.get("peer.service", "")).lower() or "/talhoes/" in url
+
+
+# -- breakdown -----------------------------------------------------------------
+
+def breakdown(logs, spans, leitura):
+    """One "Leitura recebida" event -> ({hop: (seconds, source)}, start, end), times in epoch microseconds.
+
+    Hops that cannot be measured are left out; end is None when the queue
+    message was never logged.
+    """
+    hops = {}
+    us = 1e-6
+
+    # Ingestao: the request's server span and its children, else the "Request finished" line
+    server = next(iter(spans.find(leitura.trace_id, "server", "ingestao")), None)
+    finished = logs.first(kind="request_finished", trace_id=leitura.trace_id)
+    started_us = server.start_us if server else None
+    if server:
+        hops["http_ingest"] = (server.duration_us * us, "span")
+        children = spans.find(leitura.trace_id, parent_id=server.span_id)
+        ownership = [s for s in children if s.kind == "client" and _is_ownership(s)]
+        inserts = [s for s in children if _is_db(s) and "sensorleitura" in s.name.lower()] or \
+                  [s for s in children if _is_db(s)]
+        publish = [s for s in children if s.kind == "producer"]
+        for hop, found in (("ownership", ownership), ("db_insert", inserts[:1]), ("publish", publish)):
+            if found:
+                hops[hop] = (sum(s.duration_us for s in found) * us, "span")
+    elif finished and finished.fields.get("ElapsedMilliseconds") is not None:
+        hops["http_ingest"] = (float(finished.fields["ElapsedMilliseconds"]) / 1000, "log")
+        started_us = parse_ts(finished.ts) - int(float(finished.fields["ElapsedMilliseconds"]) * 1000)
+    if "publish" not in hops and finished:
+        # "Leitura recebida" is logged between the insert and the publish: an upper bound
+        hops["publish"] = ((parse_ts(finished.ts) - parse_ts(leitura.ts)) * us, "log")
+
+    # Analise: the queue message with the same Leitura Id
+    message = logs.first(kind="msg_recebida", leitura_id=leitura.leitura_id)
+    if message is None:
+        return hops, started_us, None
+    received_us = parse_ts(message.ts)
+    occurred_us = parse_ts(message.fields.get("OccurredAtUtc"))
+    if occurred_us is not None:
+        hops["queue_wait"] = ((received_us - occurred_us) * us, "log")
+
+    ended_us = received_us
+    consumer = next(iter(spans.find(message.trace_id, "consumer", "analise")), None)
+    if consumer:
+        hops["consumer_processing"] = (consumer.duration_us * us, "span")
+        alerts = [s for s in spans.find(message.trace_id, parent_id=consumer.span_id)
+                  if _is_db(s) and "alerta" in s.name.lower()]
+        if alerts:
+            hops["alert_insert"] = (sum(s.duration_us for s in alerts) * us, "span")
+        ended_us = consumer.start_us + consumer.duration_us
+    else:
+        # the consumer's alert lines: same trace, else this talhao's until its next message
+        if message.trace_id:
+            alerts = logs.find(kind="alerta_gerado", trace_id=message.trace_id)
+        else:
+            alerts, after = [], False
+            for e in logs.find(talhao=message.talhao):
+                if e is message:
+                    after = True
+                elif after and e.kind == "msg_recebida":
+                    break
+                elif after and e.kind == "alerta_gerado":
+                    alerts.append(e)
+        if alerts:
+            ended_us = max(parse_ts(e.ts) for e in alerts)
+            # processing up to the last alert; no alert lines means no end to measure
+            hops["consumer_processing"] = ((ended_us - received_us) * us, "log")
+    return hops, started_us, ended_us
+
+
+def analyse(logs, spans, correlation_id=None):
+    """-> ({hop: Histogram}, Counter of (hop, source), per-reading rows), over every reading Ingestao logged."""
+    if correlation_id:
+        ids = {e.leitura_id for e in logs.find(correlation_id=correlation_id)}
+        readings = [e for lid in ids - {None} for e in logs.find(kind="leitura_recebida", leitura_id=lid)]
+    else:
+        readings = logs.find(kind="leitura_recebida")
+    histograms = {hop: Histogram() for hop in HOPS + ("end_to_end",)}
+    sources = Counter()
+    rows = []
+    for leitura in readings:
+        hops, started_us, ended_us = breakdown(logs, spans, leitura)
+        if started_us is not None and ended_us is not None and "queue_wait" in hops:
+            hops["end_to_end"] = ((ended_us - started_us) * 1e-6, "span" if spans.find(leitura.trace_id) else "log")
+        for hop, (seconds, source) in hops.items():
+            # clocks of different pods can disagree by a little; a negative hop counts as 0
+            histograms[hop].record(max(seconds, 0.0))
+            sources[hop, source] += 1
+        rows.append({"leituraId": leitura.leitura_id, "traceId": leitura.trace_id,
+                     **{hop: round(seconds * 1000, 3) for hop, (seconds, _) in hops.items()}})
+    return histograms, sources, rows
+
+
+def print_report(histograms, sources, readings):
+    print(f"\n{'hop':<22}{'n':>6}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'share':>8}  source (ms)")
+    total = histograms["end_to_end"].summary()["mean"]
+    means = {hop: histograms[hop].summary()["mean"] for hop in HOPS}
+    # ownership, db_insert and publish happen inside http_ingest; alert_insert inside consumer_processing
+    top_level = {hop: m for hop, m in means.items() if hop in ("http_ingest", "queue_wait", "consumer_processing") and m}
+    dominant = max(top_level, key=top_level.get) if top_level else None
+    for hop in HOPS + ("end_to_end",):
+        s = histograms[hop].summary()
+        cells = "".join(f"{'-' if s[k] is None else round(s[k] * 1000, 2):>9}" for k in ("mean", "p50", "p95", "p99", "max"))
+        share = f"{s['mean'] / total:.0%}" if s["mean"] is not None and total else "-"
+        origin = ",".join(f"{src}:{n}" for (h, src), n in sorted(sources.items()) if h == hop)
+        mark = "  ⚠️ dominant" if hop == dominant else ""
+        print(f"{hop:<22}{s['count']:>6}{cells}{share:>8}  {origin}{mark}")
+    complete = histograms["end_to_end"].count
+    print(f"\n{'✅' if complete == readings and readings else '⚠️'} {complete}/{readings} readings joined end to end.")
+
+
+# -- local run -----------------------------------------------------------------
+
+def count_lines(path, text):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return sum(text in line for line in f)
+
+
+def drive_local(urls, n, seed=1):
+    # One user, property and talhao on the fake stack, then n readings with correlation ids
+    rnd = random.Random(seed)
+    http = requests.Session()
+    tag = uuid.uuid4().hex[:8]
+    email, password = f"trace_{tag}@test.com", "Password123!"
+    http.post(f"{urls['usuarios']}/api/usuarios/registrar",
+              json={"nome": "Trace", "email": email, "senha": password, "tipoId": 1}).raise_for_status()
+    token = http.post(f"{urls['usuarios']}/api/usuarios/login",
+                      json={"email": email, "password": password}).json()["token"]
+    http.headers["Authorization"] = f"Bearer {token}"
+    prop_id = http.post(f"{urls['propriedades']}/api/v1/Propriedades",
+                        json={"nome": f"Fazenda {tag}", "localizacao": "Lab"}).json()["id"]
+    talhao_id = http.post(f"{urls['propriedades']}/api/v1/Propriedades/{prop_id}/talhoes",
+                          json={"nome": f"Talhao {tag}", "cultura": "Milho", "area": 30}).json()["id"]
+    for i in range(n):
+        http.post(f"{urls['ingestao']}/api/v1/leituras-sensores", json={
+            "idPropriedade": prop_id, "idTalhao": talhao_id, "origem": "TRACE_LATENCY",
+            "dataHoraCapturaUtc": datetime.datetime.utcnow().isoformat() + "Z",
+            "metricas": {"umidadeSoloPercentual": rnd.choice((15, 25, 45)), "temperaturaCelsius": rnd.choice((30, 38)),
+                         "precipitacaoMilimetros": 0},
+            "meta": {"idDispositivo": "TRACE-01", "correlationId": f"trace-{tag}-{i}"}}).raise_for_status()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Per-hop latency of sensor readings from logs and spans.")
+    parser.add_argument("--logs", nargs="*", default=[], help="Service log files (Ingestao and Analise)")
+    parser.add_argument("--pod", nargs="*", default=[], metavar="SELECTOR",
+                        help="Also read these pods' logs, e.g. app.kubernetes.io/name=ingestao")
+    parser.add_argument("--spans", nargs="*", default=[], help="OTLP/JSON span files")
+    parser.add_argument("--jaeger", nargs="?", const=JAEGER_URL,
+                        help=f"Fetch the logged traces from the Jaeger query API (default {JAEGER_URL})")
+    parser.add_argument("--correlation", help="Only the reading with this meta.correlationId")
+    parser.add_argument("--local", type=int, metavar="N", help="Send N readings through fake_stack and analyse them")
+    parser.add_argument("--output", help="JSON file with the distributions and per-reading hops")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logs, spans = LogIndex(), SpanIndex()
+    if args.local:
+        from fake_stack import FakeStack
+        workdir = tempfile.mkdtemp(prefix="trace_latency_")
+        args.logs.append(os.path.join(workdir, "services.log"))
+        args.spans.append(os.path.join(workdir, "spans.jsonl"))
+        with FakeStack(log_path=args.logs[-1], spans_path=args.spans[-1]) as stack:
+            print(f"Sending {args.local} readings through the local fake stack ({workdir})...")
+            drive_local(stack.urls, args.local)
+            # the consumer logs MSG RECEBIDA once per reading it takes off the queue
+            if not wait_until(lambda: count_lines(args.logs[-1], "MSG RECEBIDA") >= args.local,
+                              timeout=LOCAL_DRAIN_TIMEOUT, name="analise_drained").ok:
+                print(f"⚠️ The consumer did not log {args.local} messages within {LOCAL_DRAIN_TIMEOUT}s.")
+    if not (args.logs or args.pod):
+        print("❌ Give --logs, --pod or --local.")
+        sys.exit(1)
+
+    collector = LogCollector(logs)
+    for path in args.logs:
+        collector.add_file(path)
+    for selector in args.pod:
+        collector.add_pod(selector, follow=False)
+    collector.join()
+    for path in args.spans:
+        spans.add(load_otlp(path))
+    if args.jaeger:
+        traces = {e.trace_id for e in logs.find() if e.kind in ("leitura_recebida", "msg_recebida") and e.trace_id}
+        spans.add(fetch_jaeger(sorted(traces), args.jaeger))
+    print(f"Indexed {logs.summary()['events']} log events and {len(spans)} spans.")
+
+    histograms, sources, rows = analyse(logs, spans, args.correlation)
+    if not rows:
+        print("❌ No 'Leitura recebida' lines found.")
+        sys.exit(1)
+    print_report(histograms, sources, len(rows))
+    if args.correlation:
+        for row in rows:
+            print(json.dumps(row))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"hops": {hop: h.summary() for hop, h in histograms.items()},
+                       "sources": {f"{hop}:{src}": n for (hop, src), n in sources.items()},
+                       "readings": rows}, f, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
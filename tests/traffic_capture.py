@@ -0,0 +1,426 @@
+import argparse
+import asyncio
+import datetime
+import gzip
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import db_access
+from columnar_export import TABLES, stream_rows
+from db_access import db_timestamp, parse_utc
+from load_generator import (BASE_URL_INGESTAO, DEFAULT_CONNECTIONS_PER_USER, DEFAULT_MAX_INFLIGHT, SIMULATION_FILE,
+                            TOKEN_CHECK_INTERVAL, LoadGenerator, print_report)
+from token_manager import BASE_URL_USUARIOS, TokenManager
+
+# Recorded traffic for POST /api/v1/leituras-sensores, and a replayer.
+# A capture is JSON lines, gzip-compressed when the name ends in .gz:
+#   {"format": "agrosolutions-traffic", "version": 1, "startedUtc": ..., "source": ...}   header
+#   {"identity": 0, "email": "user@example.com"}     first time a user shows up
+#   [0.125, 0, {...CriarLeituraSensorRequest...}]      seconds after startedUtc, identity, body
+# Requests are written in time order. Captures come from load_generator.py
+# (--capture, the offered requests of a run) or from the SensorLeitura table
+# (from-db: rows ordered and timed by DataHoraCapturaUtc, each talhao's owner
+# resolved through Propriedades and Usuarios). Passwords are never stored.
+#
+# The replayer is load_generator's open-loop engine fed from the capture: the
+# same pooled aiohttp sessions per user and per-second report. Speed 1 keeps
+# the recorded gaps, N divides them by N, and "max" sends as fast as
+# max_inflight allows (waiting for a slot instead of dropping). Capture times
+# are rewritten: "shift" moves them by (replay start - capture start), keeping
+# the recorded spacing; "send" uses the scheduled send time; "keep" sends them
+# unchanged. Identities come from simulation_data.json, or --provision registers
+# a fresh user per identity with the captured properties and talhoes and maps
+# the ids, so a new, empty build can take last month's traffic.
+
+FORMAT = "agrosolutions-traffic"
+VERSION = 1
+BASE_URL_PROPRIEDADES = "http://localhost:30002"
+TIMESTAMP_MODES = ("shift", "send", "keep")
+PROVISION_PASSWORD = "Password123!"
+PROVISION_WORKERS = 8
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def iso_utc(ts):
+    return ts.isoformat(timespec="milliseconds") + "Z"
+
+
+class CaptureWriter:
+    """Appends requests to a capture; thread-safe. Offsets default to the time since the writer was opened."""
+
+    def __init__(self, path, source=None, started_utc=None):
+        self.path = path
+        self.started = started_utc or datetime.datetime.utcnow()
+        self.count = 0
+        self._t0 = time.monotonic()
+        self._identities = {}
+        self._lock = threading.Lock()
+        self._f = _open(path, "w")
+        self._write({"format": FORMAT, "version": VERSION, "startedUtc": iso_utc(self.started), "source": source})
+
+    def _write(self, record):
+        self._f.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+    def record(self, email, payload, offset=None):
+        with self._lock:
+            if offset is None:
+                offset = time.monotonic() - self._t0
+            u = self._identities.get(email)
+            if u is None:
+                u = self._identities[email] = len(self._identities)
+                self._write({"identity": u, "email": email})
+            self._write([round(offset, 4), u, payload])
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Capture:
+    def __init__(self, path):
+        self.path = path
+        with _open(path, "r") as f:
+            self.header = json.loads(f.readline())
+        if self.header.get("format") != FORMAT:
+            raise ValueError(f"{path} is not a {FORMAT} capture")
+        self.started = parse_utc(self.header["startedUtc"])
+
+    def requests(self):
+        """Yields (offset s, email, payload) in file order."""
+        emails = {}
+        with _open(self.path, "r") as f:
+            f.readline()
+            for line in f:
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    emails[record["identity"]] = record["email"]
+                else:
+                    yield record[0], emails[record[1]], record[2]
+
+    def scan(self):
+        """Requests, duration, busiest second, and per user the talhoes of each property."""
+        count, last, per_second, owners = 0, 0.0, Counter(), {}
+        for offset, email, payload in self.requests():
+            count += 1
+            last = offset
+            per_second[int(offset)] += 1
+            owners.setdefault(email, {}).setdefault(payload.get("idPropriedade"), set()).add(payload.get("idTalhao"))
+        peak = per_second.most_common(1)[0] if per_second else (None, 0)
+        return {"requests": count, "seconds": last, "peakSecond": peak[0], "peakRate": peak[1], "owners": owners,
+                "talhoes": sum(len(t) for props in owners.values() for t in props.values())}
+
+
+# -- capture from the database ---------------------------------------------------------
+
+def owners_by_propriedade(executor):
+    # IdPropriedade -> owner e-mail (or "owner:<OwnerUserId>" when Usuarios has no such Id)
+    props, users = executor.query_many([("SELECT Id, OwnerUserId FROM Propriedades", "Propriedades"),
+                                        ("SELECT Id, Email FROM Usuarios", "Usuarios")])
+    emails = dict(line.split() for line in (users or "").splitlines() if len(line.split()) == 2)
+    return {p.lower(): emails.get(owner, f"owner:{owner}")
+            for p, owner in (line.split() for line in (props or "").splitlines() if len(line.split()) == 2)}
+
+
+def capture_from_db(path, de=None, ate=None, talhao=None, after_id=0, executor=None):
+    """Writes the SensorLeitura rows captured in [de, ate) as a capture; returns how many.
+
+    The range and talhao go into the WHERE clause (IX_SensorLeitura_Talhao_DataHora
+    covers talhao + range) and rows arrive in capture-time order, so they are
+    written as they stream in.
+    """
+    executor = executor or db_access.get_executor()
+    names = [name for name, _ in TABLES["SensorLeitura"][1]]
+    where = []
+    if de:
+        where.append(f"DataHoraCapturaUtc >= '{db_timestamp(de)}'")
+    if ate:
+        where.append(f"DataHoraCapturaUtc < '{db_timestamp(ate)}'")
+    if talhao:
+        try:
+            where.append(f"IdTalhao = '{uuid.UUID(talhao)}'")
+        except ValueError:
+            raise RuntimeError(f"--talhao {talhao} is not a GUID")
+
+    def number(value):
+        return None if value in (None, "", "NULL") else float(value)
+
+    writer, owners = None, None
+    try:
+        for chunk in stream_rows("SensorLeitura", executor, after_id=after_id, where=" AND ".join(where) or None,
+                                 order="DataHoraCapturaUtc"):
+            for values in chunk:
+                row = dict(zip(names, values))
+                captured = parse_utc(row["DataHoraCapturaUtc"])
+                if captured is None:
+                    continue
+                if writer is None:
+                    owners = owners_by_propriedade(executor)
+                    writer = CaptureWriter(path, source="SensorLeitura", started_utc=captured)
+                prop = str(row["IdPropriedade"]).lower()
+                writer.record(owners.get(prop, "unknown"), {
+                    "idPropriedade": prop,
+                    "idTalhao": str(row["IdTalhao"]).lower(),
+                    "origem": row["Origem"],
+                    "dataHoraCapturaUtc": iso_utc(captured),
+                    "metricas": {"umidadeSoloPercentual": number(row["UmidadeSoloPercentual"]),
+                                 "temperaturaCelsius": number(row["TemperaturaCelsius"]),
+                                 "precipitacaoMilimetros": number(row["PrecipitacaoMilimetros"])},
+                    "meta": {"idDispositivo": row["IdDispositivo"], "correlationId": row["CorrelationId"] or None},
+                }, (captured - writer.started).total_seconds())
+    finally:
+        if writer is not None:
+            writer.close()
+    return writer.count if writer is not None else 0
+
+
+# -- provisioning ------------------------------------------------------------------------
+
+def provision(scan, usuarios_url, propriedades_url, tag=None, password=PROVISION_PASSWORD):
+    """A new user per captured identity, owning copies of its properties and talhoes.
+
+    Returns ({captured email: new email}, {captured id: new id}, {new email: token}).
+    """
+    tag = tag or uuid.uuid4().hex[:8]
+
+    def one(item):
+        i, (email, props) = item
+        http = requests.Session()
+        new_email = f"replay_{tag}_{i}@test.com"
+        http.post(f"{usuarios_url}/api/usuarios/registrar",
+                  json={"nome": f"Replay {i}", "email": new_email, "senha": password, "tipoId": 1}).raise_for_status()
+        resp = http.post(f"{usuarios_url}/api/usuarios/login", json={"email": new_email, "password": password})
+        resp.raise_for_status()
+        token = resp.json()["token"]
+        http.headers["Authorization"] = f"Bearer {token}"
+        ids = {}
+        for p, (prop_id, talhoes) in enumerate(props.items()):
+            resp = http.post(f"{propriedades_url}/api/v1/Propriedades",
+                             json={"nome": f"Replay {tag} {i}-{p}", "localizacao": "Replay"})
+            resp.raise_for_status()
+            ids[prop_id] = new_prop = resp.json()["id"]
+            for t, talhao_id in enumerate(talhoes):
+                resp = http.post(f"{propriedades_url}/api/v1/Propriedades/{new_prop}/talhoes",
+                                 json={"nome": f"Talhao {t}", "cultura": "Milho", "area": 30})
+                resp.raise_for_status()
+                ids[talhao_id] = resp.json()["id"]
+        return email, new_email, token, ids
+
+    identities, ids, tokens = {}, {}, {}
+    with ThreadPoolExecutor(PROVISION_WORKERS) as pool:
+        for email, new_email, token, mapped in pool.map(one, enumerate(scan["owners"].items())):
+            identities[email] = new_email
+            ids.update(mapped)
+            tokens[new_email] = token
+    return identities, ids, tokens
+
+
+# -- replay ------------------------------------------------------------------------------
+
+class Replayer(LoadGenerator):
+    """Plays a Capture through LoadGenerator's sessions, scheduling and report."""
+
+    def __init__(self, base_url, capture, tokens, speed=1.0, timestamps="shift", identities=None, ids=None,
+                 connections_per_user=DEFAULT_CONNECTIONS_PER_USER, max_inflight=DEFAULT_MAX_INFLIGHT, limit=None):
+        super().__init__(base_url, [], tokens, None, None, connections_per_user, max_inflight)
+        self.source = capture
+        self.speed = speed
+        self.timestamps = timestamps
+        self.identities = identities or {}
+        self.ids = ids or {}
+        self.limit = limit
+        # as fast as possible: wait for a free slot rather than shed the capture
+        self.block_when_full = not speed
+
+    def _rewrite(self, payload, sent_utc, shift):
+        body = dict(payload)
+        body["idPropriedade"] = self.ids.get(body.get("idPropriedade"), body.get("idPropriedade"))
+        body["idTalhao"] = self.ids.get(body.get("idTalhao"), body.get("idTalhao"))
+        if self.timestamps == "send":
+            body["dataHoraCapturaUtc"] = iso_utc(sent_utc)
+        elif self.timestamps == "shift":
+            captured = parse_utc(body.get("dataHoraCapturaUtc"))
+            if captured is not None:
+                body["dataHoraCapturaUtc"] = iso_utc(captured + shift)
+        return body
+
+    def arrivals(self):
+        started = datetime.datetime.utcnow()
+        shift = started - self.source.started
+        users = {}
+        for n, (offset, email, payload) in enumerate(self.source.requests()):
+            if self.limit is not None and n >= self.limit:
+                return
+            email = self.identities.get(email, email)
+            u = users.setdefault(email, len(users))
+            due = offset / self.speed if self.speed else None
+            sent = started + datetime.timedelta(seconds=due) if due is not None else datetime.datetime.utcnow()
+            yield due, (email, None, None, u), self._rewrite(payload, sent, shift)
+
+
+def parse_speed(value):
+    if value.lower() in ("max", "0"):
+        return 0.0
+    speed = float(value.lower().rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be > 0, or max")
+    return speed
+
+
+def print_info(path):
+    capture = Capture(path)
+    s = capture.scan()
+    print(f"{path}: {s['requests']} requests over {s['seconds']:.1f}s from {capture.header.get('source')} "
+          f"(started {capture.header['startedUtc']})")
+    print(f"  {len(s['owners'])} identities, {s['talhoes']} talhoes, "
+          f"peak {s['peakRate']} req/s at +{s['peakSecond']}s, mean "
+          f"{s['requests'] / s['seconds'] if s['seconds'] else float(s['requests']):.1f} req/s")
+    return s
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Captures and replays Ingestao traffic.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    info = commands.add_parser("info", help="Summarise a capture")
+    info.add_argument("capture")
+
+    from_db = commands.add_parser("from-db", help="Capture the SensorLeitura rows of a time range")
+    from_db.add_argument("capture", help="Output file (.jsonl or .jsonl.gz)")
+    from_db.add_argument("--de", help="First DataHoraCapturaUtc (inclusive, UTC)")
+    from_db.add_argument("--ate", help="Last DataHoraCapturaUtc (exclusive, UTC)")
+    from_db.add_argument("--talhao", help="Only this IdTalhao")
+    from_db.add_argument("--after-id", type=int, default=0, help="Skip rows up to this Id")
+
+    replay = commands.add_parser("replay", help="Play a capture against Ingestao")
+    replay.add_argument("capture")
+    replay.add_argument("--speed", type=parse_speed, default=1.0, help="1 (recorded pace), N (N times faster) or max")
+    replay.add_argument("--timestamps", choices=TIMESTAMP_MODES, default="shift",
+                        help="How dataHoraCapturaUtc is rewritten (default: shift to the replay start)")
+    replay.add_argument("--base-url", default=BASE_URL_INGESTAO)
+    replay.add_argument("--usuarios-url", default=BASE_URL_USUARIOS)
+    replay.add_argument("--propriedades-url", default=BASE_URL_PROPRIEDADES)
+    replay.add_argument("--simulation-file", default=SIMULATION_FILE,
+                        help="Credentials of the captured users (data_seeder.py output)")
+    replay.add_argument("--provision", action="store_true",
+                        help="Register a new user per captured identity with copies of its properties and talhoes")
+    replay.add_argument("--local", action="store_true", help="Replay against a local fake_stack (implies --provision)")
+    replay.add_argument("--connections-per-user", type=int, default=DEFAULT_CONNECTIONS_PER_USER)
+    replay.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT)
+    replay.add_argument("--limit", type=int, help="Only the first N requests")
+    replay.add_argument("--output", help="JSON results file")
+    return parser.parse_args(argv)
+
+
+def replay_main(args):
+    try:
+        capture = Capture(args.capture)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read {args.capture}: {e}")
+        sys.exit(1)
+    scan = print_info(args.capture)
+
+    stack = None
+    urls = {"usuarios": args.usuarios_url, "propriedades": args.propriedades_url, "ingestao": args.base_url}
+    if args.local:
+        from fake_stack import FakeStack
+        stack = FakeStack().start()
+        urls = stack.urls
+        args.provision = True
+        print(f"Using local fake stack: {urls}")
+    try:
+        tokens = TokenManager(urls["usuarios"])
+        identities, ids = {}, {}
+        if args.provision:
+            started = time.perf_counter()
+            identities, ids, issued = provision(scan, urls["usuarios"], urls["propriedades"])
+            for email, token in issued.items():
+                tokens.add_user(email, PROVISION_PASSWORD, token)
+            print(f"Provisioned {len(identities)} users and {len(ids)} properties/talhoes "
+                  f"in {time.perf_counter() - started:.1f}s")
+        else:
+            try:
+                tokens.load_simulation_data(args.simulation_file)
+            except (OSError, ValueError) as e:
+                print(f"❌ Could not read {args.simulation_file}: {e}. Use --provision for a fresh environment.")
+                sys.exit(1)
+            unknown = [e for e in scan["owners"] if e not in tokens.emails()]
+            if unknown:
+                print(f"❌ {len(unknown)} captured users are not in {args.simulation_file} (first: {unknown[0]}). "
+                      f"Use --provision.")
+                sys.exit(1)
+        tokens.start(TOKEN_CHECK_INTERVAL)
+
+        pace = "as fast as possible" if not args.speed else f"at {args.speed:g}x"
+        print(f"🚀 Replaying {args.limit or scan['requests']} requests {pace} against {urls['ingestao']} "
+              f"(timestamps: {args.timestamps})")
+        replayer = Replayer(urls["ingestao"], capture, tokens, args.speed, args.timestamps, identities, ids,
+                            args.connections_per_user, args.max_inflight, args.limit)
+        try:
+            report = asyncio.run(replayer.run())
+        finally:
+            tokens.close()
+    finally:
+        if stack:
+            stack.stop()
+
+    print_report(report)
+    # at --speed max the arrivals are only as fast as the scheduler: the completion
+    # wall time and the ok/s achieved over it are the replay's throughput
+    recorded = scan["seconds"] if args.limit is None else None
+    totals = report["totals"]
+    if recorded and totals["wallSeconds"]:
+        print(f"Recorded span {recorded:.1f}s, replayed in {totals['wallSeconds']:.1f}s "
+              f"({recorded / totals['wallSeconds']:.1f}x), {totals['okRate']} ok/s")
+    elif totals["wallSeconds"]:
+        print(f"Replayed in {totals['wallSeconds']:.1f}s, {totals['okRate']} ok/s")
+    if args.output:
+        report["config"] = {k: v for k, v in vars(args).items() if k != "output"}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "info":
+        try:
+            print_info(args.capture)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not read {args.capture}: {e}")
+            sys.exit(1)
+    elif args.command == "from-db":
+        try:
+            n = capture_from_db(args.capture, args.de, args.ate, args.talhao, args.after_id)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        if not n:
+            print("❌ No readings in that range.")
+            sys.exit(1)
+        print(f"✅ {n} requests captured to {args.capture}")
+        print_info(args.capture)
+    else:
+        replay_main(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import datetime
+import json
+import random
+import sys
+import time
+import uuid
+from collections import namedtuple
+
+import db_access
+from db_access import SCHEMA, db_timestamp
+from wait_utils import wait_until
+
+# Keyed persistence checks for the validators.
+# qa_validation*.py verify writes with SELECT COUNT(*) FROM SensorLeitura / Alerta /
+# Propriedades before and after: every check scans the whole table, and any
+# other writer moves the count. A Check here names the exact entity instead,
+# through a key the schema indexes: Propriedades by its primary key,
+# SensorLeitura by IdTalhao + DataHoraCapturaUtc (IX_SensorLeitura_Talhao_DataHora,
+# CorrelationId only as a residual filter, since it has no index), and Alerta by
+# IdTalhao (IX_Alerta_IdTalhao) with an optional LeituraId. Many checks become
+# one "SELECT i, COUNT(*) ... UNION ALL ..." statement per database, and all of
+# them go out in a single query_many round trip.
+
+DB_PROPRIEDADES = "Propriedades"
+DB_INGESTAO = "Ingestao"
+DB_ANALISE = "Analise"
+# sqlite caps a compound SELECT at 500 terms
+BATCH_SIZE = 200
+
+Check = namedtuple("Check", ["database", "table", "where", "minimum"])
+
+
+def quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def propriedade(id_propriedade):
+    return Check(DB_PROPRIEDADES, "Propriedades", f"Id = {quote(id_propriedade)}", 1)
+
+
+def sensor_leitura(id_talhao, correlation_id=None, de=None, ate=None, minimum=1):
+    # readings of a talhao, optionally in [de, ate) and/or carrying meta.correlationId
+    where = [f"IdTalhao = {quote(id_talhao)}"]
+    if de is not None:
+        where.append(f"DataHoraCapturaUtc >= {quote(db_timestamp(de))}")
+    if ate is not None:
+        where.append(f"DataHoraCapturaUtc < {quote(db_timestamp(ate))}")
+    if correlation_id is not None:
+        where.append(f"CorrelationId = {quote(correlation_id)}")
+    return Check(DB_INGESTAO, "SensorLeitura", " AND ".join(where), minimum)
+
+
+def alerta(id_talhao, leitura_id=None, minimum=1):
+    # note: the Analise consumer currently stores LeituraId = 0 for every alert
+    where = f"IdTalhao = {quote(id_talhao)}"
+    if leitura_id is not None:
+        where += f" AND LeituraId = {int(leitura_id)}"
+    return Check(DB_ANALISE, "Alerta", where, minimum)
+
+
+def count_sql(check, key=0):
+    return f"SELECT {int(key)}, COUNT(*) FROM {check.table} WHERE {check.where}"
+
+
+class Verifier:
+    """Runs many Checks in one round trip through a db_access-style query_many."""
+
+    def __init__(self, run_sql_batch=None, batch_size=BATCH_SIZE):
+        self.run_sql_batch = run_sql_batch or db_access.run_sql_batch
+        self.batch_size = batch_size
+
+    def statements(self, checks):
+        # one UNION ALL statement per database and batch_size checks; the key is the check's index
+        by_database = {}
+        for i, check in enumerate(checks):
+            by_database.setdefault(check.database, []).append(count_sql(check, i))
+        return [(" UNION ALL ".join(parts[lo:lo + self.batch_size]), database)
+                for database, parts in by_database.items()
+                for lo in range(0, len(parts), self.batch_size)]
+
+    def counts(self, checks):
+        # -> one count per check (None where its statement failed)
+        counts = [None] * len(checks)
+        if not checks:
+            return counts
+        for result in self.run_sql_batch(self.statements(checks)):
+            for line in (result or "").splitlines():
+                parts = line.split()
+                if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+                    counts[int(parts[0])] = int(parts[1])
+        return counts
+
+    def verify(self, checks):
+        return [c is not None and c >= check.minimum for check, c in zip(checks, self.counts(checks))]
+
+    def wait(self, checks, **kwargs):
+        """Polls until every check passes; only the ones still failing are re-queried.
+
+        Takes wait_utils.wait_until keyword arguments. The result's value is
+        the list of last counts, one per check.
+        """
+        counts = [None] * len(checks)
+        pending = list(range(len(checks)))
+
+        def check():
+            for i, c in zip(pending, self.counts([checks[i] for i in pending])):
+                counts[i] = c
+            pending[:] = [i for i in pending if counts[i] is None or counts[i] < checks[i].minimum]
+            return not pending
+
+        result = wait_until(check, **kwargs)
+        return result._replace(value=counts)
+
+
+# -- benchmark -------------------------------------------------------------------
+
+def seed(pool, propriedades, talhoes, leituras, alertas, seed=1):
+    # A large dataset with the fake_stack schema; returns the keys to check
+    rnd = random.Random(seed)
+    for database in (DB_PROPRIEDADES, DB_INGESTAO, DB_ANALISE):
+        pool.query_many([(s, database) for s in SCHEMA[database]])
+    prop_ids = [str(uuid.UUID(int=rnd.getrandbits(128), version=4)) for _ in range(propriedades)]
+    talhao_ids = [str(uuid.UUID(int=rnd.getrandbits(128), version=4)) for _ in range(talhoes)]
+    start = datetime.datetime(2026, 1, 1)
+    with pool.connection(DB_PROPRIEDADES) as conn:
+        conn.executemany("INSERT INTO Propriedades (Id, Nome, Localizacao, OwnerUserId) VALUES (?, ?, ?, ?)",
+                         ((p, f"Fazenda {i}", "SP", str(i % 1000)) for i, p in enumerate(prop_ids)))
+        conn.commit()
+    readings = []
+    with pool.connection(DB_INGESTAO) as conn:
+        rows = []
+        for i in range(leituras):
+            talhao = talhao_ids[i % talhoes]
+            ts = start + datetime.timedelta(seconds=i // talhoes * 60)
+            correlation = f"seed-{i}"
+            rows.append((prop_ids[i % propriedades], talhao, "simulador", db_timestamp(ts), 25.0, 30.0, 0.0,
+                         "SIM-001", correlation))
+            if i % max(1, leituras // 2000) == 0:
+                readings.append((talhao, ts, correlation))
+        conn.executemany(
+            "INSERT INTO SensorLeitura (IdPropriedade, IdTalhao, Origem, DataHoraCapturaUtc, UmidadeSoloPercentual, "
+            "TemperaturaCelsius, PrecipitacaoMilimetros, IdDispositivo, CorrelationId) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows)
+        conn.commit()
+    with pool.connection(DB_ANALISE) as conn:
+        conn.executemany(
+            "INSERT INTO Alerta (IdTalhao, Mensagem, Nivel, DataHoraGeracaoUtc, LeituraId) VALUES (?, ?, ?, ?, ?)",
+            ((talhao_ids[i % talhoes], "Seca Extrema: Umidade do solo abaixo de 20%", "Critical",
+              db_timestamp(start), i // talhoes) for i in range(alertas)))
+        conn.commit()
+    return prop_ids, talhao_ids, readings
+
+
+def with_round_trip(run_sql_batch, seconds):
+    # Adds a fixed network round trip per query_many call (the local sqlite has none)
+    def batch(statements):
+        time.sleep(seconds)
+        return run_sql_batch(statements)
+    return batch
+
+
+def sample_checks(prop_ids, talhao_ids, readings, n, rnd):
+    checks = []
+    for i in range(n):
+        kind = i % 3
+        if kind == 0:
+            checks.append(propriedade(rnd.choice(prop_ids)))
+        elif kind == 1:
+            talhao, ts, correlation = rnd.choice(readings)
+            checks.append(sensor_leitura(talhao, correlation, ts, ts + datetime.timedelta(seconds=1)))
+        else:
+            checks.append(alerta(rnd.choice(talhao_ids), leitura_id=rnd.randrange(3)))
+    return checks
+
+
+def benchmark(run_sql_batch, checks):
+    verifier = Verifier(run_sql_batch)
+    results = {}
+
+    # what the validators do today: one global COUNT(*) per check
+    started = time.perf_counter()
+    for check in checks:
+        run_sql_batch([(f"SELECT COUNT(*) FROM {check.table}", check.database)])
+    results["global COUNT(*) per check"] = (time.perf_counter() - started, len(checks))
+
+    started = time.perf_counter()
+    single = [verifier.counts([check])[0] for check in checks]
+    results["keyed, one query per check"] = (time.perf_counter() - started, len(checks))
+
+    started = time.perf_counter()
+    batched = verifier.counts(checks)
+    results["keyed, batched"] = (time.perf_counter() - started, 1)
+
+    mismatches = sum(a != b for a, b in zip(single, batched))
+    return results, batched, mismatches
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks keyed, batched persistence checks against global COUNT(*).")
+    parser.add_argument("--propriedades", type=int, default=100000)
+    parser.add_argument("--talhoes", type=int, default=5000)
+    parser.add_argument("--leituras", type=int, default=1000000)
+    parser.add_argument("--alertas", type=int, default=200000)
+    parser.add_argument("--checks", type=int, default=300, help="Entities verified per run")
+    parser.add_argument("--round-trip-ms", type=float, default=1.0, help="Simulated network round trip per query")
+    parser.add_argument("--sql-dir", help="Keep the seeded sqlite files here (default: in memory)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON results file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    pool = db_access.sqlite_pool(args.sql_dir)
+    started = time.perf_counter()
+    prop_ids, talhao_ids, readings = seed(pool, args.propriedades, args.talhoes, args.leituras, args.alertas, args.seed)
+    print(f"Seeded {args.propriedades} Propriedades, {args.leituras} SensorLeitura, {args.alertas} Alerta "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    rnd = random.Random(args.seed)
+    checks = sample_checks(prop_ids, talhao_ids, readings, args.checks, rnd)
+    # entities that were never written must come back as 0
+    absent = [propriedade(uuid.uuid4()), sensor_leitura(uuid.uuid4()), alerta(uuid.uuid4())]
+    run_sql_batch = with_round_trip(pool.query_many, args.round_trip_ms / 1000.0)
+    results, counts, mismatches = benchmark(run_sql_batch, checks + absent)
+
+    found = sum(c is not None and c >= check.minimum for check, c in zip(checks, counts))
+    false_hits = sum(c != 0 for c in counts[len(checks):])
+    baseline = results["global COUNT(*) per check"][0]
+    print(f"\n{len(checks) + len(absent)} checks, {args.round_trip_ms} ms round trip:")
+    print(f"{'strategy':<30}{'round trips':>12}{'total ms':>12}{'ms/check':>10}{'speedup':>9}")
+    for name, (seconds, trips) in results.items():
+        print(f"{name:<30}{trips:>12}{seconds * 1000:>12.1f}{seconds * 1000 / (len(checks) + len(absent)):>10.3f}"
+              f"{baseline / seconds:>8.1f}x")
+    ok = found == len(checks) and not false_hits and not mismatches
+    print(f"\n{'✅' if ok else '❌'} {found}/{len(checks)} seeded entities found, {false_hits} false hits on absent keys, "
+          f"{mismatches} batched/single mismatches.")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "found": found, "falseHits": false_hits, "mismatches": mismatches,
+                       "results": {k: {"seconds": round(s, 4), "roundTrips": t} for k, (s, t) in results.items()}},
+                      f, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
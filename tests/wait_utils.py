@@ -0,0 +1,98 @@
+import random
+import time
+from collections import namedtuple
+
+from instrumentation import REGISTRY
+
+# Polling primitive used instead of fixed sleeps while the pipeline converges
+# (Ingestao -> RabbitMQ -> Analise -> Alerta). Polls with exponential backoff and
+# jitter until the predicate returns a truthy value or the deadline passes.
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_INITIAL_INTERVAL = 0.1
+DEFAULT_MAX_INTERVAL = 2.0
+DEFAULT_FACTOR = 2.0
+DEFAULT_JITTER = 0.2
+
+CONVERGENCE_METRIC = "wait_convergence_seconds"
+
+WaitResult = namedtuple("WaitResult", ["ok", "value", "elapsed", "attempts"])
+
+
+def record_sample(name, elapsed, outcome="ok"):
+    # Exported with the rest of instrumentation.REGISTRY (summary table, JSON, .prom)
+    REGISTRY.histogram(CONVERGENCE_METRIC, wait=name, outcome=outcome).record(elapsed)
+
+
+def wait_until(predicate, timeout=DEFAULT_TIMEOUT, initial_interval=DEFAULT_INITIAL_INTERVAL,
+               max_interval=DEFAULT_MAX_INTERVAL, factor=DEFAULT_FACTOR, jitter=DEFAULT_JITTER,
+               name=None, clock=time.monotonic, sleep=time.sleep):
+    """Calls `predicate()` until it returns something truthy.
+
+    Sleeps start at `initial_interval`, grow by `factor` up to `max_interval`
+    and are spread by +/- `jitter` (fraction) so parallel waiters do not poll in
+    lockstep. The last sleep is clipped to the deadline. When `name` is given the
+    wait's duration is recorded in instrumentation.REGISTRY as
+    wait_convergence_seconds{wait=name, outcome=ok|timeout}.
+    Exceptions raised by the predicate count as "not yet".
+    """
+    started = clock()
+    deadline = started + timeout
+    interval = initial_interval
+    attempts = 0
+    value = None
+    while True:
+        attempts += 1
+        try:
+            value = predicate()
+        except Exception as e:
+            print(f"  (poll #{attempts} failed: {e})")
+            value = None
+        now = clock()
+        if value:
+            elapsed = now - started
+            if name:
+                record_sample(name, elapsed)
+            return WaitResult(True, value, elapsed, attempts)
+        if now >= deadline:
+            if name:
+                record_sample(name, now - started, "timeout")
+            return WaitResult(False, value, now - started, attempts)
+
+        delay = interval * (1 + random.uniform(-jitter, jitter))
+        sleep(max(0.0, min(delay, deadline - now)))
+        interval = min(interval * factor, max_interval)
+
+
+def _to_int(text):
+    try:
+        return int(str(text).strip().splitlines()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def wait_for_sql_count(run_sql_query, query, database, minimum, **kwargs):
+    """Waits until the scalar COUNT returned by `query` is >= `minimum`.
+
+    `run_sql_query(query, database)` is any db_access-style executor call.
+    The result's value is the last count observed.
+    """
+    last = {"count": None}
+
+    def check():
+        count = _to_int(run_sql_query(query, database))
+        last["count"] = count
+        # True rather than the count, which is falsy for a satisfied minimum of 0
+        return count is not None and count >= minimum
+
+    result = wait_until(check, **kwargs)
+    return result._replace(value=last["count"])
+
+
+def wait_for_http(request, accept=(200,), **kwargs):
+    """Waits until `request()` returns a response whose status is in `accept`."""
+    def check():
+        # True rather than the response, which is falsy for an accepted status >= 400
+        return request().status_code in accept
+
+    return wait_until(check, **kwargs)